@@ -0,0 +1,92 @@
+"""
+Script de mesure de la détection de visage.
+
+Ce script compare, sur des images locales, la détection sur l'image complète
+(jusqu'à 1500 pixels de côté) et la détection en deux passes: recherche du
+visage sur une copie réduite, puis encodage sur un recadrage de l'image complète.
+Pour chaque taille de copie réduite, il affiche le temps médian de détection et
+d'encodage, et la distance entre l'encodage obtenu et celui de l'image complète.
+
+Usage:
+    python benchmark_face_detection.py photo1.jpg photo2.jpg [--sizes 0,400,500,600] [--repeat 5]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import statistics
+
+# Seuls les avertissements du service sont affichés pendant les mesures
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ajouter le répertoire du service au chemin de recherche pour importer les modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.face_recognition_service import FaceRecognitionService
+from services.image_preprocessing import ImagePreprocessor
+
+def measure(face_service, image_array, detection_size, repeat):
+    """
+    Mesure l'encodage d'une image pour une taille de copie réduite.
+
+    Args:
+        face_service: Service de reconnaissance faciale
+        image_array: Image décodée
+        detection_size: Taille de la copie réduite, 0 pour l'image complète
+        repeat: Nombre de mesures
+
+    Returns:
+        tuple: (temps médian en ms, encodage, détection réduite réussie)
+    """
+    face_service.detection_size = detection_size
+    coarse = bool(face_service._detect_faces_coarse(image_array))
+
+    durations = []
+    encoding = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encoding = face_service._encode_face(image_array, "benchmark")
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations), encoding, coarse
+
+def main():
+    """Point d'entrée principal pour le script de mesure."""
+    parser = argparse.ArgumentParser(description='Mesure de la détection de visage en deux passes')
+    parser.add_argument('images', nargs='+', help='Chemins des images à analyser')
+    parser.add_argument('--sizes', default='0,400,500,600',
+                        help='Tailles de la copie réduite à comparer, 0 pour l\'image complète')
+    parser.add_argument('--repeat', type=int, default=5, help='Nombre de mesures par image et par taille')
+    parser.add_argument('--padding', type=float, help='Marge autour du visage dans le recadrage encodé')
+    args = parser.parse_args()
+
+    face_service = FaceRecognitionService()
+    if not face_service.face_recognition_available:
+        logger.error("La bibliothèque face_recognition n'est pas disponible")
+        return 1
+    if args.padding is not None:
+        face_service.crop_padding = args.padding
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f"{'image':30s} {'taille':>7s} {'médiane':>10s} {'accélération':>13s} {'distance':>9s}  détection réduite")
+    for path in args.images:
+        with open(path, 'rb') as f:
+            image_array = ImagePreprocessor.load_image(f.read(), max_size=face_service.MAX_IMAGE_SIZE, mode='RGB')
+
+        reference_ms, reference, _ = measure(face_service, image_array, 0, args.repeat)
+        for size in sizes:
+            duration_ms, encoding, coarse = (reference_ms, reference, False) if size == 0 else \
+                measure(face_service, image_array, size, args.repeat)
+            if encoding is None or reference is None:
+                distance = "-"
+            else:
+                distance = f"{face_service.face_recognition.face_distance([reference], encoding)[0]:.4f}"
+            print(f"{os.path.basename(path)[:30]:30s} {size or 'complète':>7} {duration_ms:8.0f} ms "
+                  f"{reference_ms / duration_ms:12.1f}x {distance:>9s}  {'oui' if coarse else 'non'}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
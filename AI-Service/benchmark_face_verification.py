@@ -0,0 +1,158 @@
+"""
+Script de mesure de la latence de vérification.
+
+Ce script compare verify_face, qui traite l'image de profil et l'image de
+vérification en parallèle et répond dès qu'une image n'a pas de visage, au
+traitement séquentiel précédent (image de profil, puis image de vérification,
+puis contrôle des deux résultats). Les images désignées par une URL sont servies
+par un serveur HTTP local qui attend --fetch-ms avant de répondre, et la
+détection est simulée par une pause de --detect-ms par passe: une passe pour
+une image avec visage, --no-face-passes (image complète, image améliorée, CNN)
+sans visage. face_recognition n'est pas nécessaire.
+
+Usage:
+    python benchmark_face_verification.py [--fetch-ms 150] [--detect-ms 50] [--no-face-passes 3] [--repeat 10]
+"""
+
+import os
+import sys
+import time
+import base64
+import logging
+import argparse
+import statistics
+import threading
+from io import BytesIO
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import numpy as np
+from PIL import Image
+
+# Seuls les avertissements sont affichés pendant les mesures
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+# Les échecs de détection du service sont attendus dans les scénarios sans visage
+logging.getLogger('services').setLevel(logging.CRITICAL)
+
+# Ajouter le répertoire du service au chemin de recherche pour importer les modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.face_recognition_service import FaceRecognitionService
+from services.image_fetcher import ImageFetcher
+
+# Couleur du premier pixel des images avec visage; les autres n'en ont pas
+FACE_COLOR = (10, 0, 0)
+NO_FACE_COLOR = (0, 0, 0)
+
+
+def png(color):
+    """Octets d'une petite image PNG unie."""
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def data_url(color):
+    return "data:image/png;base64," + base64.b64encode(png(color)).decode()
+
+
+def start_server(fetch_ms):
+    """Démarre un serveur d'images qui attend fetch_ms avant chaque réponse; renvoie son URL de base."""
+
+    class DelayedImageHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            content = png(NO_FACE_COLOR if 'no-face' in self.path else FACE_COLOR)
+            time.sleep(fetch_ms / 1000)
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    class ThreadingServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = ThreadingServer(('127.0.0.1', 0), DelayedImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def make_service(detect_ms, no_face_passes):
+    """Service dont la détection et la comparaison des visages sont simulées."""
+    service = FaceRecognitionService()
+    service.face_recognition_available = True
+    service.face_recognition = SimpleNamespace(
+        face_distance=lambda known, encoding: np.linalg.norm(np.asarray(known) - encoding, axis=1)
+    )
+    service.encoding_cache = None
+    service.image_fetcher = ImageFetcher(cache_dir=None)
+
+    def encode_face(image_array, source_type, cancel_event=None):
+        has_face = tuple(image_array[0, 0, :3]) == FACE_COLOR
+        for _ in range(1 if has_face else no_face_passes):
+            # Comme _encode_face, qui vérifie l'annulation entre les passes
+            if service._cancelled(cancel_event):
+                return None
+            time.sleep(detect_ms / 1000)
+        return np.zeros(128) if has_face else None
+
+    service._encode_face = encode_face
+    return service
+
+
+def verify_sequential(service, profile_image, verification_image):
+    """Traitement séquentiel précédent: les deux images, puis le contrôle des résultats."""
+    profile_encoding = service._get_face_encoding(profile_image, True)
+    verification_encoding = service._get_face_encoding(verification_image)
+    if profile_encoding is None or verification_encoding is None:
+        return {"success": False}
+    return {"success": True}
+
+
+def median_ms(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+def main():
+    """Point d'entrée principal pour le script de mesure."""
+    parser = argparse.ArgumentParser(description='Mesure de la latence de vérification faciale')
+    parser.add_argument('--fetch-ms', type=float, default=150, help='Délai de réponse du serveur d\'images, en ms')
+    parser.add_argument('--detect-ms', type=float, default=50, help='Durée d\'une passe de détection, en ms')
+    parser.add_argument('--no-face-passes', type=int, default=3, help='Passes de détection sur une image sans visage')
+    parser.add_argument('--repeat', type=int, default=10, help='Nombre de vérifications par scénario')
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.fetch_ms)
+    service = make_service(args.detect_ms, args.no_face_passes)
+    scenarios = [
+        ("profil URL + selfie base64", f"{base_url}/profile.png", data_url(FACE_COLOR)),
+        ("profil URL + selfie URL", f"{base_url}/profile.png", f"{base_url}/selfie.png"),
+        ("aucun visage dans le selfie", f"{base_url}/profile.png", data_url(NO_FACE_COLOR)),
+        ("aucun visage dans le profil", f"{base_url}/no-face.png", data_url(FACE_COLOR))
+    ]
+
+    try:
+        print(f"{'scénario':30s} {'séquentiel':>11s} {'parallèle':>10s}")
+        for name, profile_image, verification_image in scenarios:
+            sequential_ms = median_ms(lambda: verify_sequential(service, profile_image, verification_image), args.repeat)
+            concurrent_ms = median_ms(lambda: service.verify_face(profile_image, verification_image), args.repeat)
+            print(f"{name:30s} {sequential_ms:8.0f} ms {concurrent_ms:7.0f} ms")
+    finally:
+        service.executor.shutdown(wait=True)
+        server.shutdown()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,7 +30,8 @@ def init_face_routes(face_recognition_service):
 def verify_face():
     """
     Endpoint pour vérifier la correspondance entre deux visages.
-    Attend deux images: profile_image et verification_image.
+    Attend deux images: profile_image et verification_image, et optionnellement user_id
+    pour réutiliser l'encodage en cache de l'image de profil.
     """
     if not face_service:
         return jsonify({
@@ -65,7 +66,7 @@ def verify_face():
             }), 400
 
         # Effectuer la vérification faciale
-        result = face_service.verify_face(profile_image, verification_image)
+        result = face_service.verify_face(profile_image, verification_image, user_id=data.get('user_id'))
         
         return jsonify(result)
         
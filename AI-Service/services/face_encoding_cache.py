@@ -0,0 +1,340 @@
+"""
+Cache des encodages faciaux.
+Ce module conserve les encodages (128 valeurs) des images de profil afin que
+chaque vérification ne recalcule que l'encodage du selfie. Les encodages sont
+indexés par l'empreinte SHA-256 des octets de l'image, gardés dans un LRU en
+mémoire et dans un répertoire borné de fichiers float32, dont les moins
+récemment utilisés sont supprimés.
+Un index en mémoire associe l'image de profil d'un utilisateur à son empreinte:
+il n'évite le téléchargement que pendant user_ttl secondes après la dernière
+validation de l'image, de sorte qu'une photo remplacée à la même URL est
+ensuite revalidée et réencodée si son contenu a changé.
+Le fichier de métadonnées enregistre la version du détecteur et du modèle :
+un cache produit par une autre version est ignoré.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Répertoire par défaut du cache sur disque
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'face_encodings')
+
+# Version du pipeline de prétraitement; à incrémenter quand il change les encodages produits
+# 2: les grands JPEG sont décodés à échelle réduite (draft) avant le redimensionnement
+PIPELINE_VERSION = 2
+
+
+def content_hash(image_bytes):
+    """Empreinte SHA-256 des octets d'une image."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def model_version(face_recognition_module=None):
+    """
+    Décrit le détecteur et le modèle qui produisent les encodages.
+
+    Args:
+        face_recognition_module: Module face_recognition chargé, s'il est disponible
+
+    Returns:
+        dict: Versions de face_recognition, de dlib, du détecteur et du pipeline
+    """
+    version = {
+        'face_recognition': getattr(face_recognition_module, '__version__', None),
+        'dlib': None,
+        'detector': 'hog',
+        'pipeline': PIPELINE_VERSION
+    }
+    try:
+        import dlib
+        version['dlib'] = getattr(dlib, 'DLIB_VERSION', getattr(dlib, '__version__', None))
+    except ImportError:
+        pass
+    return version
+
+
+class FaceEncodingCache:
+    """
+    Cache LRU des encodages faciaux, persistant sur disque entre les redémarrages.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_entries=1024, version=None, user_ttl=60.0,
+                 max_disk_entries=10000):
+        """
+        Args:
+            directory: Répertoire du cache sur disque, ou None pour un cache en mémoire seulement
+            max_entries: Nombre d'encodages gardés en mémoire
+            version: Version du détecteur et du modèle (voir model_version)
+            user_ttl: Durée en secondes pendant laquelle l'image de profil d'un utilisateur
+                est servie sans être revalidée auprès de sa source
+            max_disk_entries: Nombre d'encodages gardés sur disque; les moins récemment utilisés sont supprimés
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.version = version or model_version()
+        self.user_ttl = user_ttl
+        self._entries = OrderedDict()
+        # Encodages sur disque, des moins aux plus récemment utilisés: empreinte -> None
+        self._disk = OrderedDict()
+        # Image de profil de chaque utilisateur: {'hash', 'source', 'validated_at' (time.monotonic)}
+        # Non persisté: après un redémarrage, chaque image est revalidée une fois
+        self._users = {}
+        # Utilisateurs associés à chaque empreinte, pour les oublier quand l'encodage quitte le cache
+        self._hash_users = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.directory:
+            self._open_directory()
+
+    @classmethod
+    def from_env(cls, version=None):
+        """Crée un cache configuré par FACE_ENCODING_CACHE_DIR, FACE_ENCODING_CACHE_SIZE,
+        FACE_ENCODING_CACHE_DISK_SIZE et FACE_USER_CACHE_TTL."""
+        directory = os.environ.get('FACE_ENCODING_CACHE_DIR', DEFAULT_CACHE_DIR)
+        return cls(
+            directory=directory if directory.lower() != 'none' else None,
+            max_entries=int(os.environ.get('FACE_ENCODING_CACHE_SIZE', 1024)),
+            version=version,
+            user_ttl=float(os.environ.get('FACE_USER_CACHE_TTL', 60)),
+            max_disk_entries=int(os.environ.get('FACE_ENCODING_CACHE_DISK_SIZE', 10000))
+        )
+
+    def _open_directory(self):
+        """Charge les métadonnées, vide le cache s'il vient d'une autre version du modèle,
+        et indexe les encodages restants, des plus anciens aux plus récents."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            meta_path = os.path.join(self.directory, 'meta.json')
+            meta = {}
+            if os.path.exists(meta_path):
+                with open(meta_path, 'r') as f:
+                    meta = json.load(f)
+
+            if meta.get('version') != self.version:
+                if meta:
+                    logger.info(f"Cache d'encodages produit par une autre version ({meta.get('version')}), vidage")
+                for name in os.listdir(self.directory):
+                    if name.endswith('.npy'):
+                        os.remove(os.path.join(self.directory, name))
+                self._write_json(meta_path, {'version': self.version})
+
+            # Index des utilisateurs écrit par les versions précédentes, remplacé par l'index en mémoire
+            users_path = os.path.join(self.directory, 'users.json')
+            if os.path.exists(users_path):
+                os.remove(users_path)
+
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith('.npy') and '.tmp' not in name:
+                    path = os.path.join(self.directory, name)
+                    entries.append((os.path.getmtime(path), name[:-len('.npy')]))
+            with self._lock:
+                for _, key in sorted(entries):
+                    self._disk[key] = None
+                self._evict_disk()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cache d'encodages sur disque indisponible: {str(e)}")
+            self.directory = None
+
+    @staticmethod
+    def _write_json(path, data):
+        """Écrit un fichier JSON de façon atomique."""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key):
+        """
+        Retourne l'encodage d'une image, depuis la mémoire ou le disque.
+
+        Args:
+            key: Empreinte du contenu de l'image (voir content_hash)
+
+        Returns:
+            numpy.ndarray: Encodage en float32, ou None s'il n'est pas en cache
+        """
+        with self._lock:
+            encoding = self._entries.get(key)
+            if encoding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if encoding is not None:
+            self._touch(key)
+            return encoding
+
+        if self.directory:
+            try:
+                encoding = np.load(self._path(key))
+            except (OSError, ValueError):
+                encoding = None
+            if encoding is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, encoding)
+                    # Écrit par un autre processus ou avant le redémarrage: il est désormais indexé ici
+                    self._disk[key] = None
+                    self._evict_disk()
+                self._touch(key)
+                return encoding
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, encoding, user_id=None, source=None, persist=True):
+        """
+        Enregistre l'encodage d'une image.
+
+        Args:
+            key: Empreinte du contenu de l'image
+            encoding: Encodage facial calculé
+            user_id: Utilisateur propriétaire de l'image de profil, optionnel
+            source: Identifiant de la source de l'image (URL, chemin), associé à user_id
+            persist: Écrit l'encodage sur disque; les images sans source stable (base64)
+                ne sont gardées qu'en mémoire
+
+        Returns:
+            numpy.ndarray: Encodage en float32 tel qu'il est conservé
+        """
+        encoding = np.asarray(encoding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, encoding)
+
+        if self.directory and persist:
+            try:
+                tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+                np.save(tmp_path, encoding)
+                os.replace(tmp_path, self._path(key))
+                with self._lock:
+                    self._disk[key] = None
+                    self._disk.move_to_end(key)
+                    self._evict_disk()
+            except OSError as e:
+                logger.warning(f"Impossible d'écrire l'encodage en cache: {str(e)}")
+
+        if user_id is not None:
+            self.remember_user(user_id, key, source)
+        return encoding
+
+    def remember_user(self, user_id, key, source=None):
+        """
+        Associe l'image de profil d'un utilisateur (et sa source) à une empreinte,
+        qui vient d'être lue ou revalidée auprès de la source.
+        """
+        if source is None:
+            # Sans source stable (base64), l'entrée ne serait jamais utilisée par get_for_user
+            return
+        user_id = str(user_id)
+        with self._lock:
+            if key not in self._entries and key not in self._disk:
+                # Encodage supprimé entre-temps: l'image sera relue au prochain appel
+                return
+            previous = self._users.get(user_id)
+            if previous is not None and previous['hash'] != key:
+                self._hash_users.get(previous['hash'], set()).discard(user_id)
+            self._users[user_id] = {'hash': key, 'source': source, 'validated_at': time.monotonic()}
+            self._hash_users.setdefault(key, set()).add(user_id)
+
+    def get_for_user(self, user_id, source=None):
+        """
+        Retourne l'encodage de l'image de profil d'un utilisateur sans la télécharger.
+
+        L'entrée n'est utilisée que pendant user_ttl secondes après la dernière
+        validation de l'image (voir remember_user): passé ce délai, l'appelant
+        relit la source, avec une requête conditionnelle pour les URL.
+
+        Args:
+            user_id: Identifiant de l'utilisateur
+            source: Source actuelle de l'image (URL, chemin); l'entrée n'est utilisée que si elle n'a pas changé
+
+        Returns:
+            numpy.ndarray: Encodage, ou None si l'utilisateur ou sa source ne sont pas en cache,
+            ou si l'image doit être revalidée
+        """
+        if source is None:
+            # Sans source stable (base64), seule l'empreinte du contenu identifie l'image
+            return None
+        with self._lock:
+            entry = self._users.get(str(user_id))
+        if not entry or entry['source'] != source:
+            return None
+        if time.monotonic() - entry['validated_at'] >= self.user_ttl:
+            return None
+        return self.get(entry['hash'])
+
+    def _remember(self, key, encoding):
+        """Garde un encodage en mémoire. Appelé sous verrou."""
+        self._entries[key] = encoding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if not self.directory or evicted not in self._disk:
+                # L'encodage a quitté le cache
+                self._forget_users(evicted)
+
+    def _touch(self, key):
+        """Marque un encodage sur disque comme récemment utilisé."""
+        if not self.directory:
+            return
+        with self._lock:
+            if key not in self._disk:
+                return
+            self._disk.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        """Supprime les encodages les moins récemment utilisés jusqu'à respecter max_disk_entries. Appelé sous verrou."""
+        while len(self._disk) > self.max_disk_entries:
+            key, _ = self._disk.popitem(last=False)
+            self.evictions += 1
+            self._entries.pop(key, None)
+            self._forget_users(key)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _forget_users(self, key):
+        """Oublie les utilisateurs dont l'image de profil a cette empreinte. Appelé sous verrou."""
+        for user_id in self._hash_users.pop(key, ()):
+            entry = self._users.get(user_id)
+            if entry is not None and entry['hash'] == key:
+                del self._users[user_id]
+
+    def stats(self):
+        """Compteurs du cache."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'disk_entries': len(self._disk),
+                'users': len(self._users),
+                'max_entries': self.max_entries,
+                'max_disk_entries': self.max_disk_entries,
+                'user_ttl': self.user_ttl,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'directory': self.directory,
+                'version': self.version
+            }
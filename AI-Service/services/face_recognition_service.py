@@ -6,41 +6,98 @@ import os
 import logging
 import traceback
 import base64
-import io
-from PIL import Image
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import numpy as np
-import requests
 
 from services.image_preprocessing import ImagePreprocessor
+from services.face_encoding_cache import FaceEncodingCache, content_hash, model_version
+from services.image_fetcher import ImageFetcher, FetchCancelledError
+from services.image_errors import ImageTooLargeError
 
 logger = logging.getLogger(__name__)
 
+# Messages renvoyés quand aucun visage n'est détecté, par image
+NO_FACE_RESULTS = {
+    'profile': {
+        "log": "Échec de la détection de visage dans l'image de profil",
+        "error": "Aucun visage détecté dans l'image de profil",
+        "details": "Assurez-vous que l'image de profil contient clairement un visage et que l'éclairage est adéquat"
+    },
+    'verification': {
+        "log": "Échec de la détection de visage dans l'image de vérification",
+        "error": "Aucun visage détecté dans l'image de vérification",
+        "details": "Assurez-vous de bien cadrer votre visage et que l'éclairage est adéquat"
+    }
+}
+
+# Messages renvoyés quand une image dépasse la taille ou le nombre de pixels autorisés, par image
+IMAGE_TOO_LARGE_RESULTS = {
+    'profile': {
+        "log": "Image de profil refusée car trop grande",
+        "error": "Image de profil trop grande"
+    },
+    'verification': {
+        "log": "Image de vérification refusée car trop grande",
+        "error": "Image de vérification trop grande"
+    }
+}
+
 class FaceRecognitionService:
     """
     Service de reconnaissance faciale qui utilise la bibliothèque face_recognition
     pour comparer des visages et vérifier l'identité des utilisateurs.
     """
+    
+    # Taille maximale (hauteur ou largeur) en pixels des images analysées
+    MAX_IMAGE_SIZE = 1500
+    
+    # Taille (hauteur ou largeur) de la copie réduite sur laquelle les visages sont d'abord cherchés; 0 pour désactiver
+    # Désactivée par défaut: à activer après mesure avec benchmark_face_detection.py sur des photos réelles
+    DETECTION_SIZE = 0
+    
+    # Marge autour du visage détecté, en proportion de sa taille, dans le recadrage encodé
+    CROP_PADDING = 0.5
 
     def __init__(self):
         """Initialise le service de reconnaissance faciale."""
         self.face_recognition_available = False
+        self.detection_size = int(os.environ.get('FACE_DETECTION_SIZE', self.DETECTION_SIZE))
+        self.crop_padding = float(os.environ.get('FACE_CROP_PADDING', self.CROP_PADDING))
+        self.encoding_cache = None
+        # Session HTTP partagée et cache disque des images désignées par une URL
+        self.image_fetcher = ImageFetcher.from_env()
+        # Pool borné partagé par les requêtes: les deux images d'une vérification sont traitées en parallèle
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('FACE_VERIFY_WORKERS', 4)),
+            thread_name_prefix='face-verify'
+        )
         
         try:
             import face_recognition
             self.face_recognition = face_recognition
             self.face_recognition_available = True
+            # Encodages des images de profil, réutilisés d'une vérification à l'autre
+            # La détection en deux passes change légèrement les encodages: ses réglages font partie de la version
+            version = model_version(face_recognition)
+            if self.detection_size:
+                version = dict(version, detection_size=self.detection_size, crop_padding=self.crop_padding)
+            self.encoding_cache = FaceEncodingCache.from_env(version=version)
             logger.info("Service de reconnaissance faciale initialisé avec succès")
         except ImportError as e:
             logger.error(f"Erreur d'importation de face_recognition: {str(e)}")
             logger.error(traceback.format_exc())
 
-    def verify_face(self, profile_image, verification_image):
+    def verify_face(self, profile_image, verification_image, user_id=None):
         """
         Compare une image de profil avec une image de vérification pour confirmer l'identité.
         
         Args:
             profile_image: Image de profil originale (fichier, URL, ou base64)
             verification_image: Image capturée pour vérification (fichier, URL, ou base64)
+            user_id: Utilisateur vérifié, optionnel; permet de retrouver l'encodage de son
+                image de profil sans la télécharger tant que son URL ne change pas
             
         Returns:
             dict: Résultats de la vérification avec score de similarité
@@ -76,33 +133,58 @@ class FaceRecognitionService:
             else:
                 logger.info(f"Image de vérification: Type non-string - {type(verification_image)}")
             
-            # Charger les images et détecter les visages
-            logger.info("Traitement de l'image de profil...")
-            profile_face_encoding = self._get_face_encoding(profile_image)
-            
-            logger.info("Traitement de l'image de vérification...")
-            verification_face_encoding = self._get_face_encoding(verification_image)
+            # Charger les images et détecter les visages en parallèle:
+            # téléchargement, détection et encodage libèrent le GIL
+            started = time.perf_counter()
+            cancel_event = threading.Event()
+            logger.info("Traitement de l'image de profil et de l'image de vérification...")
+            futures = {
+                self.executor.submit(self._get_face_encoding, profile_image, True, user_id, cancel_event): 'profile',
+                self.executor.submit(self._get_face_encoding, verification_image, False, None, cancel_event): 'verification'
+            }
             
-            # Vérifier si des visages ont été détectés
-            if profile_face_encoding is None:
-                logger.error("Échec de la détection de visage dans l'image de profil")
-                return {
-                    "success": False,
-                    "error": "Aucun visage détecté dans l'image de profil",
-                    "details": "Assurez-vous que l'image de profil contient clairement un visage et que l'éclairage est adéquat",
-                    "is_match": False,
-                    "score": 0.0
-                }
+            encodings = {}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        encodings[futures[future]] = future.result()
+                    except ImageTooLargeError as e:
+                        # Refusée avant décodage: ce n'est pas une absence de visage
+                        cancel_event.set()
+                        for other in pending:
+                            other.cancel()
+                        too_large = IMAGE_TOO_LARGE_RESULTS[futures[future]]
+                        logger.error(f"{too_large['log']}: {str(e)}")
+                        return {
+                            "success": False,
+                            "error": too_large["error"],
+                            "details": str(e),
+                            "is_match": False,
+                            "score": 0.0
+                        }
+                
+                # Vérifier si des visages ont été détectés, sans attendre l'autre image en cas d'échec
+                failed = [side for side in ('profile', 'verification') if side in encodings and encodings[side] is None]
+                if failed:
+                    cancel_event.set()
+                    for future in pending:
+                        future.cancel()
+                    no_face = NO_FACE_RESULTS[failed[0]]
+                    logger.error(no_face["log"])
+                    logger.info(f"Durée de vérification: {(time.perf_counter() - started) * 1000:.0f} ms")
+                    return {
+                        "success": False,
+                        "error": no_face["error"],
+                        "details": no_face["details"],
+                        "is_match": False,
+                        "score": 0.0
+                    }
             
-            if verification_face_encoding is None:
-                logger.error("Échec de la détection de visage dans l'image de vérification")
-                return {
-                    "success": False,
-                    "error": "Aucun visage détecté dans l'image de vérification",
-                    "details": "Assurez-vous de bien cadrer votre visage et que l'éclairage est adéquat",
-                    "is_match": False,
-                    "score": 0.0
-                }
+            profile_face_encoding = encodings['profile']
+            verification_face_encoding = encodings['verification']
+            logger.info(f"Durée de vérification: {(time.perf_counter() - started) * 1000:.0f} ms")
             
             # Calculer la distance entre les encodages
             face_distance = self.face_recognition.face_distance([profile_face_encoding], verification_face_encoding)[0]
@@ -135,153 +217,293 @@ class FaceRecognitionService:
                 "score": 0.0
             }
 
-    def _get_face_encoding(self, image_source):
+    def _read_image_source(self, image_source, cancel_event=None):
+        """
+        Lit les octets d'une source d'image.
+        
+        Args:
+            image_source: Peut être un chemin de fichier, une URL, une chaîne base64 ou un objet file-like
+            cancel_event: threading.Event levé quand l'image n'est plus attendue
+        
+        Returns:
+            tuple: (octets de l'image ou None, type de source)
+        """
+        if isinstance(image_source, str):
+            if image_source.startswith('http'):
+                # Image depuis URL
+                logger.info(f"Traitement d'une image depuis URL: {image_source[:50]}...")
+                return self.image_fetcher.fetch(image_source, cancel_event), "url"
+            elif image_source.startswith('data:image'):
+                # Image en base64
+                logger.info("Traitement d'une image en base64")
+                try:
+                    header, encoded = image_source.split(",", 1)
+                    return base64.b64decode(encoded), "base64"
+                except ValueError as e:
+                    logger.error(f"Erreur lors du décodage de l'image base64: {str(e)}")
+                    # Try to recover if the image doesn't have a proper header
+                    if "," not in image_source and image_source.strip():
+                        try:
+                            logger.info("Tentative de récupération d'une image base64 sans en-tête")
+                            return base64.b64decode(image_source.strip()), "base64 sans en-tête"
+                        except Exception as e2:
+                            logger.error(f"La tentative de récupération a échoué: {str(e2)}")
+                    return None, "base64"
+            elif os.path.isfile(image_source):
+                # Chemin de fichier local
+                logger.info(f"Traitement d'une image depuis un fichier local: {image_source}")
+                with open(image_source, 'rb') as f:
+                    return f.read(), "fichier local"
+            else:
+                logger.warning(f"Format de source non reconnu. Début de la chaîne: {image_source[:30]}...")
+        elif hasattr(image_source, 'read'):
+            # Objet file-like
+            logger.info("Traitement d'un objet file-like")
+            return image_source.read(), "objet file"
+        return None, "unknown"
+
+    def _decode_image(self, image_bytes, source_type):
+        """
+        Décode les octets d'une image en tableau numpy.
+        
+        Args:
+            image_bytes: Octets de l'image
+            source_type: Type de source renvoyé par _read_image_source
+        
+        Returns:
+            numpy.ndarray: Image décodée
+        """
+        if source_type == "fichier local":
+            # Comme face_recognition.load_image_file, qui convertit toujours en RGB
+            return ImagePreprocessor.load_image(image_bytes, max_size=self.MAX_IMAGE_SIZE, mode='RGB')
+        
+        # Convert to RGB if image is in RGBA mode (has transparency); images recovered without header are kept as is
+        return ImagePreprocessor.load_image(
+            image_bytes, max_size=self.MAX_IMAGE_SIZE, convert_rgba=source_type != "base64 sans en-tête"
+        )
+
+    def _get_face_encoding(self, image_source, use_cache=False, user_id=None, cancel_event=None):
         """
         Obtient l'encodage facial à partir d'une source d'image.
         
         Args:
             image_source: Peut être un chemin de fichier, une URL ou une chaîne base64
-            
+            use_cache: Réutilise et enregistre l'encodage dans le cache (images de profil)
+            user_id: Propriétaire de l'image, pour retrouver son encodage sans relire la source
+            cancel_event: threading.Event levé quand le résultat n'est plus attendu; le traitement
+                s'arrête alors à l'étape suivante et renvoie None
+        
         Returns:
             numpy.ndarray: Encodage du visage, ou None si aucun visage n'est détecté
+        
+        Raises:
+            ImageTooLargeError: Si l'image dépasse la taille de téléchargement ou le nombre de pixels autorisés
         """
         try:
-            # Détecter le type de source d'image
-            image_array = None
-            source_type = "unknown"
+            cache = self.encoding_cache if use_cache else None
+            # Les URL et chemins identifient l'image d'un utilisateur tant qu'ils ne changent pas;
+            # passé FACE_USER_CACHE_TTL, l'image est revalidée et son empreinte recalculée
+            source = image_source if isinstance(image_source, str) and not image_source.startswith('data:image') else None
+            if cache is not None and user_id is not None:
+                encoding = cache.get_for_user(user_id, source)
+                if encoding is not None:
+                    logger.info("Encodage de l'image de profil trouvé en cache pour l'utilisateur")
+                    return encoding
             
-            if isinstance(image_source, str):
-                if image_source.startswith('http'):
-                    # Image depuis URL
-                    source_type = "url"
-                    logger.info(f"Traitement d'une image depuis URL: {image_source[:50]}...")
-                    response = requests.get(image_source, timeout=10)
-                    response.raise_for_status()  # Raise exception for 4XX/5XX errors
-                    image = Image.open(io.BytesIO(response.content))
-                    # Convert to RGB if image is in RGBA mode (has transparency)
-                    if image.mode == 'RGBA':
-                        logger.info("Conversion d'une image RGBA en RGB")
-                        image = image.convert('RGB')
-                    image_array = np.array(image)
-                elif image_source.startswith('data:image'):
-                    # Image en base64
-                    source_type = "base64"
-                    logger.info("Traitement d'une image en base64")
-                    try:
-                        header, encoded = image_source.split(",", 1)
-                        image_data = base64.b64decode(encoded)
-                        image = Image.open(io.BytesIO(image_data))
-                        # Convert to RGB if image is in RGBA mode
-                        if image.mode == 'RGBA':
-                            logger.info("Conversion d'une image RGBA en RGB")
-                            image = image.convert('RGB')
-                        image_array = np.array(image)
-                    except ValueError as e:
-                        logger.error(f"Erreur lors du décodage de l'image base64: {str(e)}")
-                        # Try to recover if the image doesn't have a proper header
-                        if "," not in image_source and image_source.strip():
-                            try:
-                                logger.info("Tentative de récupération d'une image base64 sans en-tête")
-                                image_data = base64.b64decode(image_source.strip())
-                                image = Image.open(io.BytesIO(image_data))
-                                image_array = np.array(image)
-                            except Exception as e2:
-                                logger.error(f"La tentative de récupération a échoué: {str(e2)}")
-                elif os.path.isfile(image_source):
-                    # Chemin de fichier local
-                    source_type = "fichier local"
-                    logger.info(f"Traitement d'une image depuis un fichier local: {image_source}")
-                    image_array = self.face_recognition.load_image_file(image_source)
-                else:
-                    logger.warning(f"Format de source non reconnu. Début de la chaîne: {image_source[:30]}...")
-            elif hasattr(image_source, 'read'):
-                # Objet file-like
-                source_type = "objet file"
-                logger.info("Traitement d'un objet file-like")
-                image = Image.open(image_source)
-                # Convert to RGB if image is in RGBA mode
-                if image.mode == 'RGBA':
-                    logger.info("Conversion d'une image RGBA en RGB")
-                    image = image.convert('RGB')
-                image_array = np.array(image)
-                
-            if image_array is None:
+            image_bytes, source_type = self._read_image_source(image_source, cancel_event)
+            if image_bytes is None:
                 logger.error(f"Format d'image non pris en charge: {type(image_source)}, source_type: {source_type}")
                 return None
+            if self._cancelled(cancel_event):
+                return None
             
-            # Log image information and diagnostics
-            logger.info(f"Image chargée avec succès. Dimensions: {image_array.shape}")
-            
-            # Get detailed diagnostics
-            diagnostics = ImagePreprocessor.get_image_diagnostics(image_array)
-            logger.info(f"Diagnostics d'image: {diagnostics}")
+            # Même contenu, même encodage: seul le hash est recalculé
+            key = content_hash(image_bytes) if cache is not None else None
+            if cache is not None:
+                encoding = cache.get(key)
+                if encoding is not None:
+                    logger.info("Encodage de l'image trouvé en cache")
+                    if user_id is not None:
+                        cache.remember_user(user_id, key, source)
+                    return encoding
             
-            # Log warnings for potential issues
-            if diagnostics.get('brightness_issue'):
-                logger.warning(f"Problème potentiel: {diagnostics.get('brightness_issue')}")
+            image_array = self._decode_image(image_bytes, source_type)
+            encoding = self._encode_face(image_array, source_type, cancel_event)
+            if encoding is not None and cache is not None:
+                encoding = cache.put(key, encoding, user_id=user_id, source=source, persist=source is not None)
+            return encoding
+        
+        except ImageTooLargeError:
+            raise
+        except FetchCancelledError:
+            # Abandon normal quand l'autre image a déjà échoué, comme _cancelled
+            logger.info("Téléchargement abandonné: l'autre image a échoué")
+            return None
+        except Exception as e:
+            logger.error(f"Erreur lors de l'extraction de l'encodage facial: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
+
+    @staticmethod
+    def _cancelled(cancel_event):
+        """Indique si le traitement d'une image peut être abandonné."""
+        if cancel_event is not None and cancel_event.is_set():
+            logger.info("Traitement abandonné: aucun visage dans l'autre image")
+            return True
+        return False
+    
+    def _detect_faces_coarse(self, image_array):
+        """
+        Cherche les visages sur une copie réduite de l'image.
+        
+        Args:
+            image_array: Image décodée
             
-            # Redimensionner l'image si elle est trop grande
-            image_array = ImagePreprocessor.resize_image_if_needed(image_array, max_size=1500)
-                
-            # Try multiple face detection models for better results
-            # First try the default model (faster but less accurate)
-            logger.info("Recherche de visages avec le modèle standard...")
-            face_locations = self.face_recognition.face_locations(image_array)
+        Returns:
+            list: Positions (top, right, bottom, left) des visages dans l'image d'origine; vide si la
+                détection réduite est désactivée, inutile pour une petite image, ou ne trouve aucun visage
+        """
+        if not self.detection_size:
+            return []
+        height, width = image_array.shape[:2]
+        target = ImagePreprocessor.fit_size(width, height, self.detection_size)
+        if target is None:
+            return []
+        
+        small_image = ImagePreprocessor.resize_image_if_needed(image_array, max_size=self.detection_size)
+        scale_x = width / small_image.shape[1]
+        scale_y = height / small_image.shape[0]
+        return [
+            (
+                max(0, round(top * scale_y)),
+                min(width, round(right * scale_x)),
+                min(height, round(bottom * scale_y)),
+                max(0, round(left * scale_x))
+            )
+            for top, right, bottom, left in self.face_recognition.face_locations(small_image)
+        ]
+    
+    def _encode_face_crop(self, image_array, location):
+        """
+        Calcule l'encodage d'un visage sur un recadrage de l'image complète autour de sa position.
+        
+        Args:
+            image_array: Image décodée
+            location: Position (top, right, bottom, left) du visage dans l'image
             
-            # If no face is found, try with preprocessing
-            if not face_locations:
-                logger.info("Aucun visage trouvé, application du prétraitement d'image...")
-                enhanced_image = ImagePreprocessor.enhance_for_face_detection(image_array)
-                face_locations = self.face_recognition.face_locations(enhanced_image)
-                
-                # If still no face is found, try with CNN model if available
-                if not face_locations and hasattr(self.face_recognition, 'face_locations'):
-                    try:
-                        logger.info("Aucun visage trouvé avec le prétraitement, essai avec le modèle CNN...")
-                        face_locations = self.face_recognition.face_locations(enhanced_image, model="cnn")
-                    except Exception as e:
-                        logger.warning(f"Impossible d'utiliser le modèle CNN: {str(e)}")
-                
-                # If a face is found with preprocessing, use the enhanced image for encoding
-                if face_locations:
-                    logger.info("Visage détecté après prétraitement!")
-                    image_array = enhanced_image
+        Returns:
+            list: Encodages renvoyés par face_recognition.face_encodings
+        """
+        top, right, bottom, left = location
+        height, width = image_array.shape[:2]
+        # La marge laisse au modèle de points de repère le contexte autour du visage
+        pad_y = round((bottom - top) * self.crop_padding)
+        pad_x = round((right - left) * self.crop_padding)
+        crop_top, crop_bottom = max(0, top - pad_y), min(height, bottom + pad_y)
+        crop_left, crop_right = max(0, left - pad_x), min(width, right + pad_x)
+        
+        # dlib attend un tableau contigu
+        crop = np.ascontiguousarray(image_array[crop_top:crop_bottom, crop_left:crop_right])
+        crop_location = (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left)
+        return self.face_recognition.face_encodings(crop, [crop_location])
+    
+    def _encode_face(self, image_array, source_type, cancel_event=None):
+        """
+        Détecte le premier visage d'une image et calcule son encodage.
+        
+        Args:
+            image_array: Image décodée
+            source_type: Type de source, pour les journaux
+            cancel_event: threading.Event levé quand le résultat n'est plus attendu
+        
+        Returns:
+            numpy.ndarray: Encodage du visage, ou None si aucun visage n'est détecté
+        """
+        # Log image information and diagnostics
+        logger.info(f"Image chargée avec succès. Dimensions: {image_array.shape}")
+        
+        # Get detailed diagnostics
+        diagnostics = ImagePreprocessor.get_image_diagnostics(image_array)
+        logger.info(f"Diagnostics d'image: {diagnostics}")
+        
+        # Log warnings for potential issues
+        if diagnostics.get('brightness_issue'):
+            logger.warning(f"Problème potentiel: {diagnostics.get('brightness_issue')}")
+        
+        # Redimensionner l'image si elle est trop grande
+        image_array = ImagePreprocessor.resize_image_if_needed(image_array, max_size=self.MAX_IMAGE_SIZE)
+        
+        # Détection rapide sur une copie réduite; l'image complète n'est analysée que si elle échoue
+        coarse_locations = self._detect_faces_coarse(image_array)
+        if coarse_locations:
+            logger.info(f"{len(coarse_locations)} visage(s) détecté(s) sur l'image réduite")
+            if self._cancelled(cancel_event):
+                return None
+            face_encodings = self._encode_face_crop(image_array, coarse_locations[0])
+            if face_encodings:
+                logger.info("Encodage du visage extrait avec succès")
+                return face_encodings[0]
+            logger.info("Impossible d'encoder le visage détecté sur l'image réduite, analyse de l'image complète...")
             
-            if not face_locations:
-                logger.warning(f"Aucun visage détecté dans l'image, type: {source_type}")
-                
-                # Get detailed diagnostics to help troubleshoot
-                if 'diagnostics' in locals():
-                    logger.info(f"Informations de diagnostic pour l'image sans visage détecté: {diagnostics}")
-                    
-                    # Specific advice based on diagnostics
-                    if diagnostics.get('brightness_issue') == "Image might be too dark":
-                        logger.warning("L'image semble trop sombre, ce qui peut affecter la détection de visage")
-                    elif diagnostics.get('brightness_issue') == "Image might be too bright":
-                        logger.warning("L'image semble trop claire/surexposée, ce qui peut affecter la détection de visage")
-                    
-                    if diagnostics.get('dimensions'):
-                        dims = diagnostics.get('dimensions', '').split('x')
-                        if len(dims) == 2:
-                            width = int(dims[0].strip())
-                            if width < 200:
-                                logger.warning("La résolution de l'image est très basse, ce qui peut affecter la détection de visage")
-                
+        # Try multiple face detection models for better results
+        # First try the default model (faster but less accurate)
+        logger.info("Recherche de visages avec le modèle standard...")
+        face_locations = self.face_recognition.face_locations(image_array)
+        
+        # If no face is found, try with preprocessing
+        if not face_locations:
+            if self._cancelled(cancel_event):
                 return None
+            logger.info("Aucun visage trouvé, application du prétraitement d'image...")
+            enhanced_image = ImagePreprocessor.enhance_for_face_detection(image_array)
+            face_locations = self.face_recognition.face_locations(enhanced_image)
+            
+            # If still no face is found, try with CNN model if available
+            if not face_locations and hasattr(self.face_recognition, 'face_locations') and not self._cancelled(cancel_event):
+                try:
+                    logger.info("Aucun visage trouvé avec le prétraitement, essai avec le modèle CNN...")
+                    face_locations = self.face_recognition.face_locations(enhanced_image, model="cnn")
+                except Exception as e:
+                    logger.warning(f"Impossible d'utiliser le modèle CNN: {str(e)}")
+            
+            # If a face is found with preprocessing, use the enhanced image for encoding
+            if face_locations:
+                logger.info("Visage détecté après prétraitement!")
+                image_array = enhanced_image
+        
+        if not face_locations:
+            logger.warning(f"Aucun visage détecté dans l'image, type: {source_type}")
+            
+            # Get detailed diagnostics to help troubleshoot
+            if 'diagnostics' in locals():
+                logger.info(f"Informations de diagnostic pour l'image sans visage détecté: {diagnostics}")
                 
-            logger.info(f"{len(face_locations)} visage(s) détecté(s) dans l'image")
+                # Specific advice based on diagnostics
+                if diagnostics.get('brightness_issue') == "Image might be too dark":
+                    logger.warning("L'image semble trop sombre, ce qui peut affecter la détection de visage")
+                elif diagnostics.get('brightness_issue') == "Image might be too bright":
+                    logger.warning("L'image semble trop claire/surexposée, ce qui peut affecter la détection de visage")
                 
-            # Utiliser le premier visage détecté
-            face_encodings = self.face_recognition.face_encodings(image_array, face_locations)
+                if diagnostics.get('dimensions'):
+                    dims = diagnostics.get('dimensions', '').split('x')
+                    if len(dims) == 2:
+                        width = int(dims[0].strip())
+                        if width < 200:
+                            logger.warning("La résolution de l'image est très basse, ce qui peut affecter la détection de visage")
             
-            if not face_encodings:
-                logger.warning("Impossible d'extraire les encodages du visage")
-                return None
-                
-            logger.info("Encodage du visage extrait avec succès")
-            return face_encodings[0]
+            return None
             
-        except Exception as e:
-            logger.error(f"Erreur lors de l'extraction de l'encodage facial: {str(e)}")
-            logger.error(traceback.format_exc())
+        logger.info(f"{len(face_locations)} visage(s) détecté(s) dans l'image")
+            
+        if self._cancelled(cancel_event):
             return None
+            
+        # Utiliser le premier visage détecté
+        face_encodings = self.face_recognition.face_encodings(image_array, face_locations)
+        
+        if not face_encodings:
+            logger.warning("Impossible d'extraire les encodages du visage")
+            return None
+            
+        logger.info("Encodage du visage extrait avec succès")
+        return face_encodings[0]
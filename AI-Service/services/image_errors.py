@@ -0,0 +1,7 @@
+"""
+Erreurs communes au téléchargement et au décodage des images.
+"""
+
+
+class ImageTooLargeError(ValueError):
+    """L'image dépasse la taille maximale autorisée (octets ou pixels)."""
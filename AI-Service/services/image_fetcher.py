@@ -0,0 +1,242 @@
+"""
+Téléchargement des images de visage.
+Ce module télécharge les images désignées par une URL avec une session HTTP
+partagée (connexions keep-alive réutilisées), limite la taille des téléchargements
+et garde les octets des images dans un cache disque borné, revalidé par des
+requêtes conditionnelles (ETag / Last-Modified).
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.image_errors import ImageTooLargeError
+
+logger = logging.getLogger(__name__)
+
+# Répertoire par défaut du cache des images téléchargées
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'images')
+
+# Taille des blocs lus pendant le téléchargement
+CHUNK_SIZE = 64 * 1024
+
+
+class FetchCancelledError(Exception):
+    """Le téléchargement a été abandonné car son résultat n'est plus attendu."""
+
+
+class ImageFetcher:
+    """
+    Télécharge des images par HTTP avec un pool de connexions et un cache disque.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_cache_bytes=200 * 1024 * 1024,
+                 max_image_bytes=10 * 1024 * 1024, timeout=10, pool_size=10):
+        """
+        Args:
+            cache_dir: Répertoire du cache, ou None pour désactiver le cache
+            max_cache_bytes: Taille maximale du cache; les images les moins récemment utilisées sont supprimées
+            max_image_bytes: Taille maximale d'une image téléchargée
+            timeout: Délai maximal de connexion et de lecture, en secondes
+            pool_size: Nombre de connexions gardées ouvertes par hôte
+        """
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.max_image_bytes = max_image_bytes
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Entrées du cache, des moins aux plus récemment utilisées: clé -> taille en octets
+        self._entries = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+        self.revalidated = 0
+        self.downloads = 0
+
+        if self.cache_dir:
+            self._open_cache()
+
+    @classmethod
+    def from_env(cls):
+        """Crée un téléchargeur configuré par les variables IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES,
+        IMAGE_MAX_BYTES et IMAGE_FETCH_POOL_SIZE."""
+        cache_dir = os.environ.get('IMAGE_CACHE_DIR', DEFAULT_CACHE_DIR)
+        return cls(
+            cache_dir=cache_dir if cache_dir.lower() != 'none' else None,
+            max_cache_bytes=int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 200 * 1024 * 1024)),
+            max_image_bytes=int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024)),
+            pool_size=int(os.environ.get('IMAGE_FETCH_POOL_SIZE', 10))
+        )
+
+    def _open_cache(self):
+        """Indexe les images déjà en cache, des plus anciennes aux plus récentes."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.bin'):
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                    entries.append((stat.st_mtime, name[:-len('.bin')], stat.st_size))
+            for _, key, size in sorted(entries):
+                self._entries[key] = size
+                self._cache_bytes += size
+            self._evict()
+        except OSError as e:
+            logger.warning(f"Cache des images indisponible: {str(e)}")
+            self.cache_dir = None
+
+    def _paths(self, key):
+        return os.path.join(self.cache_dir, f"{key}.bin"), os.path.join(self.cache_dir, f"{key}.json")
+
+    def fetch(self, url, cancel_event=None):
+        """
+        Télécharge une image, ou la lit depuis le cache si le serveur confirme qu'elle n'a pas changé.
+
+        Args:
+            url: URL de l'image
+            cancel_event: threading.Event levé quand l'image n'est plus attendue
+
+        Returns:
+            bytes: Contenu de l'image
+
+        Raises:
+            ImageTooLargeError: Si l'image dépasse max_image_bytes
+            FetchCancelledError: Si cancel_event est levé pendant le téléchargement
+            requests.RequestException: En cas d'erreur HTTP ou réseau
+        """
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        cached = self._read_cache(key, url)
+
+        headers = {}
+        if cached:
+            if cached['meta'].get('etag'):
+                headers['If-None-Match'] = cached['meta']['etag']
+            if cached['meta'].get('last_modified'):
+                headers['If-Modified-Since'] = cached['meta']['last_modified']
+
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if cached and response.status_code == 304:
+                logger.info("Image inchangée sur le serveur, lecture depuis le cache")
+                with self._lock:
+                    self.revalidated += 1
+                self._touch(key)
+                return cached['content']
+
+            response.raise_for_status()  # Raise exception for 4XX/5XX errors
+            content = self._read_body(response, cancel_event)
+            with self._lock:
+                self.downloads += 1
+
+            meta = {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+            cache_control = response.headers.get('Cache-Control', '').lower()
+            # Sans validateur, une image en cache ne pourrait pas être revalidée
+            if (meta['etag'] or meta['last_modified']) and 'no-store' not in cache_control:
+                self._write_cache(key, content, meta)
+            return content
+
+    def _read_body(self, response, cancel_event):
+        """Lit le corps de la réponse par blocs, en s'arrêtant dès que la taille maximale est dépassée."""
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > self.max_image_bytes:
+            raise ImageTooLargeError(
+                f"Image trop volumineuse: {content_length} octets (maximum {self.max_image_bytes})"
+            )
+
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if cancel_event is not None and cancel_event.is_set():
+                raise FetchCancelledError("Téléchargement de l'image abandonné")
+            size += len(chunk)
+            if size > self.max_image_bytes:
+                raise ImageTooLargeError(f"Image trop volumineuse: plus de {self.max_image_bytes} octets")
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def _read_cache(self, key, url):
+        """Contenu et métadonnées d'une image en cache, ou None."""
+        if not self.cache_dir:
+            return None
+        with self._lock:
+            if key not in self._entries:
+                return None
+        content_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            with open(content_path, 'rb') as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url:
+            return None
+        return {'content': content, 'meta': meta}
+
+    def _write_cache(self, key, content, meta):
+        """Enregistre une image dans le cache, puis supprime les plus anciennes si le cache est trop grand."""
+        if not self.cache_dir or len(content) > self.max_cache_bytes:
+            return
+        content_path, meta_path = self._paths(key)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # Contenu d'abord: un ancien validateur associé au nouveau contenu provoque au pire un
+            # nouveau téléchargement, alors que l'inverse servirait l'ancienne image après un 304
+            with open(content_path + suffix, 'wb') as f:
+                f.write(content)
+            os.replace(content_path + suffix, content_path)
+            with open(meta_path + suffix, 'w') as f:
+                json.dump(meta, f)
+            os.replace(meta_path + suffix, meta_path)
+        except OSError as e:
+            logger.warning(f"Impossible d'écrire l'image en cache: {str(e)}")
+            return
+
+        with self._lock:
+            self._cache_bytes += len(content) - self._entries.pop(key, 0)
+            self._entries[key] = len(content)
+            self._evict()
+
+    def _touch(self, key):
+        """Marque une image en cache comme récemment utilisée."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        try:
+            os.utime(self._paths(key)[0])
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Supprime les images les moins récemment utilisées jusqu'à respecter max_cache_bytes. Appelé sous verrou."""
+        while self._cache_bytes > self.max_cache_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._cache_bytes -= size
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Compteurs du téléchargeur."""
+        with self._lock:
+            return {
+                'cached_images': len(self._entries),
+                'cache_bytes': self._cache_bytes,
+                'max_cache_bytes': self.max_cache_bytes,
+                'revalidated': self.revalidated,
+                'downloads': self.downloads
+            }
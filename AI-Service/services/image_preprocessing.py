@@ -2,6 +2,8 @@
 Service de prétraitement d'image pour améliorer la détection de visage.
 Ce module contient des fonctions pour améliorer la qualité des images avant la détection de visage.
 """
+import os
+import io
 import logging
 import numpy as np
 try:
@@ -11,8 +13,13 @@ except ImportError:
     CV2_AVAILABLE = False
 from PIL import Image, ImageEnhance, ImageOps
 
+from services.image_errors import ImageTooLargeError
+
 logger = logging.getLogger(__name__)
 
+# Nombre maximal de pixels d'une image acceptée, vérifié sur l'en-tête avant décodage
+MAX_IMAGE_PIXELS = int(os.environ.get('FACE_IMAGE_MAX_PIXELS', 50000000))
+
 class ImagePreprocessor:
     """
     Classe pour prétraiter les images avant la détection de visage.
@@ -90,6 +97,72 @@ class ImagePreprocessor:
             
         return normalized
     
+    @staticmethod
+    def fit_size(width, height, max_size):
+        """
+        Calcule les dimensions d'une image ramenée à max_size pixels de côté.
+        
+        Args:
+            width: Largeur de l'image
+            height: Hauteur de l'image
+            max_size: Taille maximale (hauteur ou largeur) en pixels
+            
+        Returns:
+            tuple: (largeur, hauteur) réduites, ou None si l'image ne dépasse pas max_size
+        """
+        if height <= max_size and width <= max_size:
+            return None
+        ratio = min(max_size / width, max_size / height)
+        return int(width * ratio), int(height * ratio)
+    
+    @staticmethod
+    def load_image(image_bytes, max_size=1500, mode=None, convert_rgba=True, max_pixels=None):
+        """
+        Décode une image en vérifiant d'abord ses dimensions dans l'en-tête.
+        
+        Les JPEG plus grands que max_size sont décodés directement à échelle réduite
+        (1/2, 1/4 ou 1/8) puis ramenés à max_size, sans allouer l'image en pleine
+        résolution. Les autres formats sont décodés entièrement et redimensionnés
+        par resize_image_if_needed.
+        
+        Args:
+            image_bytes: Octets de l'image
+            max_size: Taille maximale (hauteur ou largeur) en pixels de l'image décodée
+            mode: Mode PIL de conversion (par exemple 'RGB'), optionnel
+            convert_rgba: Convertit les images RGBA en RGB
+            max_pixels: Nombre maximal de pixels accepté (par défaut MAX_IMAGE_PIXELS)
+            
+        Returns:
+            numpy.ndarray: Image décodée
+            
+        Raises:
+            ImageTooLargeError: Si l'en-tête annonce plus de max_pixels pixels
+        """
+        # Image.open ne lit que l'en-tête: les pixels sont décodés au premier accès
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size
+        max_pixels = MAX_IMAGE_PIXELS if max_pixels is None else max_pixels
+        if max_pixels and width * height > max_pixels:
+            raise ImageTooLargeError(f"Image trop grande: {width}x{height} pixels (maximum {max_pixels} pixels)")
+        
+        target = ImagePreprocessor.fit_size(width, height, max_size)
+        if target is not None:
+            logger.info(f"Image de {width}x{height} pixels ({image.format}), réduite à {target[0]}x{target[1]} au décodage")
+            # Décodage JPEG à l'échelle la plus petite qui reste au moins égale à la cible; sans effet pour les autres formats
+            image.draft(None, target)
+        
+        if mode:
+            image = image.convert(mode)
+        elif convert_rgba and image.mode == 'RGBA':
+            logger.info("Conversion d'une image RGBA en RGB")
+            image = image.convert('RGB')
+        
+        if target is not None and image.size != target:
+            # Mêmes dimensions finales que resize_image_if_needed sur l'image complète,
+            # que draft ait réduit l'image (JPEG) ou non (autres formats)
+            image = image.resize(target, Image.LANCZOS)
+        return np.array(image)
+    
     @staticmethod
     def resize_image_if_needed(image_array, max_size=1200):
         """
@@ -106,13 +179,12 @@ class ImagePreprocessor:
             height, width = image_array.shape[:2]
             
             # Vérifier si redimensionnement nécessaire
-            if height <= max_size and width <= max_size:
+            target = ImagePreprocessor.fit_size(width, height, max_size)
+            if target is None:
                 return image_array
             
             # Calculer le ratio de redimensionnement
-            ratio = min(max_size / width, max_size / height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
+            new_width, new_height = target
             
             # Redimensionner avec PIL
             pil_image = Image.fromarray(image_array)
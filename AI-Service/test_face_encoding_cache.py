@@ -0,0 +1,297 @@
+"""
+Script de test pour le cache des encodages faciaux.
+
+Ce script vérifie FaceEncodingCache: vidage d'un cache produit par une autre
+version du modèle, éviction LRU en mémoire et sur disque, rechargement depuis
+le disque, index par utilisateur (changement de source, expiration, oubli des
+encodages supprimés) et écritures concurrentes. Un dernier test fait passer une image de profil
+remplacée à la même URL par le service, avec un serveur HTTP local.
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import numpy as np
+from PIL import Image
+
+# Configurer le logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ajouter le répertoire du service au chemin de recherche pour importer les modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.face_encoding_cache import FaceEncodingCache, content_hash
+from services.image_fetcher import ImageFetcher
+
+VERSION = {'face_recognition': 'test', 'dlib': None, 'detector': 'hog', 'pipeline': 0}
+
+# Images servies par le serveur local: chemin -> (contenu, ETag)
+IMAGES = {}
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serveur d'images minimal avec réponses 304 sur If-None-Match."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        content, etag = IMAGES[self.path]
+        if self.headers['If-None-Match'] == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def encoding(value):
+    return np.full(128, value, dtype=np.float32)
+
+
+def npy_files(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith('.npy'))
+
+
+def png(color):
+    """Octets d'une petite image PNG unie."""
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_version_mismatch_clears_cache(cache_dir):
+    """Un cache écrit par une autre version du modèle est vidé à l'ouverture."""
+    cache = FaceEncodingCache(cache_dir, version=VERSION)
+    cache.put('a', encoding(1), user_id='u1', source='/a.jpg')
+    assert npy_files(cache_dir) == ['a.npy']
+
+    reopened = FaceEncodingCache(cache_dir, version=dict(VERSION, pipeline=1))
+    assert npy_files(cache_dir) == [], "les encodages de l'ancienne version doivent être supprimés"
+    assert reopened.get('a') is None
+    assert reopened.stats()['users'] == 0
+
+    # La même version retrouve le cache vidé, sans le vider à nouveau
+    reopened.put('b', encoding(2))
+    assert FaceEncodingCache(cache_dir, version=dict(VERSION, pipeline=1)).get('b') is not None
+
+
+def test_lru_eviction(cache_dir):
+    """Au-delà de max_entries, l'encodage le moins récemment utilisé quitte la mémoire."""
+    cache = FaceEncodingCache(None, max_entries=2, version=VERSION)
+    cache.put('a', encoding(1))
+    cache.put('b', encoding(2))
+    assert cache.get('a') is not None  # a devient le plus récemment utilisé
+    cache.put('c', encoding(3))  # b est supprimé
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['misses'] == 1, stats
+
+
+def test_disk_reload(cache_dir):
+    """Un nouveau cache (redémarrage du service) relit les encodages et l'index depuis le disque."""
+    cache = FaceEncodingCache(cache_dir, max_entries=1, version=VERSION)
+    cache.put('a', encoding(1), user_id='u1', source='/a.jpg')
+    cache.put('b', encoding(2))
+    # a a quitté la mémoire mais reste sur disque
+    assert np.array_equal(cache.get('a'), encoding(1))
+    assert cache.stats()['disk_hits'] == 1
+
+    reopened = FaceEncodingCache(cache_dir, version=VERSION)
+    assert np.array_equal(reopened.get('b'), encoding(2))
+    assert reopened.get('b').dtype == np.float32
+    # L'index des utilisateurs n'est pas persisté: l'image est relue une fois après le redémarrage
+    assert reopened.stats()['users'] == 0
+    assert reopened.get_for_user('u1', '/a.jpg') is None
+    reopened.remember_user('u1', 'a', '/a.jpg')
+    assert np.array_equal(reopened.get_for_user('u1', '/a.jpg'), encoding(1))
+
+
+def test_user_index(cache_dir):
+    """L'index par utilisateur ne sert que la source enregistrée, et pendant user_ttl secondes."""
+    cache = FaceEncodingCache(cache_dir, version=VERSION, user_ttl=0.2)
+    cache.put('a', encoding(1), user_id='u1', source='/a.jpg')
+    assert np.array_equal(cache.get_for_user('u1', '/a.jpg'), encoding(1))
+    assert cache.get_for_user('u1', '/other.jpg') is None
+    assert cache.get_for_user('u1', None) is None
+    assert cache.get_for_user('u2', '/a.jpg') is None
+
+    time.sleep(0.25)
+    assert cache.get_for_user('u1', '/a.jpg') is None, "l'entrée expirée doit être revalidée"
+    # Revalidée avec le même contenu, elle est de nouveau servie
+    cache.remember_user('u1', 'a', '/a.jpg')
+    assert cache.get_for_user('u1', '/a.jpg') is not None
+
+    # Nouvelle image à la même source
+    cache.put('b', encoding(2), user_id='u1', source='/a.jpg')
+    assert np.array_equal(cache.get_for_user('u1', '/a.jpg'), encoding(2))
+
+
+def test_disk_eviction(cache_dir):
+    """Au-delà de max_disk_entries, les fichiers les moins récemment utilisés sont supprimés, avec leurs utilisateurs."""
+    cache = FaceEncodingCache(cache_dir, max_entries=1, max_disk_entries=2, version=VERSION)
+    cache.put('a', encoding(1), user_id='u1', source='/a.jpg')
+    cache.put('b', encoding(2), user_id='u2', source='/b.jpg')
+    assert cache.get('a') is not None  # a devient le plus récemment utilisé
+    cache.put('c', encoding(3))  # b est supprimé
+
+    assert npy_files(cache_dir) == ['a.npy', 'c.npy']
+    assert cache.get('b') is None
+    assert cache.get_for_user('u2', '/b.jpg') is None
+    assert cache.get_for_user('u1', '/a.jpg') is not None
+    stats = cache.stats()
+    assert stats['disk_entries'] == 2 and stats['users'] == 1 and stats['evictions'] == 1, stats
+
+    # Au redémarrage, l'ordre d'utilisation est relu depuis les dates de modification
+    old = time.time() - 60
+    os.utime(os.path.join(cache_dir, 'c.npy'), (old, old))
+    reopened = FaceEncodingCache(cache_dir, max_disk_entries=2, version=VERSION)
+    reopened.put('d', encoding(4))
+    assert npy_files(cache_dir) == ['a.npy', 'd.npy']
+
+    # Un cache plus petit supprime l'excédent dès l'ouverture
+    FaceEncodingCache(cache_dir, max_disk_entries=1, version=VERSION)
+    assert npy_files(cache_dir) == ['d.npy']
+
+
+def test_memory_only_users(cache_dir):
+    """Sans répertoire, un utilisateur est oublié quand son encodage quitte le LRU; rien n'est écrit."""
+    cache = FaceEncodingCache(None, max_entries=2, version=VERSION)
+    for number in range(5):
+        cache.put(f'k{number}', encoding(number), user_id=f'u{number}', source=f'/{number}.jpg')
+    assert cache.stats()['users'] == 2
+    assert cache.get_for_user('u4', '/4.jpg') is not None
+    assert cache.get_for_user('u0', '/0.jpg') is None
+
+    # Les images sans source (base64) ne sont pas persistées et n'entrent pas dans l'index
+    disk_cache = FaceEncodingCache(cache_dir, version=VERSION)
+    disk_cache.put('inline', encoding(1), user_id='u1', source=None, persist=False)
+    assert npy_files(cache_dir) == []
+    assert disk_cache.get('inline') is not None
+    assert disk_cache.stats()['users'] == 0
+    assert not os.path.exists(os.path.join(cache_dir, 'users.json'))
+
+
+def test_concurrent_writes(cache_dir):
+    """Des écritures concurrentes du même encodage et de l'index ne se gênent pas."""
+    cache = FaceEncodingCache(cache_dir, version=VERSION)
+    errors = []
+
+    def worker(number):
+        try:
+            for round_number in range(20):
+                cache.put('shared', encoding(1), user_id=f'u{number}', source=f'/{round_number}.jpg')
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors
+    assert [name for name in os.listdir(cache_dir) if '.tmp' in name] == []
+    assert npy_files(cache_dir) == ['shared.npy']
+    assert cache.stats()['users'] == 8
+    for number in range(8):
+        assert cache.get_for_user(f'u{number}', '/19.jpg') is not None
+    assert np.array_equal(FaceEncodingCache(cache_dir, version=VERSION).get('shared'), encoding(1))
+
+
+def test_replaced_profile_image(cache_dir):
+    """Une photo remplacée à la même URL est réencodée une fois l'index utilisateur expiré."""
+    from services.face_recognition_service import FaceRecognitionService
+
+    server = ThreadingServer(('127.0.0.1', 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/profile.png"
+
+    service = FaceRecognitionService()
+    service.encoding_cache = FaceEncodingCache(os.path.join(cache_dir, 'encodings'), version=VERSION, user_ttl=0.2)
+    service.image_fetcher = ImageFetcher(cache_dir=os.path.join(cache_dir, 'images'))
+    encoded = []
+
+    def encode_face(image_array, source_type, cancel_event=None):
+        # Encodage déterminé par la couleur de l'image, sans face_recognition
+        encoded.append(source_type)
+        return encoding(float(image_array[0, 0, 0]))
+
+    service._encode_face = encode_face
+    try:
+        IMAGES['/profile.png'] = (png((10, 0, 0)), '"v1"')
+        assert service._get_face_encoding(url, True, 'u1')[0] == 10
+        assert service._get_face_encoding(url, True, 'u1')[0] == 10
+        assert len(encoded) == 1
+
+        IMAGES['/profile.png'] = (png((20, 0, 0)), '"v2"')
+        # Pendant user_ttl, l'encodage enregistré est servi sans requête
+        assert service._get_face_encoding(url, True, 'u1')[0] == 10
+        time.sleep(0.25)
+        assert service._get_face_encoding(url, True, 'u1')[0] == 20, "la nouvelle photo doit être encodée"
+        assert len(encoded) == 2
+        assert service.encoding_cache.get_for_user('u1', url) is not None
+
+        # Revalidation sans changement (304): l'encodage est retrouvé par l'empreinte
+        time.sleep(0.25)
+        assert service._get_face_encoding(url, True, 'u1')[0] == 20
+        assert len(encoded) == 2
+        assert service.image_fetcher.stats()['revalidated'] == 1
+        assert service.encoding_cache.get_for_user('u1', url) is not None
+        assert content_hash(IMAGES['/profile.png'][0]) in service.encoding_cache._entries
+    finally:
+        service.executor.shutdown(wait=False)
+        server.shutdown()
+
+
+def main():
+    """Point d'entrée principal pour le script de test."""
+    tests = [
+        test_version_mismatch_clears_cache,
+        test_lru_eviction,
+        test_disk_reload,
+        test_user_index,
+        test_disk_eviction,
+        test_memory_only_users,
+        test_concurrent_writes,
+        test_replaced_profile_image
+    ]
+
+    failures = 0
+    for test in tests:
+        cache_dir = tempfile.mkdtemp(prefix='face-encoding-cache-')
+        try:
+            test(cache_dir)
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            logger.error(f"{test.__name__}: {type(e).__name__}: {str(e)}")
+            print(f"❌ {test.__name__}")
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Script de test pour le traitement concurrent des deux images d'une vérification.
+
+Ce script vérifie que verify_face répond dès qu'une des deux images n'a pas de
+visage, lève le cancel_event de l'autre image, annule une image encore en file
+d'attente, et abandonne un téléchargement en cours sans journaliser d'erreur.
+La détection et l'encodage (_get_face_encoding ou _encode_face) sont remplacés
+par des versions simulées: face_recognition n'est pas nécessaire.
+"""
+
+import os
+import sys
+import time
+import base64
+import logging
+import threading
+from io import BytesIO
+from types import SimpleNamespace
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import numpy as np
+from PIL import Image
+
+# Configurer le logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ajouter le répertoire du service au chemin de recherche pour importer les modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.face_recognition_service import FaceRecognitionService, NO_FACE_RESULTS
+from services.image_fetcher import ImageFetcher
+
+# Durée d'une étape simulée (téléchargement, détection), en secondes
+SLOW = 1.0
+
+# Une réponse « immédiate » doit arriver bien avant la fin de l'étape lente
+FAST = 0.3
+
+
+class SlowImageHandler(BaseHTTPRequestHandler):
+    """Sert une image PNG par petits blocs, sur SLOW secondes."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        content = png((10, 0, 0))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        chunks = 10
+        size = len(content) // chunks + 1
+        for start in range(0, len(content), size):
+            try:
+                self.wfile.write(content[start:start + size])
+                self.wfile.flush()
+            except OSError:
+                return
+            time.sleep(SLOW / chunks)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Le client ferme la connexion quand il abandonne le téléchargement
+        pass
+
+
+class ErrorRecorder(logging.Handler):
+    """Garde les messages journalisés au niveau ERROR."""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def png(color):
+    """Octets d'une image PNG de bruit, assez grande pour être envoyée en plusieurs blocs,
+    dont le premier pixel a la couleur donnée."""
+    buffer = BytesIO()
+    Image.fromarray(np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8)).save(buffer, format='PNG')
+    image = Image.open(buffer)
+    image.paste(color, (0, 0, 1, 1))
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def data_url(color):
+    return "data:image/png;base64," + base64.b64encode(png(color)).decode()
+
+
+class OneSlotExecutor:
+    """
+    Pool à une place qui ne démarre pas de lui-même les tâches suivantes: elles
+    restent en file d'attente, comme dans un pool occupé par d'autres requêtes.
+    """
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.futures.append(future)
+        if len(self.futures) == 1:
+            threading.Thread(target=self._run, args=(future, fn, args), daemon=True).start()
+        return future
+
+    @staticmethod
+    def _run(future, fn, args):
+        if future.set_running_or_notify_cancel():
+            future.set_result(fn(*args))
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def make_service():
+    """Service dont face_recognition est simulé: distance euclidienne entre encodages."""
+    service = FaceRecognitionService()
+    service.face_recognition_available = True
+    service.face_recognition = SimpleNamespace(
+        face_distance=lambda known, encoding: np.linalg.norm(np.asarray(known) - encoding, axis=1)
+    )
+    service.executor.shutdown(wait=False)
+    service.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='face-verify')
+    return service
+
+
+def stub_encodings(service, results):
+    """
+    Remplace _get_face_encoding: chaque image renvoie results[image] = (durée, encodage).
+
+    Returns:
+        dict: image -> {'started': bool, 'cancelled': bool}, rempli pendant le traitement
+    """
+    calls = {}
+
+    def get_face_encoding(image_source, use_cache=False, user_id=None, cancel_event=None):
+        duration, encoding = results[image_source]
+        call = calls[image_source] = {'started': True, 'cancelled': False}
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            if cancel_event is not None and cancel_event.is_set():
+                call['cancelled'] = True
+                return None
+            time.sleep(0.01)
+        return encoding
+
+    service._get_face_encoding = get_face_encoding
+    return calls
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_both_faces():
+    """Avec deux visages, les deux images sont traitées en parallèle."""
+    service = make_service()
+    stub_encodings(service, {'profile': (0.2, np.zeros(128)), 'selfie': (0.2, np.zeros(128))})
+    started = time.perf_counter()
+    result = service.verify_face('profile', 'selfie')
+    elapsed = time.perf_counter() - started
+    assert result['success'] and result['is_match'], result
+    assert elapsed < 0.35, f"{elapsed:.2f} s: les deux images n'ont pas été traitées en parallèle"
+
+
+def test_no_face_in_verification():
+    """Sans visage dans le selfie, la réponse n'attend pas l'image de profil, qui est annulée."""
+    service = make_service()
+    calls = stub_encodings(service, {'profile': (SLOW, np.zeros(128)), 'selfie': (0.05, None)})
+    started = time.perf_counter()
+    result = service.verify_face('profile', 'selfie')
+    elapsed = time.perf_counter() - started
+
+    assert result['error'] == "Aucun visage détecté dans l'image de vérification", result
+    assert elapsed < FAST, f"réponse après {elapsed:.2f} s"
+    assert wait_for(lambda: calls['profile']['cancelled']), "le cancel_event de l'image de profil n'a pas été levé"
+
+
+def test_no_face_in_profile():
+    """Sans visage dans l'image de profil, la réponse n'attend pas le selfie, qui est annulé."""
+    service = make_service()
+    calls = stub_encodings(service, {'profile': (0.05, None), 'selfie': (SLOW, np.zeros(128))})
+    started = time.perf_counter()
+    result = service.verify_face('profile', 'selfie')
+    elapsed = time.perf_counter() - started
+
+    assert result['error'] == "Aucun visage détecté dans l'image de profil", result
+    assert elapsed < FAST, f"réponse après {elapsed:.2f} s"
+    assert wait_for(lambda: calls['selfie']['cancelled']), "le cancel_event du selfie n'a pas été levé"
+
+
+def test_queued_image_cancelled():
+    """Une image encore en file d'attente du pool n'est jamais traitée."""
+    service = make_service()
+    service.executor = OneSlotExecutor()
+    calls = stub_encodings(service, {'profile': (0.05, None), 'selfie': (0.05, np.zeros(128))})
+    result = service.verify_face('profile', 'selfie')
+    assert result['error'] == "Aucun visage détecté dans l'image de profil", result
+
+    queued = service.executor.futures[1]
+    assert queued.cancelled(), "le selfie en file d'attente n'a pas été annulé"
+    assert 'selfie' not in calls
+
+
+def test_download_cancelled():
+    """Un téléchargement en cours est abandonné sans erreur quand le selfie n'a pas de visage."""
+    server = ThreadingServer(('127.0.0.1', 0), SlowImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service = make_service()
+    service.image_fetcher = ImageFetcher(cache_dir=None)
+    encoded = []
+
+    def encode_face(image_array, source_type, cancel_event=None):
+        # Visage présent si le premier pixel est rouge
+        encoded.append(source_type)
+        return np.zeros(128) if image_array[0, 0, 0] == 10 else None
+
+    service._encode_face = encode_face
+    errors = ErrorRecorder()
+    logging.getLogger('services').addHandler(errors)
+    try:
+        started = time.perf_counter()
+        result = service.verify_face(f"http://127.0.0.1:{server.server_port}/profile.png", data_url((0, 0, 0)))
+        elapsed = time.perf_counter() - started
+        assert result['error'] == "Aucun visage détecté dans l'image de vérification", result
+        assert elapsed < SLOW / 2, f"réponse après {elapsed:.2f} s"
+
+        # Le téléchargement s'arrête au bloc suivant, sans encoder l'image de profil
+        service.executor.shutdown(wait=True)
+        assert encoded == ['base64'], encoded
+        # Seul l'échec de détection est une erreur, pas l'abandon du téléchargement
+        assert errors.messages == [NO_FACE_RESULTS['verification']['log']], errors.messages
+    finally:
+        logging.getLogger('services').removeHandler(errors)
+        server.shutdown()
+
+
+def main():
+    """Point d'entrée principal pour le script de test."""
+    tests = [
+        test_both_faces,
+        test_no_face_in_verification,
+        test_no_face_in_profile,
+        test_queued_image_cancelled,
+        test_download_cancelled
+    ]
+
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            logger.error(f"{test.__name__}: {type(e).__name__}: {str(e)}")
+            print(f"❌ {test.__name__}")
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
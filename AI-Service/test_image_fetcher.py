@@ -0,0 +1,237 @@
+"""
+Script de test pour le téléchargement des images.
+
+Ce script vérifie ImageFetcher contre un serveur HTTP local: réutilisation des
+connexions, requêtes conditionnelles (ETag / Last-Modified), cache disque borné
+et limite de taille des téléchargements.
+"""
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# Configurer le logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ajouter le répertoire du service au chemin de recherche pour importer les modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.image_fetcher import ImageFetcher, ImageTooLargeError
+
+# Images servies par le serveur local: chemin -> (contenu, en-têtes de validation)
+IMAGES = {}
+
+# Requêtes reçues par le serveur local: (chemin, port client, en-têtes conditionnels)
+REQUESTS = []
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serveur d'images minimal, avec connexions keep-alive et réponses 304."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        conditional = {name: self.headers[name] for name in ('If-None-Match', 'If-Modified-Since') if self.headers[name]}
+        REQUESTS.append((self.path, self.client_address[1], conditional))
+
+        if self.path not in IMAGES:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        content, headers = IMAGES[self.path]
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if (etag and conditional.get('If-None-Match') == etag) or \
+                (not etag and last_modified and conditional.get('If-Modified-Since') == last_modified):
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        for name, value in headers.items():
+            if name != 'chunked':
+                self.send_header(name, value)
+        if headers.get('chunked'):
+            # Sans Content-Length: la limite de taille doit être appliquée pendant la lecture
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in range(0, len(content), 16 * 1024):
+                chunk = content[start:start + 16 * 1024]
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Le client ferme la connexion quand il abandonne une image trop volumineuse
+        pass
+
+
+def start_server():
+    """Démarre le serveur local et renvoie (serveur, URL de base)."""
+    server = ThreadingServer(('127.0.0.1', 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def requests_for(path):
+    return [request for request in REQUESTS if request[0] == path]
+
+
+def test_connection_reuse(base_url, cache_dir):
+    """Les téléchargements successifs réutilisent la même connexion."""
+    IMAGES['/keepalive.jpg'] = (b'k' * 1000, {})
+    fetcher = ImageFetcher(cache_dir=cache_dir)
+    for _ in range(3):
+        assert fetcher.fetch(f"{base_url}/keepalive.jpg") == b'k' * 1000
+    ports = {port for _, port, _ in requests_for('/keepalive.jpg')}
+    assert len(ports) == 1, f"{len(ports)} connexions ouvertes pour 3 requêtes"
+
+
+def test_etag_revalidation(base_url, cache_dir):
+    """Une image en cache est revalidée avec If-None-Match et lue depuis le disque après un 304."""
+    IMAGES['/etag.jpg'] = (b'v1' * 500, {'ETag': '"v1"'})
+    fetcher = ImageFetcher(cache_dir=cache_dir)
+    assert fetcher.fetch(f"{base_url}/etag.jpg") == b'v1' * 500
+    assert fetcher.fetch(f"{base_url}/etag.jpg") == b'v1' * 500
+    assert requests_for('/etag.jpg')[-1][2] == {'If-None-Match': '"v1"'}
+    assert fetcher.stats()['revalidated'] == 1
+
+    # Une image modifiée sur le serveur est téléchargée à nouveau
+    IMAGES['/etag.jpg'] = (b'v2' * 500, {'ETag': '"v2"'})
+    assert fetcher.fetch(f"{base_url}/etag.jpg") == b'v2' * 500
+    assert fetcher.fetch(f"{base_url}/etag.jpg") == b'v2' * 500
+    assert requests_for('/etag.jpg')[-1][2] == {'If-None-Match': '"v2"'}
+
+
+def test_last_modified_revalidation(base_url, cache_dir):
+    """Sans ETag, l'image est revalidée avec If-Modified-Since."""
+    last_modified = 'Wed, 21 Oct 2015 07:28:00 GMT'
+    IMAGES['/modified.jpg'] = (b'm' * 800, {'Last-Modified': last_modified})
+    fetcher = ImageFetcher(cache_dir=cache_dir)
+    fetcher.fetch(f"{base_url}/modified.jpg")
+    assert fetcher.fetch(f"{base_url}/modified.jpg") == b'm' * 800
+    assert requests_for('/modified.jpg')[-1][2] == {'If-Modified-Since': last_modified}
+    assert fetcher.stats()['revalidated'] == 1
+
+
+def test_cache_persists(base_url, cache_dir):
+    """Le cache disque est réutilisé par un nouveau téléchargeur (redémarrage du service)."""
+    IMAGES['/persist.jpg'] = (b'p' * 600, {'ETag': '"p"'})
+    ImageFetcher(cache_dir=cache_dir).fetch(f"{base_url}/persist.jpg")
+    fetcher = ImageFetcher(cache_dir=cache_dir)
+    assert fetcher.fetch(f"{base_url}/persist.jpg") == b'p' * 600
+    assert fetcher.stats()['revalidated'] == 1
+
+
+def test_uncacheable_responses(base_url, cache_dir):
+    """Les réponses sans validateur ou marquées no-store ne sont pas mises en cache."""
+    IMAGES['/nostore.jpg'] = (b'n' * 300, {'ETag': '"n"', 'Cache-Control': 'no-store'})
+    IMAGES['/novalidator.jpg'] = (b'x' * 300, {})
+    fetcher = ImageFetcher(cache_dir=cache_dir)
+    for path in ('/nostore.jpg', '/novalidator.jpg'):
+        fetcher.fetch(f"{base_url}{path}")
+        fetcher.fetch(f"{base_url}{path}")
+        assert requests_for(path)[-1][2] == {}
+    assert fetcher.stats()['cached_images'] == 0
+
+
+def test_cache_size_cap(base_url, cache_dir):
+    """Les images les moins récemment utilisées sont supprimées au-delà de max_cache_bytes."""
+    fetcher = ImageFetcher(cache_dir=cache_dir, max_cache_bytes=2500)
+    for name in ('a', 'b', 'c'):
+        IMAGES[f'/cap-{name}.jpg'] = (name.encode() * 1000, {'ETag': f'"{name}"'})
+    fetcher.fetch(f"{base_url}/cap-a.jpg")
+    fetcher.fetch(f"{base_url}/cap-b.jpg")
+    fetcher.fetch(f"{base_url}/cap-a.jpg")  # a devient la plus récemment utilisée
+    fetcher.fetch(f"{base_url}/cap-c.jpg")  # b est supprimée
+
+    stats = fetcher.stats()
+    assert stats['cached_images'] == 2 and stats['cache_bytes'] == 2000, stats
+    assert len([name for name in os.listdir(cache_dir) if name.endswith('.bin')]) == 2
+
+    fetcher.fetch(f"{base_url}/cap-b.jpg")
+    assert requests_for('/cap-b.jpg')[-1][2] == {}, "l'image supprimée ne doit plus être revalidée"
+
+
+def test_max_bytes(base_url, cache_dir):
+    """Les images trop volumineuses sont refusées, avec ou sans Content-Length, et jamais mises en cache."""
+    IMAGES['/large.jpg'] = (b'l' * 100000, {'ETag': '"l"'})
+    IMAGES['/large-chunked.jpg'] = (b'c' * 100000, {'ETag': '"c"', 'chunked': True})
+    fetcher = ImageFetcher(cache_dir=cache_dir, max_image_bytes=50000)
+    for path in ('/large.jpg', '/large-chunked.jpg'):
+        try:
+            fetcher.fetch(f"{base_url}{path}")
+        except ImageTooLargeError:
+            pass
+        else:
+            raise AssertionError(f"{path} aurait dû être refusée")
+    assert fetcher.stats()['cached_images'] == 0
+
+    # Le téléchargement en flux reconstitue les images sous la limite
+    IMAGES['/small-chunked.jpg'] = (b's' * 40000, {'chunked': True})
+    assert fetcher.fetch(f"{base_url}/small-chunked.jpg") == b's' * 40000
+
+
+def test_http_errors(base_url, cache_dir):
+    """Les erreurs HTTP sont remontées comme avec requests.get + raise_for_status."""
+    import requests
+    fetcher = ImageFetcher(cache_dir=cache_dir)
+    try:
+        fetcher.fetch(f"{base_url}/missing.jpg")
+    except requests.HTTPError:
+        pass
+    else:
+        raise AssertionError("une réponse 404 aurait dû lever HTTPError")
+
+
+def main():
+    """Point d'entrée principal pour le script de test."""
+    server, base_url = start_server()
+    tests = [
+        test_connection_reuse,
+        test_etag_revalidation,
+        test_last_modified_revalidation,
+        test_cache_persists,
+        test_uncacheable_responses,
+        test_cache_size_cap,
+        test_max_bytes,
+        test_http_errors
+    ]
+
+    failures = 0
+    for test in tests:
+        cache_dir = tempfile.mkdtemp(prefix='image-cache-')
+        try:
+            test(base_url, cache_dir)
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            logger.error(f"{test.__name__}: {type(e).__name__}: {str(e)}")
+            print(f"❌ {test.__name__}")
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    server.shutdown()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Script de test pour le décodage des images.
+
+Ce script vérifie ImagePreprocessor.load_image: dimensions finales identiques
+à resize_image_if_needed pour les JPEG (décodés à échelle réduite) comme pour
+les autres formats, refus des images trop grandes d'après leur en-tête, et
+message d'erreur distinct renvoyé par verify_face pour une image refusée.
+"""
+
+import os
+import sys
+import logging
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Configurer le logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ajouter le répertoire du service au chemin de recherche pour importer les modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.image_preprocessing import ImagePreprocessor
+from services.image_errors import ImageTooLargeError
+
+
+def encoded(size, format):
+    """Octets d'une image en dégradé aux dimensions données."""
+    width, height = size
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = np.linspace(0, 255, width, dtype=np.uint8)
+    pixels[..., 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def test_resized_to_max_size():
+    """Les images plus grandes que max_size ont les dimensions de resize_image_if_needed, quel que soit le format."""
+    for format in ('JPEG', 'PNG', 'BMP'):
+        for size in ((3000, 2000), (1600, 1600), (1000, 3100)):
+            image_bytes = encoded(size, format)
+            image = ImagePreprocessor.load_image(image_bytes, max_size=1500)
+            expected = ImagePreprocessor.resize_image_if_needed(np.array(Image.open(BytesIO(image_bytes))), max_size=1500)
+            assert image.shape == expected.shape, f"{format} {size}: {image.shape} au lieu de {expected.shape}"
+
+
+def test_small_images_unchanged():
+    """Les images sous max_size sont décodées sans redimensionnement."""
+    for format in ('JPEG', 'PNG'):
+        image_bytes = encoded((800, 600), format)
+        image = ImagePreprocessor.load_image(image_bytes, max_size=1500)
+        assert np.array_equal(image, np.array(Image.open(BytesIO(image_bytes)))), format
+
+
+def test_max_pixels():
+    """Les images dont l'en-tête annonce plus de max_pixels pixels sont refusées."""
+    image_bytes = encoded((2000, 2000), 'PNG')
+    try:
+        ImagePreprocessor.load_image(image_bytes, max_pixels=1000000)
+    except ImageTooLargeError:
+        pass
+    else:
+        raise AssertionError("l'image aurait dû être refusée")
+    assert ImagePreprocessor.load_image(image_bytes, max_pixels=4000000).shape[:2] == (1500, 1500)
+
+
+def test_too_large_is_not_missing_face():
+    """verify_face signale une image refusée comme trop grande, et non comme une absence de visage."""
+    import base64
+    from services import image_preprocessing
+    from services.face_recognition_service import FaceRecognitionService
+
+    service = FaceRecognitionService()
+    # L'image est refusée avant toute détection: face_recognition n'est pas appelé
+    service.face_recognition_available = True
+    saved_max_pixels = image_preprocessing.MAX_IMAGE_PIXELS
+    image_preprocessing.MAX_IMAGE_PIXELS = 1000000
+    try:
+        large = "data:image/png;base64," + base64.b64encode(encoded((2000, 2000), 'PNG')).decode()
+        result = service.verify_face(large, large)
+    finally:
+        image_preprocessing.MAX_IMAGE_PIXELS = saved_max_pixels
+        service.executor.shutdown(wait=False)
+
+    assert not result['success']
+    assert result['error'] in ("Image de profil trop grande", "Image de vérification trop grande"), result
+    assert '2000x2000' in result['details'], result
+
+
+def main():
+    """Point d'entrée principal pour le script de test."""
+    tests = [
+        test_resized_to_max_size,
+        test_small_images_unchanged,
+        test_max_pixels,
+        test_too_large_is_not_missing_face
+    ]
+
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            logger.error(f"{test.__name__}: {type(e).__name__}: {str(e)}")
+            print(f"❌ {test.__name__}")
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,8 +7,13 @@ organized in a clean and maintainable structure.
 
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
-from app.services.recommendation_service import RecommendationService
+from app.services.recommendation_service import (
+    RecommendationService, USER_SUBSCRIPTION_PROJECTION, PORTFOLIO_MATCH_PROJECTION
+)
 from app.utils.db_connection import get_db_connection
+from app.utils.process_memory import process_memory
+from app.utils.mongo_stats import track_mongo
+from app.utils.job_index import OPEN_JOBS_QUERY, JOB_PROJECTION, is_job_open
 
 # Create a Blueprint for recommendation routes
 recommendation_bp = Blueprint('recommendation', __name__, url_prefix='')
@@ -44,22 +49,12 @@ def get_recommendation():
         }), 400
     
     try:
-        # Get the base recommendation
-        result = recommendation_service.generate_recommendation(user_id, job_id)
+        # Get the base recommendation; its data is loaded once for the whole request
+        with recommendation_service.data_loader.request_scope():
+            result = recommendation_service.generate_recommendation(user_id, job_id)
         
         # Add detailed scoring categories to the response
-        if 'data' not in result:
-            result['data'] = {}
-            
-        result['data'].update({
-            'detailed_scores': {
-                'global_score': result.get('match_percentage', 0),
-                'skills_score': result.get('skills_match_percentage', 15),
-                'experience_score': 15,  # Default to 15% as shown in UI
-                'education_score': 100,  # Default to 100% as shown in UI
-                'languages_score': 15    # Default to 15% as shown in UI
-            }
-        })
+        _add_detailed_scores(result)
         
         return jsonify({
             'success': True,
@@ -71,6 +66,71 @@ def get_recommendation():
             'message': str(e)
         }), 500
 
+def _add_detailed_scores(result):
+    """Add the detailed scoring categories shown in the UI to a recommendation"""
+    if 'data' not in result:
+        result['data'] = {}
+        
+    result['data'].update({
+        'detailed_scores': {
+            'global_score': result.get('match_percentage', 0),
+            'skills_score': result.get('skills_match_percentage', 15),
+            'experience_score': 15,  # Default to 15% as shown in UI
+            'education_score': 100,  # Default to 100% as shown in UI
+            'languages_score': 15    # Default to 15% as shown in UI
+        }
+    })
+    return result
+
+# Largest number of job posts accepted by one batch request
+MAX_BATCH_JOBS = 500
+
+@recommendation_bp.route('/api/recommendations/batch', methods=['POST'])
+def get_recommendations_batch():
+    """
+    Endpoint to get recommendations for one user and many jobs
+    Requires a JSON body with user_id and a list of job_ids
+    Returns one /api/recommendation result per job id, in the same order;
+    unknown jobs get an error entry
+    """
+    body = request.get_json(silent=True) or {}
+    user_id = body.get('user_id')
+    job_ids = body.get('job_ids')
+    
+    if not user_id or not isinstance(job_ids, list) or not job_ids:
+        return jsonify({
+            'success': False,
+            'message': 'user_id and a non-empty list of job_ids are required'
+        }), 400
+    
+    if len(job_ids) > MAX_BATCH_JOBS:
+        return jsonify({
+            'success': False,
+            'message': f'At most {MAX_BATCH_JOBS} job_ids are accepted per request'
+        }), 400
+    
+    try:
+        result = recommendation_service.generate_recommendations_batch(user_id, job_ids)
+        if 'error' in result:
+            return jsonify({
+                'success': False,
+                'message': result['error']
+            }), 404 if result['error'] == 'User not found' else 500
+        
+        for recommendation in result['recommendations']:
+            if 'error' not in recommendation:
+                _add_detailed_scores(recommendation)
+        
+        return jsonify({
+            'success': True,
+            'data': result['recommendations']
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
 @recommendation_bp.route('/api/better-matches/<user_id>', methods=['GET'])
 def get_better_matches(user_id):
     """
@@ -79,36 +139,49 @@ def get_better_matches(user_id):
     """
     try:
         # Get limit parameter, default to 10
-        limit = int(request.args.get('limit', 10))
+        limit = min(int(request.args.get('limit', 10)), 100)
         
-        # Get user data for subscription tier
-        user_data = db.users.find_one({'_id': ObjectId(user_id)})
-        if not user_data:
-            return jsonify({
-                'success': False,
-                'message': f"User with ID {user_id} not found"
-            }), 404
+        # Count the Mongo round trips and bytes of this request
+        with track_mongo() as mongo_stats:
+            # Get user data for subscription tier
+            user_data = db.users.find_one({'_id': ObjectId(user_id)}, USER_SUBSCRIPTION_PROJECTION)
+            if not user_data:
+                return jsonify({
+                    'success': False,
+                    'message': f"User with ID {user_id} not found"
+                }), 404
+                
+            # Get user portfolio
+            user_portfolio = db.portfolios.find_one({'userId': ObjectId(user_id)}, PORTFOLIO_MATCH_PROJECTION)
+            if not user_portfolio:
+                return jsonify({
+                    'success': False,
+                    'message': f"Portfolio for user with ID {user_id} not found"
+                }), 404
             
-        # Get user portfolio
-        user_portfolio = db.portfolios.find_one({'userId': ObjectId(user_id)})
-        if not user_portfolio:
-            return jsonify({
-                'success': False,
-                'message': f"Portfolio for user with ID {user_id} not found"
-            }), 404
-        
-        # Get all available jobs
-        available_jobs = list(db.jobposts.find())
-        
-        # Get user's subscription tier
-        subscription_tier = user_data.get('subscription', 'Free')
-        
-        # Find better matching jobs for this user with subscription tier consideration
-        recommended_jobs = recommendation_service._find_subscription_appropriate_jobs(
-            user_portfolio, 
-            available_jobs, 
-            subscription_tier
-        )
+            # Score against the precomputed job index, or fetch the open jobs if it is unavailable
+            available_jobs = None
+            if recommendation_service.job_index is None:
+                available_jobs = [
+                    job for job in db.jobposts.find(OPEN_JOBS_QUERY, JOB_PROJECTION)
+                    if is_job_open(job)
+                ]
+            
+            # Get user's subscription tier
+            subscription_tier = user_data.get('subscription', 'Free')
+            
+            # Find better matching jobs for this user with subscription tier consideration
+            recommended_jobs = recommendation_service._find_subscription_appropriate_jobs(
+                user_portfolio, 
+                available_jobs, 
+                subscription_tier,
+                limit=limit
+            )
+            
+            # Resolve all companies at once, from the cache or with a single $in query
+            companies = recommendation_service.company_cache.get_many(
+                [job['companyId'] for job, _ in recommended_jobs if 'companyId' in job]
+            )
         
         # Format the job recommendations for API response
         formatted_jobs = []
@@ -126,16 +199,20 @@ def get_better_matches(user_id):
             # Add company info if available
             if 'companyId' in job:
                 job_info['company_id'] = str(job['companyId'])
-                company = db.companies.find_one({'_id': job['companyId']})
+                company = companies.get(job['companyId'])
                 if company and 'name' in company:
                     job_info['company_name'] = company['name']
             
             formatted_jobs.append(job_info)
         
+        print(f"Better matches for {user_id}: {mongo_stats['round_trips']} Mongo round trips, "
+              f"{mongo_stats['bytes_sent']} bytes sent, {mongo_stats['bytes_received']} bytes received")
+        
         return jsonify({
             'success': True,
             'subscription_tier': subscription_tier,
-            'data': formatted_jobs
+            'data': formatted_jobs,
+            'mongo_stats': mongo_stats
         })
         
     except Exception as e:
@@ -144,6 +221,148 @@ def get_better_matches(user_id):
             'message': str(e)
         }), 500
 
+@recommendation_bp.route('/api/job-index/jobs/<job_id>', methods=['POST', 'DELETE'])
+def refresh_job_index(job_id):
+    """
+    Update one job in the job index
+    POST after a job post was inserted or edited, DELETE after it was closed or removed
+    """
+    try:
+        changed = recommendation_service.refresh_indexed_job(job_id, closed=request.method == 'DELETE')
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'changed': bool(changed),
+            'indexed_jobs': len(recommendation_service.job_index) if recommendation_service.job_index is not None else 0
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@recommendation_bp.route('/api/job-index/rebuild', methods=['POST'])
+def rebuild_job_index():
+    """Rebuild the job index from all open job posts"""
+    try:
+        indexed_jobs = recommendation_service.rebuild_job_index()
+        return jsonify({
+            'success': True,
+            'indexed_jobs': indexed_jobs
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@recommendation_bp.route('/api/companies/<company_id>/jobs/<job_id>/top-applicants', methods=['GET'])
+def get_top_applicants(company_id, job_id):
+    """
+    Endpoint to get the best applicants of a company's job post
+    Optional query parameter: limit (default 10)
+    Scores come from the job's sorted applicant table
+    """
+    try:
+        limit = min(int(request.args.get('limit', 10)), 100)
+        
+        table = recommendation_service.applicant_ranking.table(job_id)
+        if table is None or str(table.job.get('companyId')) != company_id:
+            return jsonify({
+                'success': False,
+                'message': 'Job not found for this company'
+            }), 404
+        
+        applicants, total_applicants = recommendation_service.applicant_ranking.top_applicants(job_id, limit)
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'total_applicants': total_applicants,
+            'data': applicants
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@recommendation_bp.route('/api/jobs/<job_id>/applicants/<user_id>', methods=['GET', 'POST', 'DELETE'])
+def applicant_rank(job_id, user_id):
+    """
+    Rank of one applicant for a job post
+    GET returns the rank and percentile, POST scores a new application into the
+    job's table and DELETE removes a withdrawn one
+    """
+    try:
+        ranking = recommendation_service.applicant_ranking
+        if request.method == 'POST':
+            ranking.add_application(job_id, user_id)
+        elif request.method == 'DELETE':
+            ranking.remove_application(job_id, user_id)
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'user_id': user_id
+            })
+        
+        result = ranking.ranking(job_id, user_id)
+        if result is None:
+            return jsonify({
+                'success': False,
+                'message': 'Application not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'user_id': user_id,
+            'data': result
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@recommendation_bp.route('/api/recommendation-cache/stats', methods=['GET'])
+def get_recommendation_cache_stats():
+    """Hit/miss counters and size of the recommendation result cache"""
+    return jsonify({
+        'success': True,
+        'data': recommendation_service.result_cache.stats()
+    })
+
+@recommendation_bp.route('/api/recommendation-cache/invalidate', methods=['POST'])
+def invalidate_recommendation_cache():
+    """
+    Drop cached recommendations
+    JSON body: {"user_id": ...} after a profile or portfolio changed, {"job_id": ...}
+    after a job post changed, or an empty body to clear the whole cache
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        user_id = payload.get('user_id')
+        job_id = payload.get('job_id')
+        
+        removed = 0
+        if user_id:
+            removed += recommendation_service.invalidate_user(user_id)
+        if job_id:
+            removed += recommendation_service.invalidate_job(job_id)
+        if not user_id and not job_id:
+            removed = recommendation_service.result_cache.clear()
+        
+        return jsonify({
+            'success': True,
+            'removed': removed
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
 @recommendation_bp.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint to verify the service is running"""
@@ -154,7 +373,12 @@ def health_check():
             'success': True,
             'status': 'healthy',
             'message': 'TuniHire AI Recommendation Service is running',
-            'collections': collections
+            'collections': collections,
+            'models': recommendation_service.model_status(),
+            'memory': process_memory(),
+            'applicant_ranking': recommendation_service.applicant_ranking.stats(),
+            'job_index': recommendation_service.job_index.stats() if recommendation_service.job_index is not None else None,
+            'portfolio_features': recommendation_service.analyzer.portfolio_features.stats()
         })
     except Exception as e:
         return jsonify({
@@ -198,7 +422,9 @@ def get_training_stats():
         return jsonify({
             'success': True,
             'training_count': len(training_files),
-            'recent_training': stats
+            'recent_training': stats,
+            'recommendation_log': recommendation_service.analyzer.history_writer.stats(),
+            'trainer': recommendation_service.trainer.stats()
         })
         
     except Exception as e:
@@ -221,7 +447,14 @@ def register_routes(app):
             'message': 'TuniHire AI Recommendation API is running',
             'endpoints': [
                 '/api/recommendation?user_id=<user_id>&job_id=<job_id>',
+                '/api/recommendations/batch',
                 '/api/better-matches/<user_id>',
+                '/api/job-index/jobs/<job_id>',
+                '/api/job-index/rebuild',
+                '/api/companies/<company_id>/jobs/<job_id>/top-applicants',
+                '/api/jobs/<job_id>/applicants/<user_id>',
+                '/api/recommendation-cache/stats',
+                '/api/recommendation-cache/invalidate',
                 '/api/health',
                 '/api/training/stats'
             ]
@@ -0,0 +1,305 @@
+"""
+Recommendation data access
+
+Loads the user, job post, portfolio and company needed for one recommendation.
+Instead of four sequential find_one calls, the bundle is read with a single
+aggregation pipeline ($lookup) or with concurrent queries on the pooled client,
+and it is cached for the rest of the request. Batches of job posts for one user
+are read the same way with a single $in query.
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.company_cache import COMPANY_PROJECTION
+
+# User fields needed to pick the subscription tier
+USER_SUBSCRIPTION_PROJECTION = {'subscription': 1}
+
+# Portfolio fields needed to score a portfolio against job posts
+# Includes every PORTFOLIO_FEATURE_FIELDS entry, so better matches and recommendations
+# share the portfolio feature store entries
+PORTFOLIO_MATCH_PROJECTION = {
+    'userId': 1,
+    'skills': 1,
+    'experience': 1,
+    'education': 1,
+    'languages': 1,
+    'projects': 1,
+    'updatedAt': 1,
+    '__v': 1
+}
+
+# Fields read for a single recommendation
+# The result cache versions the documents by hashing these fields
+RECOMMENDATION_USER_PROJECTION = {'subscription': 1, 'firstName': 1, 'lastName': 1, 'updatedAt': 1, '__v': 1}
+RECOMMENDATION_JOB_PROJECTION = {
+    'title': 1,
+    'description': 1,
+    'requirements': 1,
+    'companyId': 1,
+    'yearsOfExperienceRequired': 1,
+    'requiredEducationLevel': 1,
+    'requiredLanguages': 1,
+    'salaryRange': 1,
+    'updatedAt': 1,
+    '__v': 1
+}
+RECOMMENDATION_PORTFOLIO_PROJECTION = {
+    'userId': 1,
+    'skills': 1,
+    'experience': 1,
+    'education': 1,
+    'languages': 1,
+    'projects': 1,
+    'certificates': 1,
+    'updatedAt': 1,
+    '__v': 1
+}
+
+# 'aggregate' runs one $lookup pipeline, 'concurrent' runs the queries in parallel,
+# 'sequential' runs them one after the other
+LOAD_MODES = ('aggregate', 'concurrent', 'sequential')
+
+# Bundles loaded in the current request scope, if any
+_request_bundles = ContextVar('recommendation_bundles', default=None)
+
+
+class RecommendationDataLoader:
+    """Loads {user, job, portfolio, company} bundles for recommendations"""
+
+    def __init__(self, db, company_cache, mode='aggregate', max_workers=8):
+        """
+        Parameters:
+        - db: Database connection
+        - company_cache: CompanyCache used outside the aggregate mode
+        - mode: One of LOAD_MODES
+        - max_workers: Threads running concurrent queries (bounded by the client's pool)
+        """
+        if mode not in LOAD_MODES:
+            raise ValueError(f"mode must be one of {LOAD_MODES}")
+
+        # The mock database has no aggregation support
+        if mode == 'aggregate' and not hasattr(db.users, 'aggregate'):
+            mode = 'concurrent'
+
+        self.db = db
+        self.company_cache = company_cache
+        self.mode = mode
+        self.max_workers = max_workers
+        self._executor = None
+
+    @classmethod
+    def from_env(cls, db, company_cache):
+        """Create a loader configured from RECOMMENDATION_LOAD_MODE"""
+        return cls(db, company_cache, mode=os.environ.get('RECOMMENDATION_LOAD_MODE', 'aggregate'))
+
+    @contextmanager
+    def request_scope(self):
+        """Cache the bundles loaded inside the block, typically one API request"""
+        token = _request_bundles.set({})
+        try:
+            yield
+        finally:
+            _request_bundles.reset(token)
+
+    def load(self, user_id, job_id):
+        """
+        Load the data of one recommendation
+
+        Parameters:
+        - user_id: ObjectId of the user
+        - job_id: ObjectId of the job post
+
+        Returns a dict with 'user', 'job', 'portfolio' and 'company' (None when missing)
+        """
+        bundles = _request_bundles.get()
+        key = (str(user_id), str(job_id))
+        if bundles is not None and key in bundles:
+            return bundles[key]
+
+        if self.mode == 'aggregate':
+            bundle = self._load_aggregate(user_id, job_id)
+        elif self.mode == 'concurrent':
+            bundle = self._load_concurrent(user_id, job_id)
+        else:
+            bundle = self._load_sequential(user_id, job_id)
+
+        if bundles is not None:
+            bundles[key] = bundle
+        return bundle
+
+    def _load_aggregate(self, user_id, job_id):
+        """Read everything with one pipeline on users: one round trip"""
+        pipeline = [
+            {'$match': {'_id': user_id}},
+            {'$limit': 1},
+            {'$project': RECOMMENDATION_USER_PROJECTION},
+            {'$lookup': {
+                'from': 'portfolios',
+                'let': {'user_id': '$_id'},
+                'pipeline': [
+                    {'$match': {'$expr': {'$eq': ['$userId', '$$user_id']}}},
+                    {'$limit': 1},
+                    {'$project': RECOMMENDATION_PORTFOLIO_PROJECTION}
+                ],
+                'as': 'portfolio'
+            }},
+            {'$lookup': {
+                'from': 'jobposts',
+                'pipeline': [
+                    {'$match': {'_id': job_id}},
+                    {'$limit': 1},
+                    {'$project': RECOMMENDATION_JOB_PROJECTION},
+                    {'$lookup': {
+                        'from': 'companies',
+                        'let': {'company_id': '$companyId'},
+                        'pipeline': [
+                            {'$match': {'$expr': {'$eq': ['$_id', '$$company_id']}}},
+                            {'$limit': 1},
+                            {'$project': COMPANY_PROJECTION}
+                        ],
+                        'as': 'company'
+                    }}
+                ],
+                'as': 'job'
+            }}
+        ]
+
+        results = list(self.db.users.aggregate(pipeline))
+        if not results:
+            return {'user': None, 'job': None, 'portfolio': None, 'company': None}
+
+        user = results[0]
+        portfolio = (user.pop('portfolio') or [None])[0]
+        job = (user.pop('job') or [None])[0]
+        company = None
+        if job is not None:
+            company = (job.pop('company') or [None])[0]
+        return {'user': user, 'job': job, 'portfolio': portfolio, 'company': company}
+
+    def _load_concurrent(self, user_id, job_id):
+        """Run the three lookups in parallel; the company usually comes from the cache"""
+        user_future = self._submit(self.db.users.find_one, {'_id': user_id}, RECOMMENDATION_USER_PROJECTION)
+        job_future = self._submit(self.db.jobposts.find_one, {'_id': job_id}, RECOMMENDATION_JOB_PROJECTION)
+        portfolio_future = self._submit(
+            self.db.portfolios.find_one, {'userId': user_id}, RECOMMENDATION_PORTFOLIO_PROJECTION
+        )
+
+        job = job_future.result()
+        return {
+            'user': user_future.result(),
+            'job': job,
+            'portfolio': portfolio_future.result(),
+            'company': self._company_of(job)
+        }
+
+    def _submit(self, fn, *args):
+        """Run fn on the query threads in a copy of the caller's context, so track_mongo() sees its commands"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='recommendation-data')
+        return self._executor.submit(copy_context().run, fn, *args)
+
+    def _load_sequential(self, user_id, job_id):
+        """One query after the other, as the service originally did"""
+        job = self.db.jobposts.find_one({'_id': job_id}, RECOMMENDATION_JOB_PROJECTION)
+        return {
+            'user': self.db.users.find_one({'_id': user_id}, RECOMMENDATION_USER_PROJECTION),
+            'job': job,
+            'portfolio': self.db.portfolios.find_one({'userId': user_id}, RECOMMENDATION_PORTFOLIO_PROJECTION),
+            'company': self._company_of(job)
+        }
+
+    def load_batch(self, user_id, job_ids):
+        """
+        Load the data of recommendations for one user and many job posts
+
+        Parameters:
+        - user_id: ObjectId of the user
+        - job_ids: ObjectIds of the job posts
+
+        Returns a dict with 'user', 'portfolio' (None when missing), 'jobs' (job id
+        string to job, missing jobs left out) and 'companies' (company id to company)
+        """
+        if self.mode == 'aggregate':
+            return self._load_batch_aggregate(user_id, job_ids)
+
+        jobs_query = ({'_id': {'$in': list(job_ids)}}, RECOMMENDATION_JOB_PROJECTION)
+        if self.mode == 'concurrent':
+            user_future = self._submit(self.db.users.find_one, {'_id': user_id}, RECOMMENDATION_USER_PROJECTION)
+            jobs_future = self._submit(lambda: list(self.db.jobposts.find(*jobs_query)))
+            portfolio_future = self._submit(
+                self.db.portfolios.find_one, {'userId': user_id}, RECOMMENDATION_PORTFOLIO_PROJECTION
+            )
+            user, jobs, portfolio = user_future.result(), jobs_future.result(), portfolio_future.result()
+        else:
+            user = self.db.users.find_one({'_id': user_id}, RECOMMENDATION_USER_PROJECTION)
+            jobs = list(self.db.jobposts.find(*jobs_query))
+            portfolio = self.db.portfolios.find_one({'userId': user_id}, RECOMMENDATION_PORTFOLIO_PROJECTION)
+
+        company_ids = [job['companyId'] for job in jobs if 'companyId' in job]
+        return {
+            'user': user,
+            'portfolio': portfolio,
+            'jobs': {str(job['_id']): job for job in jobs},
+            'companies': {
+                company_id: company
+                for company_id, company in self.company_cache.get_many(company_ids).items()
+                if company is not None
+            }
+        }
+
+    def _load_batch_aggregate(self, user_id, job_ids):
+        """Read the user, portfolio and all job posts with one pipeline on users"""
+        pipeline = [
+            {'$match': {'_id': user_id}},
+            {'$limit': 1},
+            {'$project': RECOMMENDATION_USER_PROJECTION},
+            {'$lookup': {
+                'from': 'portfolios',
+                'let': {'user_id': '$_id'},
+                'pipeline': [
+                    {'$match': {'$expr': {'$eq': ['$userId', '$$user_id']}}},
+                    {'$limit': 1},
+                    {'$project': RECOMMENDATION_PORTFOLIO_PROJECTION}
+                ],
+                'as': 'portfolio'
+            }},
+            {'$lookup': {
+                'from': 'jobposts',
+                'pipeline': [
+                    {'$match': {'_id': {'$in': list(job_ids)}}},
+                    {'$project': RECOMMENDATION_JOB_PROJECTION}
+                ],
+                'as': 'jobs'
+            }},
+            {'$lookup': {
+                'from': 'companies',
+                'let': {'company_ids': {'$ifNull': ['$jobs.companyId', []]}},
+                'pipeline': [
+                    {'$match': {'$expr': {'$in': ['$_id', '$$company_ids']}}},
+                    {'$project': COMPANY_PROJECTION}
+                ],
+                'as': 'companies'
+            }}
+        ]
+
+        results = list(self.db.users.aggregate(pipeline))
+        if not results:
+            return {'user': None, 'portfolio': None, 'jobs': {}, 'companies': {}}
+
+        user = results[0]
+        portfolio = (user.pop('portfolio') or [None])[0]
+        jobs = user.pop('jobs') or []
+        companies = user.pop('companies') or []
+        return {
+            'user': user,
+            'portfolio': portfolio,
+            'jobs': {str(job['_id']): job for job in jobs},
+            'companies': {company['_id']: company for company in companies}
+        }
+
+    def _company_of(self, job):
+        if not job or 'companyId' not in job:
+            return None
+        return self.company_cache.get_many([job['companyId']]).get(job['companyId'])
@@ -1,6 +1,24 @@
+import os
+import copy
+import time
+import heapq
 from bson.objectid import ObjectId
 from datetime import datetime
 from app.utils.portfolio_analyzer import PortfolioAnalyzer
+from app.utils.job_index import JobEmbeddingIndex, JOB_PROJECTION, vectorizer_fingerprint, is_premium_job
+from app.utils.model_registry import ModelReloader
+from app.utils.process_memory import process_memory
+from app.utils.company_cache import CompanyCache
+from app.utils.result_cache import ResultCache
+from app.utils.applicant_ranking import ApplicantRanking
+from app.utils.skill_vocabulary import SkillVocabulary, default_vocabulary, set_default_vocabulary, overlap_counts
+from app.services.recommendation_data import (
+    RecommendationDataLoader, USER_SUBSCRIPTION_PROJECTION, PORTFOLIO_MATCH_PROJECTION
+)
+from app.services.sub_scores import (
+    score_portfolio_against_jobs, language_levels, highest_education_level, EDUCATION_LEVELS
+)
+from app.utils.background_trainer import BackgroundTrainer
 
 class RecommendationService:
     """Service for generating AI-powered job application recommendations"""
@@ -13,10 +31,158 @@ class RecommendationService:
         "Master": 1.3,   # 30% bonus for Master subscribers
     }
     
+    # Share of premium jobs among the better matches of each paid tier
+    PREMIUM_JOB_RATIOS = {
+        "Golden": 0.4,  # Golden gets some premium jobs
+        "Platinum": 0.6,  # Platinum gets balanced premium/standard jobs
+        "Master": 0.8,  # Master gets mostly premium jobs
+    }
+    
     def __init__(self, db):
         """Initialize with database connection"""
+        started = time.time()
         self.db = db
         self.analyzer = PortfolioAnalyzer()  # Initialize the ML-capable analyzer
+        
+        # Canonical skill ids used by every skill matcher, built from the database on first start
+        vocabulary_path = SkillVocabulary.default_path(PortfolioAnalyzer.MODEL_PATH)
+        if os.path.exists(vocabulary_path):
+            self.skill_vocabulary = default_vocabulary()  # Loaded by the analyzer
+        else:
+            self.skill_vocabulary = SkillVocabulary.load_or_build(db, vocabulary_path)
+            set_default_vocabulary(self.skill_vocabulary)
+        
+        # Derived portfolio features, optionally shared through a Mongo side collection
+        self.analyzer.portfolio_features.attach(db)
+        
+        # Precomputed job embeddings used to score better matches
+        self.job_index = JobEmbeddingIndex.load_or_build(db, self.analyzer)
+        self.analyzer.job_index = self.job_index
+        
+        # Premium job ratios, overridable as PREMIUM_JOB_RATIOS="Golden:0.4,Platinum:0.6,Master:0.8"
+        self.premium_job_ratios = dict(self.PREMIUM_JOB_RATIOS)
+        for entry in filter(None, os.environ.get('PREMIUM_JOB_RATIOS', '').split(',')):
+            tier, ratio = entry.split(':')
+            self.premium_job_ratios[tier.strip()] = float(ratio)
+        
+        # Company documents shared by all requests, resolved with $in queries
+        self.company_cache = CompanyCache(db, ttl=float(os.environ.get('COMPANY_CACHE_TTL', 300)))
+        
+        # Loads the user/job/portfolio/company bundle of a recommendation in one round trip
+        self.data_loader = RecommendationDataLoader.from_env(db, self.company_cache)
+        
+        # Generated recommendations, keyed on the user/portfolio/job document versions
+        self.result_cache = ResultCache(
+            ttl=float(os.environ.get('RECOMMENDATION_CACHE_TTL', 600)),
+            max_bytes=int(os.environ.get('RECOMMENDATION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        )
+        
+        # Sorted applicant scores per job post, for ranks and top applicants
+        self.applicant_ranking = ApplicantRanking(
+            db,
+            max_jobs=int(os.environ.get('APPLICANT_RANKING_MAX_JOBS', 1000)),
+            ttl=float(os.environ.get('APPLICANT_RANKING_TTL', 60))
+        )
+        
+        # Retrains the success predictor from recorded outcomes on a daemon thread
+        self.trainer = BackgroundTrainer.from_env(self.analyzer)
+        self.analyzer.trainer = self.trainer
+        
+        # Picks up model versions activated by training runs or rollbacks in other processes
+        self.model_reloader = ModelReloader(
+            self.analyzer.registry,
+            lambda: self.analyzer.model_version,
+            self._apply_model_version,
+            interval=float(os.environ.get('MODEL_RELOAD_INTERVAL', 10))
+        )
+        self.model_reloader.start()
+        
+        rss = process_memory().get('rss_bytes')
+        print(f"RecommendationService started in {time.time() - started:.3f}s"
+              + (f" (worker {os.getpid()} RSS {rss / 1024 / 1024:.1f} MB)" if rss else ""))
+    
+    def _apply_model_version(self, version, models, manifest):
+        """Swap a registry version into the analyzer, re-indexing jobs if the vectorizer changed"""
+        job_index = self.job_index
+        vectorizer = models.get('skill_vectorizer')
+        try:
+            fingerprint = vectorizer_fingerprint(vectorizer) if vectorizer is not None else None
+        except AttributeError:
+            fingerprint = None
+        
+        if vectorizer is not None and (job_index is None or fingerprint != job_index.fingerprint):
+            # Build the new index before the swap so scoring never mixes two vocabularies
+            staged = copy.copy(self.analyzer)
+            staged.skill_vectorizer = vectorizer
+            job_index = JobEmbeddingIndex.load_or_build(self.db, staged) if fingerprint else None
+            if job_index is not None:
+                job_index.analyzer = self.analyzer
+        
+        self.analyzer.apply_models(version, models, manifest)
+        self.job_index = job_index
+        self.analyzer.job_index = job_index
+    
+    def model_status(self):
+        """Describe the models being served"""
+        return {
+            'version': self.analyzer.model_version,
+            'vectorizer_version': self.analyzer.vectorizer_version,
+            'predictor_source': self.analyzer.predictor_source,
+            'active_version': self.analyzer.registry.current_version(),
+            'load_mode': self.analyzer.registry.load_mode,
+            'reloads': self.model_reloader.reloads
+        }
+    
+    def invalidate_user(self, user_id):
+        """Drop cached recommendations and rescore applications after a user's profile or portfolio changed"""
+        self.applicant_ranking.refresh_user(user_id)
+        self.analyzer.portfolio_features.invalidate_user(user_id)
+        return self.result_cache.invalidate_user(user_id)
+    
+    def invalidate_job(self, job_id):
+        """Drop cached recommendations and the applicant table after a job post changed"""
+        self.applicant_ranking.invalidate_job(job_id)
+        return self.result_cache.invalidate_job(job_id)
+    
+    def refresh_indexed_job(self, job_id, closed=False):
+        """
+        Update the job index after a job post was inserted, edited or closed
+        
+        Args:
+            job_id (str): MongoDB ID for the job post
+            closed (bool): True if the job was closed or deleted
+            
+        Returns:
+            bool: True if the index changed
+        """
+        self.invalidate_job(job_id)
+        if self.job_index is None:
+            return False
+        
+        job = None if closed else self.db.jobposts.find_one({"_id": ObjectId(job_id)}, JOB_PROJECTION)
+        path = JobEmbeddingIndex.default_path(self.analyzer)
+        with JobEmbeddingIndex.locked(path):
+            # Start from the index last saved by any worker, so their changes are kept
+            self.job_index.reload_if_changed(path)
+            if job:
+                changed = self.job_index.upsert_job(job)
+            else:
+                changed = self.job_index.remove_job(job_id)
+            
+            if changed:
+                self.job_index.save(path)
+        return changed
+    
+    def rebuild_job_index(self):
+        """Rebuild the job index from the database and save it"""
+        job_index = JobEmbeddingIndex.build(self.db, self.analyzer)
+        path = JobEmbeddingIndex.default_path(self.analyzer)
+        with JobEmbeddingIndex.locked(path):
+            job_index.save(path)
+        
+        self.job_index = job_index
+        self.analyzer.job_index = job_index
+        return len(job_index)
     
     def generate_recommendation(self, user_id, job_id):
         """
@@ -35,18 +201,28 @@ class RecommendationService:
             user_id_obj = ObjectId(user_id)
             job_id_obj = ObjectId(job_id)
             
+            # Get user, job, portfolio and company data together
+            bundle = self.data_loader.load(user_id_obj, job_id_obj)
+            
             # Get user data
-            user = self.db.users.find_one({"_id": user_id_obj})
+            user = bundle['user']
             if not user:
                 return {"error": "User not found"}
             
             # Get job data
-            job = self.db.jobposts.find_one({"_id": job_id_obj})
+            job = bundle['job']
             if not job:
                 return {"error": "Job not found"}
             
             # Get user portfolio
-            portfolio = self.db.portfolios.find_one({"userId": user_id_obj})
+            portfolio = bundle['portfolio']
+            
+            # Serve the cached result while none of the documents changed
+            cache_key = self.result_cache.make_key(user_id, job_id, user, portfolio, job)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
             if not portfolio:
                 portfolio = {}  # Default empty portfolio
             
@@ -56,57 +232,141 @@ class RecommendationService:
             education_match = self._calculate_education_match(portfolio, job)
             language_match = self._calculate_language_match(portfolio, job)
             
-            # Apply weighting to each score component
-            skills_weight = 0.4
-            experience_weight = 0.3
-            education_weight = 0.2
-            language_weight = 0.1
-            
-            # Calculate the weighted average score
-            global_score = (
-                skills_match * skills_weight +
-                experience_match * experience_weight +
-                education_match * education_weight +
-                language_match * language_weight
+            recommendation = self._build_recommendation(
+                user, job, portfolio, bundle['company'],
+                skills_match, experience_match, education_match, language_match
             )
             
-            # Round to nearest integer
-            global_score = round(global_score)
+            self.result_cache.put(cache_key, recommendation)
+            return recommendation
             
-            # Get subscription tier for bonus
-            subscription_tier = user.get('subscription', 'Free')
-            subscription_bonus = self._calculate_subscription_bonus(subscription_tier)
+        except Exception as e:
+            print(f"Error generating recommendation: {str(e)}")
+            return {"error": str(e)}
+
+    def generate_recommendations_batch(self, user_id, job_ids):
+        """
+        Generate recommendations for one user and many job posts
+        The portfolio is loaded once, the jobs with one $in query, and the
+        sub-scores are computed over the whole job set at once
+        
+        Args:
+            user_id (str): MongoDB ID for the user
+            job_ids (list): MongoDB IDs of the job posts
             
-            # Prepare recommendation result
-            recommendation = {
-                "match_percentage": global_score,
-                "skills_match_percentage": skills_match,
-                "experience_match": experience_match,
-                "education_match": education_match,
-                "language_match": language_match,
-                "job_title": job.get("title", ""),
-                "job_id": str(job["_id"]),
-                "user_id": str(user["_id"]),
-                "subscription_tier": subscription_tier,
-                "subscription_bonus": subscription_bonus,
-                "recommendation_date": datetime.now().isoformat(),
-                "strengths": self._identify_strengths(portfolio, job),
-                "weaknesses": self._identify_weaknesses(portfolio, job)
-            }
+        Returns:
+            dict: {"recommendations": [...]} in the order of job_ids, each entry
+            equal to generate_recommendation's result, or {"error": ...}
+        """
+        try:
+            user_id_obj = ObjectId(user_id)
+            job_ids = [str(job_id) for job_id in job_ids]
+            job_id_objs = [ObjectId(job_id) for job_id in dict.fromkeys(job_ids)]
             
-            # Add company information
-            if "companyId" in job:
-                company = self.db.companies.find_one({"_id": job["companyId"]})
-                if company:
-                    recommendation["company_name"] = company.get("name", "")
-                    recommendation["company_id"] = str(company["_id"])
+            bundle = self.data_loader.load_batch(user_id_obj, job_id_objs)
+            user = bundle['user']
+            if not user:
+                return {"error": "User not found"}
             
-            return recommendation
+            portfolio = bundle['portfolio']
+            jobs = bundle['jobs']
+            
+            # Serve what the cache has and score only the rest
+            results = {}
+            cache_keys = self.result_cache.make_keys(user_id, jobs, user, portfolio)
+            for job_id in jobs:
+                cached = self.result_cache.get(cache_keys[job_id])
+                if cached is not None:
+                    results[job_id] = cached
+            
+            pending = [job for job_id, job in jobs.items() if job_id not in results]
+            if pending:
+                portfolio = portfolio or {}  # Default empty portfolio
+                scores = score_portfolio_against_jobs(portfolio, pending)
+                for row, job in enumerate(pending):
+                    company = bundle['companies'].get(job.get('companyId'))
+                    recommendation = self._build_recommendation(
+                        user, job, portfolio, company,
+                        int(scores['skills'][row]),
+                        int(scores['experience'][row]),
+                        int(scores['education'][row]),
+                        int(scores['language'][row])
+                    )
+                    job_id = str(job['_id'])
+                    self.result_cache.put(cache_keys[job_id], recommendation)
+                    results[job_id] = recommendation
+            
+            return {
+                "recommendations": [
+                    results[job_id] if job_id in results else {"job_id": job_id, "error": "Job not found"}
+                    for job_id in job_ids
+                ]
+            }
             
         except Exception as e:
-            print(f"Error generating recommendation: {str(e)}")
+            print(f"Error generating recommendations: {str(e)}")
             return {"error": str(e)}
+    
+    def _build_recommendation(self, user, job, portfolio, company, skills_match, experience_match,
+                              education_match, language_match):
+        """Assemble the recommendation of a user/job pair from its sub-scores"""
+        # Apply weighting to each score component
+        skills_weight = 0.4
+        experience_weight = 0.3
+        education_weight = 0.2
+        language_weight = 0.1
+        
+        # Calculate the weighted average score
+        global_score = (
+            skills_match * skills_weight +
+            experience_match * experience_weight +
+            education_match * education_weight +
+            language_match * language_weight
+        )
+        
+        # Round to nearest integer
+        global_score = round(global_score)
+        
+        # Get subscription tier for bonus
+        subscription_tier = user.get('subscription', 'Free')
+        subscription_bonus = self._calculate_subscription_bonus(subscription_tier)
+        
+        # Prepare recommendation result
+        recommendation = {
+            "match_percentage": global_score,
+            "skills_match_percentage": skills_match,
+            "experience_match": experience_match,
+            "education_match": education_match,
+            "language_match": language_match,
+            "job_title": job.get("title", ""),
+            "job_id": str(job["_id"]),
+            "user_id": str(user["_id"]),
+            "subscription_tier": subscription_tier,
+            "subscription_bonus": subscription_bonus,
+            "recommendation_date": datetime.now().isoformat(),
+            "strengths": self._identify_strengths(portfolio, job),
+            "weaknesses": self._identify_weaknesses(portfolio, job)
+        }
+        
+        # Add company information
+        if "companyId" in job and company:
+            recommendation["company_name"] = company.get("name", "")
+            recommendation["company_id"] = str(company["_id"])
+        
+        return recommendation
 
+    def _calculate_subscription_bonus(self, subscription_tier):
+        """Percentage added to match scores by a subscription tier"""
+        return round((self.SUBSCRIPTION_TIERS.get(subscription_tier, 1.0) - 1.0) * 100, 1)
+    
+    def _identify_strengths(self, portfolio, job):
+        """Required skills the portfolio covers"""
+        return self.analyzer.identify_strengths_weaknesses(portfolio, job)['strengths']
+    
+    def _identify_weaknesses(self, portfolio, job):
+        """Required skills missing from the portfolio"""
+        return self.analyzer.identify_strengths_weaknesses(portfolio, job)['weaknesses']
+    
     def _calculate_skills_match(self, portfolio, job):
         """Calculate percentage match between user skills and job requirements"""
         if not portfolio or "skills" not in portfolio or not portfolio["skills"]:
@@ -115,17 +375,21 @@ class RecommendationService:
         if "requirements" not in job or not job["requirements"]:
             return 15  # Default value if no requirements specified
         
-        user_skills = [skill.lower() for skill in portfolio.get("skills", [])]
-        job_skills = [req.lower() for req in job.get("requirements", [])]
+        # Canonical skill ids as bitsets: "java" no longer matches "javascript"
+        features = self.analyzer.portfolio_features.get(portfolio)
+        job_skill_ids = self.skill_vocabulary.skill_ids(job.get("requirements", []))
+        # Requirements outside the vocabulary are compared by canonical name
+        unknown_requirements = self.skill_vocabulary.unknown_names(job.get("requirements", []))
         
-        if not job_skills:
+        if not job_skill_ids and not unknown_requirements:
             return 15  # Default value if no skills required
         
         # Calculate matches
-        matches = sum(1 for skill in job_skills if any(user_skill in skill for user_skill in user_skills))
+        matches = int(overlap_counts(features['skill_bits'], self.skill_vocabulary.bitset(job_skill_ids)[None, :])[0])
+        matches += sum(name in features['unknown_skills'] for name in unknown_requirements)
         
         # Calculate percentage
-        match_percentage = (matches / len(job_skills)) * 100
+        match_percentage = (matches / (len(job_skill_ids) + len(unknown_requirements))) * 100
         
         # Ensure we don't go below the minimum 15%
         return max(15, min(100, round(match_percentage)))
@@ -141,8 +405,10 @@ class RecommendationService:
         if "yearsOfExperienceRequired" not in job:
             return experience_score  # Default if no experience required
         
-        # Calculate user's total years of experience
-        user_experience = sum(exp.get("years", 0) for exp in portfolio.get("experience", []))
+        # User's total years of experience, derived once per portfolio version
+        user_experience = self.analyzer.portfolio_features.get(portfolio)['experience_years']
+        if user_experience is None:
+            user_experience = sum(exp.get("years", 0) for exp in portfolio.get("experience", []))
         
         # Get required years of experience
         required_exp = job.get("yearsOfExperienceRequired", 0)
@@ -170,25 +436,13 @@ class RecommendationService:
         if "requiredEducationLevel" not in job:
             return 100  # Default if no education required
         
-        # Education levels with corresponding values
-        education_levels = {
-            "high-school": 1,
-            "associate": 2,
-            "bachelor": 3,
-            "master": 4,
-            "phd": 5
-        }
-        
-        # Get user's highest education level
-        user_education_level = 0
-        for education in portfolio.get("education", []):
-            degree = education.get("degree", "").lower()
-            for level, value in education_levels.items():
-                if level in degree:
-                    user_education_level = max(user_education_level, value)
+        # User's highest education level, derived once per portfolio version
+        user_education_level = self.analyzer.portfolio_features.get(portfolio)['education_level']
+        if user_education_level is None:
+            user_education_level = highest_education_level(portfolio.get("education", []))
         
         # Get job required education level
-        required_level = education_levels.get(job.get("requiredEducationLevel", "").lower(), 0)
+        required_level = EDUCATION_LEVELS.get(job.get("requiredEducationLevel", "").lower(), 0)
         
         # Calculate match
         if user_education_level >= required_level:
@@ -220,9 +474,10 @@ class RecommendationService:
             "native": 5
         }
         
-        # Get user languages
-        user_languages = {lang["name"].lower(): proficiency_levels.get(lang.get("level", "").lower(), 0) 
-                         for lang in portfolio.get("languages", [])}
+        # User languages, derived once per portfolio version
+        user_languages = self.analyzer.portfolio_features.get(portfolio)['languages']
+        if user_languages is None:
+            user_languages = language_levels(portfolio.get("languages", []))
         
         # Get required languages
         required_languages = {lang["name"].lower(): proficiency_levels.get(lang.get("level", "").lower(), 0) 
@@ -250,79 +505,46 @@ class RecommendationService:
         
         return language_score
 
-    def _find_subscription_appropriate_jobs(self, portfolio, all_jobs, subscription_tier):
+    def _find_subscription_appropriate_jobs(self, portfolio, all_jobs, subscription_tier, limit=5, premium_ratios=None):
         """
         Find jobs that match both the user's skills and their subscription tier
         Higher tier subscribers get access to more premium job recommendations
+        Pass all_jobs=None to score against the job index
+        
+        Parameters:
+        - limit: Maximum number of jobs to return
+        - premium_ratios: Share of premium jobs per paid tier (default: self.premium_job_ratios)
         """
-        # Get basic job recommendations from analyzer
-        job_matches = self.analyzer.find_best_matching_jobs(portfolio, all_jobs)
+        # Pick up index updates saved by other workers
+        if all_jobs is None and self.job_index is not None:
+            self.job_index.reload_if_changed()
+        
+        # Get basic job recommendations from analyzer, best first
+        job_matches = self.analyzer.find_best_matching_jobs(portfolio, all_jobs, limit=limit)
         
         # Premium job filtering based on subscription tier
         # For premium subscribers, we prioritize higher quality job matches
-        if subscription_tier in ["Golden", "Platinum", "Master"]:
-            # Sort by quality and salary range for premium subscribers
+        premium_ratio = (premium_ratios or self.premium_job_ratios).get(subscription_tier)
+        if premium_ratio is not None:
+            # Split on the premium flag computed when the job was indexed; both parts stay sorted
             premium_jobs = []
             standard_jobs = []
-            
             for job, score in job_matches:
-                # Check if job has premium indicators
-                is_premium = False
-                salary_range = job.get('salaryRange', '')
-                
-                # Simple heuristic to identify premium jobs (higher salary ranges)
-                if salary_range:
-                    try:
-                        # Handle ranges like "$80K-100K" or "80,000-100,000"
-                        salary_text = salary_range.replace('$', '').replace(',', '').lower()
-                        if 'k' in salary_text:
-                            # Handle K notation (e.g., "80K-100K")
-                            max_part = salary_text.split('-')[-1].replace('k', '000')
-                            max_salary = float(max_part)
-                        else:
-                            # Handle full numbers
-                            max_part = salary_text.split('-')[-1]
-                            max_salary = float(max_part)
-                        
-                        # Jobs with potentially higher salaries are marked as premium
-                        if max_salary > 80000:  # Threshold for premium jobs
-                            is_premium = True
-                    except (ValueError, IndexError):
-                        # If we can't parse the salary, just use other indicators
-                        pass
-                
-                # Other premium indicators in job title or description
-                premium_keywords = ['senior', 'lead', 'manager', 'director', 'architect']
-                title = job.get('title', '').lower()
-                if any(keyword in title for keyword in premium_keywords):
-                    is_premium = True
-                
-                # Filter based on subscription tier and premium status
-                if is_premium:
+                if is_premium_job(job):
                     premium_jobs.append((job, score))
                 else:
                     standard_jobs.append((job, score))
             
-            # Platinum and Master subscribers get more premium jobs
-            if subscription_tier == "Master":
-                # Master gets mostly premium jobs
-                premium_ratio = 0.8
-            elif subscription_tier == "Platinum":
-                # Platinum gets balanced premium/standard jobs
-                premium_ratio = 0.6
-            else:  # Golden
-                # Golden gets some premium jobs
-                premium_ratio = 0.4
-                
             # Calculate how many premium jobs to include
-            max_jobs = min(len(job_matches), 5)  # Cap at 5 jobs
+            max_jobs = min(len(job_matches), limit)
             premium_count = int(max_jobs * premium_ratio)
             standard_count = max_jobs - premium_count
             
-            # Combine premium and standard jobs based on calculated ratio
-            result = premium_jobs[:premium_count] + standard_jobs[:standard_count]
-            result.sort(key=lambda x: x[1], reverse=True)  # Sort by score descending
-            return result
-                
+            # Merge the two sorted parts by score, premium jobs first on ties
+            return list(heapq.merge(
+                premium_jobs[:premium_count], standard_jobs[:standard_count],
+                key=lambda x: x[1], reverse=True
+            ))
+        
         # For free tier, just return standard recommendations
-        return job_matches[:5]  # Cap at 5 jobs
+        return job_matches[:limit]
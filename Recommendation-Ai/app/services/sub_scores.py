@@ -0,0 +1,324 @@
+"""
+Vectorized recommendation sub-scores
+
+Computes the skills, experience, education and language sub-scores of
+RecommendationService for one portfolio against many job posts, or many
+portfolios against one job post, as NumPy operations.
+
+Portfolios are encoded as canonical skill-id sets, total experience years,
+highest education level and a language-level vector; job posts as required
+skill-id sets, required years, required education level and a language-level
+vector. Skill ids come from the canonical skill vocabulary, so skill matches
+are sparse set intersections, and the scores reproduce the per-pair methods
+exactly, including Python's round-half-to-even.
+"""
+import numpy as np
+from scipy import sparse
+from app.utils.skill_vocabulary import default_vocabulary
+
+# Score given when a sub-score cannot be computed, and the lowest partial score
+MIN_SCORE = 15
+
+# Education levels with corresponding values, as in _calculate_education_match
+EDUCATION_LEVELS = {
+    "high-school": 1,
+    "associate": 2,
+    "bachelor": 3,
+    "master": 4,
+    "phd": 5
+}
+
+# Proficiency levels with corresponding values, as in _calculate_language_match
+PROFICIENCY_LEVELS = {
+    "basic": 1,
+    "intermediate": 2,
+    "advanced": 3,
+    "fluent": 4,
+    "native": 5
+}
+
+# Weights of the sub-scores in the global score
+SCORE_WEIGHTS = {'skills': 0.4, 'experience': 0.3, 'education': 0.2, 'language': 0.1}
+
+
+def _partial_score(ratio):
+    """max(15, min(100, round(ratio * 100))) over an array"""
+    return np.clip(np.rint(ratio * 100), MIN_SCORE, 100)
+
+
+def language_levels(languages):
+    """{name: level} of a language list; later duplicates win, as in the dict comprehension of the service"""
+    return {
+        lang["name"].lower(): PROFICIENCY_LEVELS.get(lang.get("level", "").lower(), 0)
+        for lang in languages or []
+    }
+
+
+def highest_education_level(educations):
+    """Highest education level found in the degree names, 0 if none"""
+    highest = 0
+    for education in educations or []:
+        degree = education.get("degree", "").lower()
+        for level, value in EDUCATION_LEVELS.items():
+            if level in degree:
+                highest = max(highest, value)
+    return highest
+
+
+class _NameIds(dict):
+    """Ids of distinct strings, in order of first appearance"""
+
+    def id(self, value):
+        return self.setdefault(value, len(self))
+
+    def values_by_id(self):
+        return list(self)
+
+
+class PortfolioEncoding:
+    """Array form of the portfolio fields used by the sub-scores"""
+
+    def __init__(self, portfolios, vocabulary=None):
+        """
+        Parameters:
+        - portfolios: Portfolio documents (None counts as an empty portfolio)
+        - vocabulary: SkillVocabulary assigning skill ids (default: the process vocabulary)
+        """
+        portfolios = [portfolio or {} for portfolio in portfolios]
+        count = len(portfolios)
+        vocabulary = vocabulary or default_vocabulary()
+
+        # Skill-id sets as a CSR matrix: one row per portfolio, one column per canonical skill
+        indptr = [0]
+        indices = []
+        for portfolio in portfolios:
+            indices.extend(vocabulary.skill_ids(portfolio.get("skills") or []))
+            indptr.append(len(indices))
+        self.skill_sets = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int64), indices, indptr), shape=(count, len(vocabulary))
+        )
+        self.has_skills = np.array([bool(portfolio.get("skills")) for portfolio in portfolios], dtype=bool)
+        # Skills outside the vocabulary, compared by canonical name
+        self.unknown_skills = [frozenset(vocabulary.unknown_names(portfolio.get("skills"))) for portfolio in portfolios]
+
+        # Experience: total years
+        self.has_experience = np.array([bool(portfolio.get("experience")) for portfolio in portfolios], dtype=bool)
+        self.experience_years = np.array(
+            [sum(exp.get("years", 0) for exp in portfolio.get("experience") or []) for portfolio in portfolios],
+            dtype=np.float64
+        )
+
+        # Education: highest level found in a degree name
+        self.has_education = np.array([bool(portfolio.get("education")) for portfolio in portfolios], dtype=bool)
+        self.education_level = np.array(
+            [highest_education_level(portfolio.get("education")) for portfolio in portfolios], dtype=np.int64
+        )
+
+        # Languages: level per distinct language name, 0 when not spoken
+        self.has_languages = np.array([bool(portfolio.get("languages")) for portfolio in portfolios], dtype=bool)
+        self.languages = _NameIds()
+        levels = [
+            [(self.languages.id(name), level) for name, level in language_levels(portfolio.get("languages")).items()]
+            for portfolio in portfolios
+        ]
+        self.language_levels = np.zeros((count, len(self.languages)), dtype=np.int64)
+        for row, portfolio_levels in enumerate(levels):
+            for language, level in portfolio_levels:
+                self.language_levels[row, language] = level
+
+    def __len__(self):
+        return len(self.has_skills)
+
+
+class JobSetEncoding:
+    """Array form of the job fields used by the sub-scores"""
+
+    def __init__(self, jobs, vocabulary=None):
+        """
+        Parameters:
+        - jobs: Job post documents
+        - vocabulary: SkillVocabulary assigning skill ids (default: the process vocabulary)
+        """
+        count = len(jobs)
+        vocabulary = vocabulary or default_vocabulary()
+
+        # Required skill-id sets as a CSC matrix: one row per canonical skill, one column per job
+        indptr = [0]
+        indices = []
+        for job in jobs:
+            indices.extend(vocabulary.skill_ids(job.get("requirements") or []))
+            indptr.append(len(indices))
+        self.requirement_sets = sparse.csc_matrix(
+            (np.ones(len(indices), dtype=np.int64), indices, indptr), shape=(len(vocabulary), count)
+        )
+        # Requirements outside the vocabulary (jobs not in the index) are compared by canonical name
+        self.unknown_requirements = [vocabulary.unknown_names(job.get("requirements")) for job in jobs]
+        self.requirement_counts = np.diff(np.asarray(indptr, dtype=np.int64)) + \
+            np.array([len(names) for names in self.unknown_requirements], dtype=np.int64)
+
+        # Experience: jobs without the field keep the default score
+        self.has_years_required = np.array(["yearsOfExperienceRequired" in job for job in jobs], dtype=bool)
+        self.years_required = np.array(
+            [job.get("yearsOfExperienceRequired", 0) for job in jobs], dtype=np.float64
+        )
+
+        # Education
+        self.has_education_required = np.array(["requiredEducationLevel" in job for job in jobs], dtype=bool)
+        self.education_required = np.array(
+            [EDUCATION_LEVELS.get(job.get("requiredEducationLevel", "").lower(), 0) for job in jobs],
+            dtype=np.int64
+        )
+
+        # Languages: required level per distinct language name, 0 when not required
+        self.has_languages_required = np.array([bool(job.get("requiredLanguages")) for job in jobs], dtype=bool)
+        self.languages = _NameIds()
+        levels = [
+            [(self.languages.id(name), level) for name, level in language_levels(job.get("requiredLanguages")).items()]
+            for job in jobs
+        ]
+        self.language_levels = np.zeros((len(self.languages), count), dtype=np.int64)
+        for column, job_levels in enumerate(levels):
+            for language, level in job_levels:
+                self.language_levels[language, column] = level
+
+    def __len__(self):
+        return len(self.has_years_required)
+
+
+def score_matrix(portfolios, jobs):
+    """
+    Compute the four sub-scores and the global score for every portfolio/job pair
+
+    Parameters:
+    - portfolios: PortfolioEncoding, or a list of portfolio documents
+    - jobs: JobSetEncoding, or a list of job post documents
+
+    Returns a dict of (portfolios x jobs) int64 arrays: 'skills', 'experience',
+    'education', 'language' and 'global'
+    """
+    portfolios = portfolios if isinstance(portfolios, PortfolioEncoding) else PortfolioEncoding(portfolios)
+    jobs = jobs if isinstance(jobs, JobSetEncoding) else JobSetEncoding(jobs)
+
+    scores = {
+        'skills': _skills_scores(portfolios, jobs),
+        'experience': _experience_scores(portfolios, jobs),
+        'education': _education_scores(portfolios, jobs),
+        'language': _language_scores(portfolios, jobs)
+    }
+
+    # Same operation order as generate_recommendation, so the floats round identically
+    global_score = (
+        scores['skills'] * SCORE_WEIGHTS['skills'] +
+        scores['experience'] * SCORE_WEIGHTS['experience'] +
+        scores['education'] * SCORE_WEIGHTS['education'] +
+        scores['language'] * SCORE_WEIGHTS['language']
+    )
+    scores['global'] = np.rint(global_score).astype(np.int64)
+    return scores
+
+
+def score_portfolio_against_jobs(portfolio, jobs):
+    """
+    Sub-scores of one portfolio against many job posts
+
+    Parameters:
+    - portfolio: Portfolio document
+    - jobs: JobSetEncoding, or a list of job post documents
+
+    Returns a dict of int64 arrays with one entry per job, see score_matrix
+    """
+    return {name: values[0] for name, values in score_matrix([portfolio], jobs).items()}
+
+
+def score_portfolios_against_job(portfolios, job):
+    """
+    Sub-scores of many portfolios against one job post
+
+    Parameters:
+    - portfolios: PortfolioEncoding, or a list of portfolio documents
+    - job: Job post document
+
+    Returns a dict of int64 arrays with one entry per portfolio, see score_matrix
+    """
+    return {name: values[:, 0] for name, values in score_matrix(portfolios, [job]).items()}
+
+
+def _skills_scores(portfolios, jobs):
+    scores = np.full((len(portfolios), len(jobs)), MIN_SCORE, dtype=np.int64)
+    if not portfolios.has_skills.any() or not jobs.requirement_counts.any():
+        return scores
+
+    # Both encodings may predate skills the vocabulary learned since; the new ids are in neither set
+    skills = max(portfolios.skill_sets.shape[1], jobs.requirement_sets.shape[0])
+    skill_sets = sparse.csr_matrix(
+        (portfolios.skill_sets.data, portfolios.skill_sets.indices, portfolios.skill_sets.indptr),
+        shape=(len(portfolios), skills)
+    )
+    requirement_sets = sparse.csc_matrix(
+        (jobs.requirement_sets.data, jobs.requirement_sets.indices, jobs.requirement_sets.indptr),
+        shape=(skills, len(jobs))
+    )
+
+    # Shared canonical skills of every portfolio/job pair
+    matches = (skill_sets @ requirement_sets).toarray()
+    for column, names in enumerate(jobs.unknown_requirements):
+        for name in names:
+            matches[:, column] += [name in skills for skills in portfolios.unknown_skills]
+
+    scored = portfolios.has_skills[:, None] & (jobs.requirement_counts > 0)[None, :]
+    counts = np.broadcast_to(jobs.requirement_counts, scores.shape)
+    scores[scored] = _partial_score(matches[scored] / counts[scored])
+    return scores
+
+
+def _experience_scores(portfolios, jobs):
+    scores = np.full((len(portfolios), len(jobs)), MIN_SCORE, dtype=np.int64)
+
+    user_years = portfolios.experience_years[:, None]
+    required = np.broadcast_to(jobs.years_required, scores.shape)
+    applies = portfolios.has_experience[:, None] & jobs.has_years_required[None, :]
+
+    full_match = applies & ((required <= 0) | (user_years >= required))
+    partial = applies & ~full_match
+
+    scores[full_match] = 100
+    ratio = np.broadcast_to(user_years, scores.shape)[partial] / required[partial]
+    scores[partial] = _partial_score(ratio)
+    return scores
+
+
+def _education_scores(portfolios, jobs):
+    scores = np.full((len(portfolios), len(jobs)), 100, dtype=np.int64)
+
+    user_level = np.broadcast_to(portfolios.education_level[:, None], scores.shape)
+    required = np.broadcast_to(jobs.education_required, scores.shape)
+    applies = jobs.has_education_required[None, :] & (user_level < required)
+
+    partial = applies & (user_level > 0)
+    scores[partial] = _partial_score(user_level[partial] / required[partial])
+    scores[applies & (user_level == 0)] = MIN_SCORE
+
+    scores[~portfolios.has_education] = MIN_SCORE
+    return scores
+
+
+def _language_scores(portfolios, jobs):
+    scores = np.full((len(portfolios), len(jobs)), 100, dtype=np.int64)
+
+    # Align the portfolio language vectors on the job set's languages; unspoken languages count as 0
+    user_levels = np.zeros((len(portfolios), len(jobs.languages)), dtype=np.int64)
+    for name, column in jobs.languages.items():
+        if name in portfolios.languages:
+            user_levels[:, column] = portfolios.language_levels[:, portfolios.languages[name]]
+
+    required = jobs.language_levels
+    total_points = np.minimum(user_levels[:, :, None], required[None, :, :]).sum(axis=1)
+    possible_points = np.broadcast_to(required.sum(axis=0), scores.shape)
+
+    applies = np.broadcast_to(jobs.has_languages_required, scores.shape)
+    scored = applies & (possible_points > 0)
+    scores[applies] = MIN_SCORE
+    scores[scored] = _partial_score(total_points[scored] / possible_points[scored])
+
+    scores[~portfolios.has_languages] = MIN_SCORE
+    return scores
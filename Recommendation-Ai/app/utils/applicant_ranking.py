@@ -0,0 +1,335 @@
+"""
+Applicant ranking
+
+Keeps, for each job post, the portfolio scores of its applicants in a sorted
+list. Rank and percentile come from a binary search instead of rescoring and
+sorting every applicant on each request, and the table is updated one
+applicant at a time when an application arrives or a portfolio changes.
+
+Tables live in each worker process and only see the updates sent to that
+worker, so they are reloaded from the database once they are older than the
+ranking's time to live.
+"""
+import time
+import bisect
+import threading
+from collections import OrderedDict
+from bson.objectid import ObjectId
+from app.utils.portfolio_analyzer import PortfolioAnalyzer
+
+# Application statuses that no longer compete for the job
+INACTIVE_APPLICATION_STATUSES = ('Withdrawn',)
+
+# Fields read to score applicants
+RANKING_PORTFOLIO_PROJECTION = {
+    'userId': 1, 'skills': 1, 'projects': 1, 'certificates': 1, 'experience': 1, 'education': 1
+}
+RANKING_JOB_PROJECTION = {'requirements': 1, 'companyId': 1}
+
+
+def percentile_of(rank, total_applicants):
+    """Percentile of a rank among total_applicants, as computed by compare_portfolios"""
+    others = total_applicants - 1
+    percentile = ((others - rank + 1) / others) * 100 if others else 100
+    return round(percentile, 2)
+
+
+class ApplicantScoreTable:
+    """Applicant scores of one job post, sorted best first"""
+
+    def __init__(self, job):
+        self.job = job
+        self.loaded_at = time.time()
+        self._scores = {}
+        # (-score, user_id) ascending, so the best applicants come first
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._scores
+
+    def set_score(self, user_id, score):
+        """Insert an applicant or move them to their new score"""
+        self.remove(user_id)
+        self._scores[user_id] = score
+        bisect.insort(self._entries, (-score, user_id))
+
+    def remove(self, user_id):
+        score = self._scores.pop(user_id, None)
+        if score is None:
+            return False
+        del self._entries[bisect.bisect_left(self._entries, (-score, user_id))]
+        return True
+
+    def score(self, user_id):
+        return self._scores.get(user_id)
+
+    def user_ids(self):
+        return list(self._scores)
+
+    def rank_of_score(self, score):
+        """1 + the number of applicants with a strictly higher score"""
+        return bisect.bisect_left(self._entries, (-score, '')) + 1
+
+    def ranking(self, user_id):
+        """Ranking dict of an applicant, or None if they did not apply"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        rank = self.rank_of_score(score)
+        return {
+            'score': score,
+            'rank': rank,
+            'total_applicants': len(self._entries),
+            'percentile': percentile_of(rank, len(self._entries))
+        }
+
+    def top(self, limit):
+        """The best applicants as (user_id, score, rank) tuples"""
+        return [
+            (user_id, -negated_score, self.rank_of_score(-negated_score))
+            for negated_score, user_id in self._entries[:limit]
+        ]
+
+
+class ApplicantRanking:
+    """Per-job ApplicantScoreTables, loaded on first use and updated incrementally"""
+
+    def __init__(self, db, max_jobs=1000, ttl=60.0):
+        """
+        Parameters:
+        - db: Database connection
+        - max_jobs: Number of job tables kept in memory, least recently used are dropped
+        - ttl: Seconds a table is served before it is reloaded, so that applications
+          and withdrawals handled by other workers show up
+        """
+        self.db = db
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._tables = OrderedDict()
+        self._jobs_by_user = {}
+        # Job id -> lock held while its table is read from the database
+        self._loading = {}
+        # Jobs updated while their table was being read; such a table is not kept
+        self._stale_loads = set()
+        self._lock = threading.RLock()
+
+        self.loads = 0
+        self.updates = 0
+        self.expirations = 0
+
+    def table(self, job_id):
+        """Score table of a job post, or None if the job does not exist"""
+        job_id = str(job_id)
+        if not ObjectId.is_valid(job_id):
+            return None
+
+        with self._lock:
+            table = self._cached(job_id)
+            if table is not None:
+                return table
+            loading = self._loading.setdefault(job_id, threading.Lock())
+
+        # The queries run without the ranking lock, so requests for other jobs are
+        # not blocked; concurrent requests for this job wait for one load
+        with loading:
+            with self._lock:
+                table = self._cached(job_id)
+                if table is not None:
+                    return table
+
+            table = None
+            try:
+                table = self._load(job_id)
+            finally:
+                with self._lock:
+                    self._loading.pop(job_id, None)
+                    if table is not None and job_id not in self._stale_loads:
+                        self._insert(job_id, table)
+                    self._stale_loads.discard(job_id)
+            return table
+
+    def _insert(self, job_id, table):
+        """Keep a loaded table, dropping the least recently used ones. Called under the lock."""
+        self._drop(job_id)
+        self._tables[job_id] = table
+        for user_id in table.user_ids():
+            self._jobs_by_user.setdefault(user_id, set()).add(job_id)
+        while len(self._tables) > self.max_jobs:
+            self._drop(next(iter(self._tables)))
+
+    def _cached(self, job_id):
+        """Loaded table of a job that has not expired, or None. Called under the lock."""
+        table = self._tables.get(job_id)
+        if table is None:
+            return None
+        if table.loaded_at + self.ttl <= time.time():
+            self._drop(job_id)
+            self.expirations += 1
+            return None
+        self._tables.move_to_end(job_id)
+        return table
+
+    def _load(self, job_id):
+        """Score every active applicant of a job: one query per collection"""
+        job = self.db.jobposts.find_one({'_id': ObjectId(job_id)}, RANKING_JOB_PROJECTION)
+        if not job:
+            return None
+
+        applications = self.db.applications.find(
+            {'jobId': job['_id'], 'status': {'$nin': list(INACTIVE_APPLICATION_STATUSES)}},
+            {'userId': 1}
+        )
+        user_ids = list({application['userId'] for application in applications})
+        portfolios = self.db.portfolios.find({'userId': {'$in': user_ids}}, RANKING_PORTFOLIO_PROJECTION) if user_ids else []
+
+        table = ApplicantScoreTable(job)
+        for portfolio in portfolios:
+            table.set_score(str(portfolio['userId']), PortfolioAnalyzer.calculate_portfolio_score(portfolio, job))
+        with self._lock:
+            self.loads += 1
+        return table
+
+    def ranking(self, job_id, user_id):
+        """Rank and percentile of an applicant, or None if the job or application is unknown"""
+        table = self.table(job_id)
+        if table is None:
+            return None
+        with self._lock:
+            return table.ranking(str(user_id))
+
+    def top_applicants(self, job_id, limit=10):
+        """Best applicants of a job post, or None if the job does not exist"""
+        table = self.table(job_id)
+        if table is None:
+            return None
+        with self._lock:
+            return [
+                {'user_id': user_id, 'score': score, 'rank': rank}
+                for user_id, score, rank in table.top(limit)
+            ], len(table)
+
+    def add_application(self, job_id, user_id, portfolio=None):
+        """
+        Score a new applicant into a loaded job table
+
+        Parameters:
+        - portfolio: The applicant's portfolio, read from the database if omitted
+
+        Returns False if the job table is not loaded; it will include the applicant when loaded.
+        """
+        job_id, user_id = str(job_id), str(user_id)
+        if portfolio is None and not ObjectId.is_valid(user_id):
+            return False
+
+        with self._lock:
+            table = self._tables.get(job_id)
+            if table is None:
+                self._mark_stale_load(job_id)
+                return False
+
+        # Read and score outside the lock, which every job's ranking reads and writes wait on
+        if portfolio is None:
+            portfolio = self.db.portfolios.find_one({'userId': ObjectId(user_id)}, RANKING_PORTFOLIO_PROJECTION)
+        if not portfolio:
+            return False
+        score = PortfolioAnalyzer.calculate_portfolio_score(portfolio, table.job)
+
+        with self._lock:
+            if self._tables.get(job_id) is not table:
+                # Dropped or reloaded meanwhile: a reloaded table already includes the applicant
+                return False
+            table.set_score(user_id, score)
+            self._jobs_by_user.setdefault(user_id, set()).add(job_id)
+            self.updates += 1
+            return True
+
+    def remove_application(self, job_id, user_id):
+        """Drop a withdrawn application from a loaded job table"""
+        job_id, user_id = str(job_id), str(user_id)
+        with self._lock:
+            table = self._tables.get(job_id)
+            if table is None:
+                self._mark_stale_load(job_id)
+                return False
+            if not table.remove(user_id):
+                return False
+            self._discard_job_of_user(user_id, job_id)
+            self.updates += 1
+            return True
+
+    def refresh_user(self, user_id):
+        """Rescore an applicant in every loaded table after their portfolio changed"""
+        user_id = str(user_id)
+        if not ObjectId.is_valid(user_id):
+            return 0
+
+        with self._lock:
+            # The user may be an applicant of a job whose table is being read
+            self._stale_loads.update(self._loading)
+            tables = {job_id: self._tables[job_id] for job_id in self._jobs_by_user.get(user_id, ())}
+        if not tables:
+            return 0
+
+        # Read and score outside the lock, which every job's ranking reads and writes wait on
+        portfolio = self.db.portfolios.find_one({'userId': ObjectId(user_id)}, RANKING_PORTFOLIO_PROJECTION)
+        scores = {
+            job_id: PortfolioAnalyzer.calculate_portfolio_score(portfolio, table.job) if portfolio else None
+            for job_id, table in tables.items()
+        }
+
+        with self._lock:
+            updated = 0
+            for job_id, table in tables.items():
+                if self._tables.get(job_id) is not table:
+                    # Dropped or reloaded meanwhile: a reloaded table already has the new portfolio
+                    continue
+                if scores[job_id] is not None:
+                    table.set_score(user_id, scores[job_id])
+                else:
+                    table.remove(user_id)
+                    self._discard_job_of_user(user_id, job_id)
+                updated += 1
+            self.updates += updated
+            return updated
+
+    def invalidate_job(self, job_id):
+        """Drop the table of an edited or closed job post; it is rebuilt on next use"""
+        job_id = str(job_id)
+        with self._lock:
+            self._mark_stale_load(job_id)
+            return self._drop(job_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'jobs': len(self._tables),
+                'applicants': sum(len(table) for table in self._tables.values()),
+                'max_jobs': self.max_jobs,
+                'ttl': self.ttl,
+                'loads': self.loads,
+                'updates': self.updates,
+                'expirations': self.expirations
+            }
+
+    def _mark_stale_load(self, job_id):
+        """Do not keep the table of a job being read, it may miss an update. Called under the lock."""
+        if job_id in self._loading:
+            self._stale_loads.add(job_id)
+
+    def _drop(self, job_id):
+        table = self._tables.pop(job_id, None)
+        if table is None:
+            return False
+        for user_id in table.user_ids():
+            self._discard_job_of_user(user_id, job_id)
+        return True
+
+    def _discard_job_of_user(self, user_id, job_id):
+        job_ids = self._jobs_by_user.get(user_id)
+        if job_ids is not None:
+            job_ids.discard(job_id)
+            if not job_ids:
+                del self._jobs_by_user[user_id]
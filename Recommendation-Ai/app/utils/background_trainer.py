@@ -0,0 +1,221 @@
+"""
+Background success predictor trainer
+
+Collects labeled recommendation records and retrains the success predictor on
+a daemon thread, either every interval seconds or as soon as enough new labeled
+records arrived. A candidate model is validated on a held-out slice before it
+is swapped into the live PortfolioAnalyzer, so scoring requests never wait for
+a fit and never see a half-trained model.
+"""
+import os
+import time
+import threading
+from collections import deque
+import numpy as np
+
+
+class BackgroundTrainer:
+    """Daemon thread that retrains and swaps the analyzer's success predictor"""
+
+    def __init__(self, analyzer, interval=3600.0, threshold=10, min_samples=5,
+                 max_samples=50000, holdout_fraction=0.2, tolerance=0.02):
+        """
+        Parameters:
+        - analyzer: PortfolioAnalyzer whose success_predictor is replaced
+        - interval: Seconds between scheduled retraining checks
+        - threshold: Number of new labeled records that triggers retraining early
+        - min_samples: Minimum number of labeled records needed to train
+        - max_samples: Number of most recent labeled records kept for training
+        - holdout_fraction: Share of the most recent records used for validation
+        - tolerance: Accuracy the candidate may lose against the live model on the holdout
+        """
+        self.analyzer = analyzer
+        self.interval = interval
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.holdout_fraction = holdout_fraction
+        self.tolerance = tolerance
+
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._new_samples = 0
+
+        self.runs = 0
+        self.swaps = 0
+        self.rejections = 0
+        self.errors = 0
+        self.last_run = None
+
+    @classmethod
+    def from_env(cls, analyzer):
+        """Create a trainer configured from TRAINER_* environment variables"""
+        return cls(
+            analyzer,
+            interval=float(os.environ.get('TRAINER_INTERVAL', 3600)),
+            threshold=int(os.environ.get('TRAINER_THRESHOLD', 10)),
+            min_samples=int(os.environ.get('TRAINER_MIN_SAMPLES', 5))
+        )
+
+    @staticmethod
+    def record_features(record):
+        """
+        Extract the training row of a recorded recommendation
+
+        Returns (features, label), or None if the record cannot be used.
+        """
+        recommendation = record.get('recommendation') or {}
+        if not record.get('application_result') or 'portfolio_score' not in recommendation:
+            return None
+
+        features = [
+            recommendation['portfolio_score'],
+            recommendation.get('skill_match', 70),
+            recommendation.get('exp_score', 50)
+        ]
+        return features, 1 if record['application_result'] == 'Accepted' else 0
+
+    def add(self, record):
+        """Collect a recorded recommendation; unlabeled records are ignored"""
+        sample = self.record_features(record)
+        if sample is None:
+            return False
+
+        with self._lock:
+            self._samples.append(sample)
+            self._new_samples += 1
+            ready = self._new_samples >= self.threshold
+
+        self._ensure_started()
+        if ready:
+            self._wakeup.set()
+        return True
+
+    def stats(self):
+        """Counters describing the trainer state"""
+        with self._lock:
+            samples = len(self._samples)
+            pending = self._new_samples
+        return {
+            'samples': samples,
+            'pending_samples': pending,
+            'runs': self.runs,
+            'swaps': self.swaps,
+            'rejections': self.rejections,
+            'errors': self.errors,
+            'last_run': self.last_run,
+            'predictor_source': self.analyzer.predictor_source
+        }
+
+    def close(self, timeout=5.0):
+        """Stop the trainer thread"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='predictor-trainer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+
+            with self._lock:
+                if self._new_samples == 0:
+                    continue
+            self.train_now()
+
+    def train_now(self):
+        """
+        Train a candidate on the collected records and swap it in if it validates
+
+        Returns True if the live predictor was replaced.
+        """
+        with self._lock:
+            samples = list(self._samples)
+            self._new_samples = 0
+
+        if len(samples) < self.min_samples:
+            return False
+
+        started = time.time()
+        self.runs += 1
+        try:
+            X = np.array([features for features, _ in samples], dtype=np.float64)
+            y = np.array([label for _, label in samples], dtype=np.int8)
+
+            # The most recent records are held out to compare the candidate with the live model
+            holdout = int(len(y) * self.holdout_fraction)
+            if holdout and len(y) - holdout >= self.min_samples:
+                X_train, y_train, X_check, y_check = X[:-holdout], y[:-holdout], X[-holdout:], y[-holdout:]
+            else:
+                X_train, y_train, X_check, y_check = X, y, None, None
+
+            if len(np.unique(y_train)) < 2:
+                self._finish_run(started, 'rejected', "training records have a single outcome")
+                return False
+
+            candidate = self.analyzer.create_predictor()
+            candidate.fit(X_train, y_train)
+
+            accepted, reason = self._validate(candidate, X_check, y_check)
+            if not accepted:
+                self._finish_run(started, 'rejected', reason)
+                return False
+
+            # A single attribute assignment: requests in flight keep the model they started with
+            self.analyzer.success_predictor = candidate
+            self.analyzer.predictor_source = 'trained'
+            self.analyzer.save_predictor()
+            self._finish_run(started, 'swapped', reason, len(y_train))
+            return True
+        except Exception as e:
+            self.errors += 1
+            self._finish_run(started, 'error', str(e))
+            print(f"Error retraining success predictor: {str(e)}")
+            return False
+
+    def _validate(self, candidate, X_check, y_check):
+        """Check that the candidate is usable and not worse than the live model"""
+        if not self.analyzer.is_valid_predictor(candidate):
+            return False, "candidate is not a valid predictor"
+        if X_check is None:
+            return True, "no holdout available"
+
+        candidate_accuracy = float(np.mean(candidate.predict(X_check) == y_check))
+        live = self.analyzer.success_predictor
+        if not self.analyzer.is_valid_predictor(live):
+            return True, f"holdout accuracy {candidate_accuracy:.3f}"
+
+        live_accuracy = float(np.mean(live.predict(X_check).astype(np.int8) == y_check))
+        reason = f"holdout accuracy {candidate_accuracy:.3f} (live {live_accuracy:.3f})"
+        return candidate_accuracy >= live_accuracy - self.tolerance, reason
+
+    def _finish_run(self, started, outcome, reason, rows=None):
+        if outcome == 'swapped':
+            self.swaps += 1
+        elif outcome == 'rejected':
+            self.rejections += 1
+
+        self.last_run = {
+            'outcome': outcome,
+            'reason': reason,
+            'rows': rows,
+            'seconds': round(time.time() - started, 3),
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        print(f"Success predictor retraining {outcome}: {reason}")
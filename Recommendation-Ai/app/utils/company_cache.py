@@ -0,0 +1,81 @@
+"""
+Company cache
+
+Resolves company names for job posts with one $in query for all companies
+that are not cached yet, instead of one find_one per job.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+# Company fields returned with job recommendations
+COMPANY_PROJECTION = {'name': 1}
+
+
+class CompanyCache:
+    """In-process LRU cache of company documents with a time to live"""
+
+    def __init__(self, db, ttl=300.0, max_size=10000):
+        """
+        Parameters:
+        - db: Database connection
+        - ttl: Seconds a company is served from the cache
+        - max_size: Maximum number of cached companies
+        """
+        self.db = db
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, company_ids):
+        """
+        Return a dict of company id (as given) to company document
+
+        Companies that do not exist are left out.
+        """
+        now = time.time()
+        found = {}
+        missing = {}
+        with self._lock:
+            for company_id in company_ids:
+                key = str(company_id)
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    if entry[1] is not None:
+                        found[key] = entry[1]
+                    self.hits += 1
+                else:
+                    missing[key] = company_id
+
+        if missing:
+            self.misses += len(missing)
+            companies = self.db.companies.find({'_id': {'$in': list(missing.values())}}, COMPANY_PROJECTION)
+            fetched = {str(company['_id']): company for company in companies}
+
+            with self._lock:
+                # Unknown ids are cached as None so they are not looked up on every request
+                for key in missing:
+                    self._entries[key] = (now + self.ttl, fetched.get(key))
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            found.update(fetched)
+
+        return {company_id: found[str(company_id)] for company_id in company_ids if str(company_id) in found}
+
+    def invalidate(self, company_id=None):
+        """Forget one company, or all of them"""
+        with self._lock:
+            if company_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(company_id), None)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {'size': size, 'hits': self.hits, 'misses': self.misses}
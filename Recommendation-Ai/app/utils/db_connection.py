@@ -2,6 +2,15 @@ from pymongo import MongoClient
 import os
 import sys
 from collections import defaultdict
+from app.utils.mongo_stats import command_stats_listener
+
+class MockCursor(list):
+    """Mock cursor: a list that also supports the chained cursor methods"""
+    def limit(self, n):
+        return MockCursor(self[:n])
+    
+    def batch_size(self, n):
+        return self
 
 class MockCollection:
     """Mock collection for testing without MongoDB connection"""
@@ -9,6 +18,20 @@ class MockCollection:
         self.name = name
         self.data = []
     
+    @staticmethod
+    def _matches(doc, query):
+        """Match a document on equality, $in and $nin conditions"""
+        for key, value in query.items():
+            if isinstance(value, dict) and '$in' in value:
+                if doc.get(key) not in value['$in']:
+                    return False
+            elif isinstance(value, dict) and '$nin' in value:
+                if doc.get(key) in value['$nin']:
+                    return False
+            elif key not in doc or doc[key] != value:
+                return False
+        return True
+    
     def find_one(self, query=None, *args, **kwargs):
         """Simple mock implementation of find_one"""
         if not self.data:
@@ -19,12 +42,7 @@ class MockCollection:
             
         # Very simple query matching
         for doc in self.data:
-            match = True
-            for key, value in query.items():
-                if key not in doc or doc[key] != value:
-                    match = False
-                    break
-            if match:
+            if self._matches(doc, query):
                 return doc
         return None
     
@@ -37,19 +55,10 @@ class MockCollection:
             
         # Very simple query matching
         for doc in self.data:
-            match = True
-            for key, value in query.items():
-                if key not in doc or doc[key] != value:
-                    match = False
-                    break
-            if match:
+            if self._matches(doc, query):
                 results.append(doc)
         
-        # Mock cursor with list() function
-        results.list = lambda: results
-        # Add limit function to the results list
-        results.limit = lambda n: results[:n] if len(results) > n else results
-        return results
+        return MockCursor(results)
     
     def insert_one(self, document):
         """Mock insert_one"""
@@ -62,6 +71,16 @@ class MockCollection:
             self.data.append(doc)
         return type('obj', (object,), {'inserted_ids': [doc.get('_id') for doc in documents]})
     
+    def replace_one(self, query, document, upsert=False):
+        """Mock replace_one"""
+        for index, doc in enumerate(self.data):
+            if self._matches(doc, query):
+                self.data[index] = dict(document, _id=doc.get('_id'))
+                return type('obj', (object,), {'matched_count': 1, 'upserted_id': None})
+        if upsert:
+            self.data.append(dict(document, **{key: value for key, value in query.items() if not isinstance(value, dict)}))
+        return type('obj', (object,), {'matched_count': 0, 'upserted_id': query.get('_id') if upsert else None})
+    
     def count_documents(self, query=None):
         """Mock count_documents"""
         if query is None:
@@ -69,12 +88,7 @@ class MockCollection:
         
         count = 0
         for doc in self.data:
-            match = True
-            for key, value in query.items():
-                if key not in doc or doc[key] != value:
-                    match = False
-                    break
-            if match:
+            if self._matches(doc, query):
                 count += 1
         return count
 
@@ -95,6 +109,10 @@ class MockDatabase:
         """Allow attribute access for collection names"""
         return self._collections[name]
     
+    def __getitem__(self, name):
+        """Allow item access for collection names"""
+        return self._collections[name]
+    
     def list_collection_names(self):
         """Return list of collection names"""
         return list(self._collections.keys())
@@ -113,8 +131,8 @@ def get_db_connection():
         # Get MongoDB connection string from environment variable or use default
         mongo_uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
         
-        # Create MongoDB client with a timeout
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+        # Create MongoDB client with a timeout; the listener counts round trips and bytes per request
+        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000, event_listeners=[command_stats_listener])
         
         # Verify connection by getting server info
         client.server_info()
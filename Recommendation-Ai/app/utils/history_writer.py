@@ -0,0 +1,230 @@
+"""
+Recommendation history writer
+
+Appends recommendation records to size-capped JSONL segment files from a
+background thread, so the request path only pays for an in-memory enqueue.
+"""
+import os
+import gzip
+import json
+import glob
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+
+# Policies applied when the queue is full
+OVERFLOW_POLICIES = ('drop', 'block')
+
+# When segment files are fsynced: after every batch, at most every fsync_interval seconds, or never
+FSYNC_POLICIES = ('batch', 'interval', 'never')
+
+
+class HistoryWriter:
+    """Background writer for rotating, append-only JSONL history segments"""
+
+    def __init__(self, directory, prefix='recommendations', segment_max_bytes=10 * 1024 * 1024,
+                 max_segments=None, compress=False, fsync_policy='interval', fsync_interval=5.0,
+                 queue_size=10000, overflow_policy='drop', block_timeout=0.5,
+                 batch_size=500, flush_interval=1.0):
+        """
+        Parameters:
+        - directory: Directory holding the segment files
+        - prefix: File name prefix of the segments
+        - segment_max_bytes: Uncompressed size at which a new segment is started
+        - max_segments: Number of segments kept in the directory (None keeps all)
+        - compress: Write gzip-compressed segments
+        - fsync_policy: One of FSYNC_POLICIES
+        - fsync_interval: Seconds between fsyncs with the 'interval' policy
+        - queue_size: Maximum number of records waiting to be written
+        - overflow_policy: 'drop' new records or 'block' the caller when the queue is full
+        - block_timeout: Seconds a caller waits with the 'block' policy before the record is dropped
+        - batch_size: Maximum number of records written per batch
+        - flush_interval: Seconds the writer waits for more records before writing a batch
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {OVERFLOW_POLICIES}")
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {FSYNC_POLICIES}")
+
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_max_bytes = segment_max_bytes
+        self.max_segments = max_segments
+        self.compress = compress
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self._segment = None
+        self._segment_path = None
+        self._segment_bytes = 0
+        self._segment_count = 0
+        self._last_fsync = time.time()
+
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls, directory):
+        """Create a writer configured from HISTORY_* environment variables"""
+        max_segments = os.environ.get('HISTORY_MAX_SEGMENTS')
+        return cls(
+            directory,
+            segment_max_bytes=int(os.environ.get('HISTORY_SEGMENT_MAX_BYTES', 10 * 1024 * 1024)),
+            max_segments=int(max_segments) if max_segments else None,
+            compress=os.environ.get('HISTORY_COMPRESS', 'False').lower() == 'true',
+            fsync_policy=os.environ.get('HISTORY_FSYNC', 'interval'),
+            queue_size=int(os.environ.get('HISTORY_QUEUE_SIZE', 10000)),
+            overflow_policy=os.environ.get('HISTORY_OVERFLOW', 'drop')
+        )
+
+    def submit(self, record):
+        """
+        Queue a record for writing
+
+        Returns False if the record was dropped because the queue is full.
+        """
+        self._ensure_started()
+        try:
+            if self.overflow_policy == 'block':
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stats(self):
+        """Counters describing the writer state"""
+        return {
+            'written': self.written,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'queued': self._queue.qsize(),
+            'current_segment': os.path.basename(self._segment_path) if self._segment_path else None
+        }
+
+    def close(self, timeout=5.0):
+        """Write the queued records and close the current segment"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._write_batch(batch)
+            elif self._stopped.is_set():
+                break
+            self._maybe_fsync()
+
+        self._close_segment()
+
+    def _next_batch(self):
+        """Wait for a record, then drain up to batch_size records"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        try:
+            for record in batch:
+                line = (json.dumps(record, default=str) + "\n").encode('utf-8')
+                if self._segment is None or (self._segment_bytes and self._segment_bytes + len(line) > self.segment_max_bytes):
+                    self._rotate()
+
+                self._segment.write(line)
+                self._segment_bytes += len(line)
+                self.written += 1
+
+            self._segment.flush()
+
+            if self.fsync_policy == 'batch':
+                self._fsync()
+        except Exception as e:
+            self.errors += 1
+            print(f"Error writing recommendation history: {str(e)}")
+
+    def _rotate(self):
+        """Close the current segment and start a new one"""
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Process id and sequence number keep segment names unique across workers
+        self._segment_count += 1
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        suffix = '.jsonl.gz' if self.compress else '.jsonl'
+        filename = f"{self.prefix}_{timestamp}_{os.getpid()}_{self._segment_count:04d}{suffix}"
+        self._segment_path = os.path.join(self.directory, filename)
+        self._segment = gzip.open(self._segment_path, 'ab') if self.compress else open(self._segment_path, 'ab')
+        self._segment_bytes = 0
+
+        self._apply_retention()
+
+    def _apply_retention(self):
+        """Delete the oldest segments beyond max_segments"""
+        if not self.max_segments:
+            return
+        segments = sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}_*.jsonl*")), key=os.path.getmtime)
+        for path in segments[:-self.max_segments]:
+            if path != self._segment_path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _maybe_fsync(self):
+        if self.fsync_policy == 'interval' and time.time() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+
+    def _fsync(self):
+        if self._segment is None:
+            return
+        raw = self._segment.fileobj if self.compress else self._segment
+        os.fsync(raw.fileno())
+        self._last_fsync = time.time()
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        try:
+            self._segment.flush()
+            if self.fsync_policy != 'never':
+                self._fsync()
+            self._segment.close()
+        except Exception as e:
+            print(f"Error closing recommendation history segment: {str(e)}")
+        self._segment = None
@@ -0,0 +1,507 @@
+"""
+Job embedding index
+
+Keeps the TF-IDF rows of every open job post in one sparse matrix together with
+a row-to-job-id map and the per-job features used for scoring. The index is
+saved next to skill_vectorizer.joblib and memory-mapped back at startup, so job
+posts are only vectorized when they are inserted, edited or closed.
+
+An inverted index from canonical skill id to job rows narrows each request down
+to the jobs sharing skills with the portfolio before anything is scored.
+"""
+import os
+import glob
+import hashlib
+import threading
+from itertools import chain
+from contextlib import contextmanager
+from datetime import datetime
+import joblib
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+from app.utils.skill_vocabulary import default_vocabulary
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Job statuses that take a job post out of the index
+CLOSED_JOB_STATUSES = {'closed', 'inactive', 'archived', 'filled'}
+
+# Query excluding closed job posts; status values are matched in their usual spellings
+OPEN_JOBS_QUERY = {'status': {'$nin': sorted(
+    spelling for status in CLOSED_JOB_STATUSES for spelling in (status, status.capitalize(), status.upper())
+)}}
+
+# Job fields kept in the index so results can be returned without going back to Mongo
+JOB_FIELDS = ['title', 'requirements', 'location', 'workplaceType', 'salaryRange', 'companyId']
+
+# Fields read from Mongo when (re)indexing job posts
+JOB_PROJECTION = {field: 1 for field in JOB_FIELDS + ['description', 'status']}
+
+# Jobs paying more than this at the top of their salary range are premium
+PREMIUM_SALARY_THRESHOLD = 80000
+
+# Title words marking a premium job
+PREMIUM_TITLE_KEYWORDS = ['senior', 'lead', 'manager', 'director', 'architect']
+
+
+def is_job_open(job):
+    """Return True if a job post should be recommended"""
+    return str(job.get('status') or 'open').lower() not in CLOSED_JOB_STATUSES
+
+
+class CandidatePolicy:
+    """How many jobs the skill index hands to the scorer, and when to scan everything instead"""
+
+    def __init__(self, enabled=False, min_overlap=1, max_candidates=500, min_candidates=20):
+        """
+        Parameters:
+        - enabled: Generate candidates from the skill index; False always scores every job.
+          Off by default: jobs sharing no skill with the portfolio can still rank in the top
+          matches through title and experience similarity, and candidates leave them out
+        - min_overlap: Skills a job must share with the portfolio to be a candidate
+        - max_candidates: Keep only this many candidates, those with the most shared skills (0: no cap)
+        - min_candidates: Recall guard; with fewer candidates than this (or than the requested
+          limit) every job is scored
+        """
+        self.enabled = enabled
+        self.min_overlap = max(1, min_overlap)
+        self.max_candidates = max_candidates
+        self.min_candidates = min_candidates
+
+    @classmethod
+    def from_env(cls):
+        """Create a policy configured from the CANDIDATE_* environment variables"""
+        return cls(
+            enabled=os.environ.get('CANDIDATE_GENERATION', 'false').lower() in ('1', 'true', 'yes'),
+            min_overlap=int(os.environ.get('CANDIDATE_MIN_OVERLAP', 1)),
+            max_candidates=int(os.environ.get('CANDIDATE_MAX_JOBS', 500)),
+            min_candidates=int(os.environ.get('CANDIDATE_MIN_JOBS', 20))
+        )
+
+
+def parse_max_salary(salary_range):
+    """Top of a salary range such as "$80K-100K" or "80,000-100,000", or None if it cannot be read"""
+    if not salary_range or not isinstance(salary_range, str):
+        return None
+    salary_text = salary_range.replace('$', '').replace(',', '').lower()
+    try:
+        # K notation ("80K-100K") or full numbers
+        return float(salary_text.split('-')[-1].replace('k', '000'))
+    except ValueError:
+        return None
+
+
+def derive_job_fields(job):
+    """
+    Fields derived once per job post for tier-aware selection
+
+    Returns {'maxSalary': float or None, 'isPremium': bool}; a job is premium when
+    its salary range tops PREMIUM_SALARY_THRESHOLD or its title has a premium keyword.
+    """
+    max_salary = parse_max_salary(job.get('salaryRange'))
+    title = (job.get('title') or '').lower()
+    return {
+        'maxSalary': max_salary,
+        'isPremium': bool(
+            (max_salary is not None and max_salary > PREMIUM_SALARY_THRESHOLD)
+            or any(keyword in title for keyword in PREMIUM_TITLE_KEYWORDS)
+        )
+    }
+
+
+def is_premium_job(job):
+    """Premium flag of a job, precomputed by the index or derived from a raw job post"""
+    if 'isPremium' in job:
+        return job['isPremium']
+    return derive_job_fields(job)['isPremium']
+
+
+def vectorizer_fingerprint(vectorizer):
+    """Identify a fitted vectorizer so an index built with another one is never reused"""
+    digest = hashlib.sha1()
+    for term, column in sorted(vectorizer.vocabulary_.items()):
+        digest.update(f"{term}:{column};".encode('utf-8'))
+    digest.update(np.asarray(vectorizer.idf_).tobytes())
+    return digest.hexdigest()
+
+
+class JobEmbeddingIndex:
+    """Precomputed, row-normalized TF-IDF matrix and features for all open job posts"""
+
+    # Directory holding the index, inside PortfolioAnalyzer.MODEL_PATH
+    DIR_NAME = 'job_index'
+
+    def __init__(self, analyzer, matrix, jobs, features, fingerprint):
+        """
+        Parameters:
+        - analyzer: PortfolioAnalyzer used to embed and featurize job posts
+        - matrix: CSR matrix with one normalized TF-IDF row per job
+        - jobs: Trimmed job documents, one per row
+        - features: Precomputed job features, one per row
+        - fingerprint: Fingerprint of the vectorizer that produced the matrix
+        """
+        self.analyzer = analyzer
+        self.fingerprint = fingerprint
+        self._lock = threading.RLock()
+        self._base_matrix = matrix
+        self._new_rows = []
+        self._matrix = matrix
+        self.jobs = list(jobs)
+        self.features = list(features)
+        self.active = np.ones(len(self.jobs), dtype=bool)
+        self.row_by_job_id = {str(job['_id']): row for row, job in enumerate(self.jobs)}
+        self.loaded_mtime = None
+        # Incremented on every change, so save only adopts the saved files if nothing changed meanwhile
+        self._revision = 0
+
+        # Inverted index: canonical skill id -> rows requiring it; rows without known skills are kept
+        # apart so candidate generation never hides them. Retired rows stay listed until the next save
+        # and are filtered through the active mask.
+        self._skill_rows = {}
+        self._rows_without_skills = []
+        for row, job in enumerate(self.jobs):
+            self._index_skills(row, job)
+
+        self.candidate_policy = CandidatePolicy.from_env()
+        self.candidate_stats = {'requests': 0, 'full_scans': 0, 'candidates': 0}
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    @staticmethod
+    def default_path(analyzer):
+        """Index directory next to the persisted vectorizer"""
+        return os.path.join(analyzer.MODEL_PATH, JobEmbeddingIndex.DIR_NAME)
+
+    @staticmethod
+    def _trim_job(job):
+        """Keep only the job fields needed to score and return a job, plus its derived fields"""
+        trimmed = {'_id': job['_id']}
+        for field in JOB_FIELDS:
+            if field in job:
+                trimmed[field] = job[field]
+        trimmed.update(derive_job_fields(job))
+        return trimmed
+
+    @classmethod
+    def _embed(cls, analyzer, jobs):
+        """Embed and featurize job posts, skipping the ones that cannot be embedded"""
+        embedded_jobs, matrix = analyzer.generate_job_embeddings(jobs)
+        if not embedded_jobs:
+            return [], sp.csr_matrix((0, len(analyzer.skill_vectorizer.vocabulary_))), []
+
+        features = [analyzer.precompute_job_features(job, add_skills=True) for job in embedded_jobs]
+        return [cls._trim_job(job) for job in embedded_jobs], normalize(matrix).tocsr(), features
+
+    @classmethod
+    def build(cls, db, analyzer):
+        """Build the index from all open job posts in the database"""
+        fingerprint = vectorizer_fingerprint(analyzer.skill_vectorizer)
+        jobs = [job for job in db.jobposts.find(OPEN_JOBS_QUERY, JOB_PROJECTION) if is_job_open(job)]
+        trimmed_jobs, matrix, features = cls._embed(analyzer, jobs)
+
+        index = cls(analyzer, matrix, trimmed_jobs, features, fingerprint)
+        print(f"Built job index with {len(index)} jobs")
+        return index
+
+    @staticmethod
+    @contextmanager
+    def locked(path):
+        """
+        Hold an exclusive lock on the saved index across worker processes
+
+        Workers changing the index reload the saved one, apply their change and
+        save it while holding the lock, so no worker overwrites the jobs saved
+        by another.
+        """
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'index.lock'), 'a+') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def save(self, path):
+        """
+        Save the index, dropping closed rows, in a memory-mappable layout
+
+        Callers sharing the index directory with other workers hold locked(path).
+
+        Afterwards the index serves the saved files through memory maps, so the
+        rows it added in memory stop taking private RAM in this worker.
+        """
+        with self._lock:
+            revision = self._revision
+            rows = np.flatnonzero(self.active)
+            matrix = self._materialize()[rows].tocsr()
+            jobs = [self.jobs[row] for row in rows]
+            features = [self.features[row] for row in rows]
+
+        os.makedirs(path, exist_ok=True)
+
+        # Arrays get new file names on every save so that files still memory-mapped
+        # by running workers are never overwritten; the metadata is swapped in last
+        generation = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        for name in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(path, f"{name}-{generation}.npy"), getattr(matrix, name))
+
+        meta = {
+            'generation': generation,
+            'shape': matrix.shape,
+            'job_ids': [str(job['_id']) for job in jobs],
+            'jobs': jobs,
+            'features': features,
+            'fingerprint': self.fingerprint
+        }
+        tmp_path = os.path.join(path, 'meta.tmp.joblib')
+        joblib.dump(meta, tmp_path)
+        os.replace(tmp_path, os.path.join(path, 'meta.joblib'))
+        self.loaded_mtime = os.path.getmtime(os.path.join(path, 'meta.joblib'))
+
+        with self._lock:
+            if self._revision == revision:
+                self._adopt(self.load(path, self.analyzer))
+
+        # Remove arrays of older generations; files still mapped elsewhere are left for later
+        for stale_path in glob.glob(os.path.join(path, '*.npy')):
+            if not stale_path.endswith(f"-{generation}.npy"):
+                try:
+                    os.remove(stale_path)
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, path, analyzer):
+        """Load a saved index, memory-mapping the matrix arrays"""
+        meta_path = os.path.join(path, 'meta.joblib')
+        mtime = os.path.getmtime(meta_path)
+        meta = joblib.load(meta_path)
+
+        data, indices, indptr = (
+            np.load(os.path.join(path, f"{name}-{meta['generation']}.npy"), mmap_mode='r')
+            for name in ('data', 'indices', 'indptr')
+        )
+        matrix = sp.csr_matrix((data, indices, indptr), shape=meta['shape'], copy=False)
+
+        # Bitsets are rebuilt from the requirements: the saved vocabulary may not hold the skills
+        # of jobs indexed since, which are added here in index order
+        vocabulary = default_vocabulary()
+        features = [
+            dict(features, requirement_bits=vocabulary.skills_bitset(job.get('requirements', []), add=True))
+            for features, job in zip(meta['features'], meta['jobs'])
+        ]
+
+        # Indexes saved before the derived fields existed get them on load
+        jobs = [job if 'isPremium' in job else dict(job, **derive_job_fields(job)) for job in meta['jobs']]
+
+        index = cls(analyzer, matrix, jobs, features, meta['fingerprint'])
+        index.loaded_mtime = mtime
+        return index
+
+    @classmethod
+    def load_or_build(cls, db, analyzer, path=None):
+        """
+        Load the saved index if it was built with the current vectorizer,
+        otherwise build it from the database
+
+        Returns None if the vectorizer is not fitted yet.
+        """
+        path = path or cls.default_path(analyzer)
+        try:
+            fingerprint = vectorizer_fingerprint(analyzer.skill_vectorizer)
+        except AttributeError:
+            print("Job index unavailable: the skill vectorizer is not fitted")
+            return None
+
+        if os.path.exists(os.path.join(path, 'meta.joblib')):
+            try:
+                index = cls.load(path, analyzer)
+                if index.fingerprint == fingerprint:
+                    print(f"Loaded job index with {len(index)} jobs from {path}")
+                    return index
+                print("Job index was built with another vectorizer, rebuilding")
+            except Exception as e:
+                print(f"Error loading job index: {str(e)}")
+
+        try:
+            return cls.build(db, analyzer)
+        except Exception as e:
+            print(f"Error building job index: {str(e)}")
+            return None
+
+    def reload_if_changed(self, path=None):
+        """Pick up an index saved by another worker process"""
+        path = path or self.default_path(self.analyzer)
+        meta_path = os.path.join(path, 'meta.joblib')
+        try:
+            mtime = os.path.getmtime(meta_path)
+        except OSError:
+            return False
+
+        if self.loaded_mtime is not None and mtime <= self.loaded_mtime:
+            return False
+
+        try:
+            fresh = self.load(path, self.analyzer)
+        except Exception as e:
+            print(f"Error reloading job index: {str(e)}")
+            return False
+        if fresh.fingerprint != self.fingerprint:
+            return False
+
+        with self._lock:
+            self._adopt(fresh)
+        print(f"Reloaded job index with {len(self)} jobs")
+        return True
+
+    def _adopt(self, fresh):
+        """Take over the rows of a freshly loaded index"""
+        self._base_matrix = fresh._base_matrix
+        self._new_rows = []
+        self._matrix = fresh._matrix
+        self.jobs = fresh.jobs
+        self.features = fresh.features
+        self.active = fresh.active
+        self.row_by_job_id = fresh.row_by_job_id
+        self._skill_rows = fresh._skill_rows
+        self._rows_without_skills = fresh._rows_without_skills
+        self.loaded_mtime = fresh.loaded_mtime
+        self._revision += 1
+
+    def _index_skills(self, row, job):
+        """Add a row to the postings of the canonical skills its job requires"""
+        skill_ids = default_vocabulary().skill_ids(job.get('requirements') or [], add=True)
+        if not skill_ids:
+            self._rows_without_skills.append(row)
+        for skill_id in skill_ids:
+            self._skill_rows.setdefault(skill_id, []).append(row)
+
+    def _materialize(self):
+        """Stack the base matrix and the rows added since it was built"""
+        if self._matrix is None:
+            self._matrix = sp.vstack([self._base_matrix] + self._new_rows, format='csr')
+        return self._matrix
+
+    def snapshot(self):
+        """
+        Return a consistent view of the index for scoring
+
+        Returns (matrix, rows, jobs, features) where rows are the active row numbers.
+        """
+        with self._lock:
+            return self._materialize(), np.flatnonzero(self.active), self.jobs, self.features
+
+    def candidate_snapshot(self, skill_ids, limit=0):
+        """
+        Like snapshot, but with only the rows worth scoring for a portfolio
+
+        Candidates are the active jobs sharing at least min_overlap of the given
+        canonical skill ids, capped to the max_candidates with the most shared
+        skills, plus the jobs whose requirements name no known skill. The work
+        is proportional to the postings of the portfolio's skills, not to the
+        number of indexed jobs. When candidate generation is disabled, the
+        portfolio has no indexed skill, or fewer candidates than the recall
+        guard (or than limit) are found, every active row is returned.
+
+        Returns (matrix, rows, jobs, features, full_scan).
+        """
+        policy = self.candidate_policy
+        with self._lock:
+            self.candidate_stats['requests'] += 1
+            rows = self._candidate_rows(skill_ids, policy) if policy.enabled else None
+            if rows is None or len(rows) < max(policy.min_candidates, limit):
+                rows = np.flatnonzero(self.active)
+                self.candidate_stats['full_scans'] += 1
+                full_scan = True
+            else:
+                full_scan = False
+            self.candidate_stats['candidates'] += len(rows)
+            return self._materialize(), rows, self.jobs, self.features, full_scan
+
+    def _candidate_rows(self, skill_ids, policy):
+        """Sorted active rows sharing enough skills, or None if no skill of the portfolio is indexed"""
+        postings = [self._skill_rows[skill_id] for skill_id in set(skill_ids) if skill_id in self._skill_rows]
+        if not postings:
+            return None
+
+        rows, overlaps = np.unique(
+            np.fromiter(chain.from_iterable(postings), dtype=np.int64, count=sum(len(p) for p in postings)),
+            return_counts=True
+        )
+        keep = self.active[rows] & (overlaps >= policy.min_overlap)
+        rows, overlaps = rows[keep], overlaps[keep]
+
+        if policy.max_candidates and len(rows) > policy.max_candidates:
+            # Jobs sharing the most skills; ties at the cut are broken arbitrarily
+            best = np.argpartition(-overlaps, policy.max_candidates - 1)[:policy.max_candidates]
+            rows = np.sort(rows[best])
+
+        without_skills = np.asarray(self._rows_without_skills, dtype=np.int64)
+        without_skills = without_skills[self.active[without_skills]]
+        if len(without_skills):
+            rows = np.union1d(rows, without_skills)
+        return rows
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.candidate_stats)
+            return {
+                'jobs': len(self),
+                'rows': len(self.jobs),
+                'indexed_skills': len(self._skill_rows),
+                'candidate_requests': stats['requests'],
+                'full_scans': stats['full_scans'],
+                'mean_candidates': round(stats['candidates'] / stats['requests'], 1) if stats['requests'] else 0
+            }
+
+    def upsert_job(self, job):
+        """Insert or replace the row of one job post; closed jobs are removed"""
+        if not is_job_open(job):
+            return self.remove_job(job['_id'])
+
+        trimmed_jobs, matrix, features = self._embed(self.analyzer, [job])
+        if not trimmed_jobs:
+            return False
+
+        with self._lock:
+            # Rows are never rewritten in place: the old row is retired and a new one appended
+            self._retire(str(job['_id']))
+            self._new_rows.append(matrix)
+            self._matrix = None
+            self.jobs = self.jobs + trimmed_jobs
+            self.features = self.features + features
+            self.active = np.append(self.active, True)
+            self.row_by_job_id[str(job['_id'])] = len(self.jobs) - 1
+            self._index_skills(len(self.jobs) - 1, trimmed_jobs[0])
+            self._revision += 1
+        return True
+
+    def remove_job(self, job_id):
+        """Remove the row of a closed or deleted job post"""
+        with self._lock:
+            return self._retire(str(job_id))
+
+    def _retire(self, job_id):
+        row = self.row_by_job_id.pop(job_id, None)
+        if row is None:
+            return False
+
+        active = self.active.copy()
+        active[row] = False
+        self.active = active
+        self._revision += 1
+        return True
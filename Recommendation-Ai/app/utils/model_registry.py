@@ -0,0 +1,298 @@
+"""
+Model registry
+
+Stores every published set of models in its own version directory with a
+manifest (checksums and training metadata). The active version is named in a
+CURRENT file that is replaced atomically, so rolling forward or back is a
+single pointer update that running workers pick up in the background.
+
+Layout:
+    registry/
+        CURRENT
+        versions/<version>/manifest.json
+        versions/<version>/skill_vectorizer.joblib
+        versions/<version>/success_predictor.joblib
+        versions/<version>/success_predictor.forest/*.npy
+
+Random forests are also stored as flat .npy arrays (see shared_forest). In the
+default 'mmap' load mode those arrays and the vectorizer's NumPy arrays are
+memory-mapped, so all workers on a host share one read-only copy.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+from datetime import datetime
+import joblib
+from app.utils.shared_forest import SharedForestPredictor
+
+# Models stored in every version, by artifact name
+MODEL_ARTIFACTS = ('skill_vectorizer', 'success_predictor')
+
+# 'mmap' shares model arrays between processes, 'copy' loads private copies
+LOAD_MODES = ('mmap', 'copy')
+
+
+def file_checksum(path):
+    """SHA-256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Versioned model artifacts with an atomic CURRENT pointer"""
+
+    # Directory of the registry, inside PortfolioAnalyzer.MODEL_PATH
+    DIR_NAME = 'registry'
+
+    def __init__(self, root, keep_versions=20, load_mode='mmap'):
+        """
+        Parameters:
+        - root: Registry directory
+        - keep_versions: Number of most recent versions kept when publishing (the current one is always kept)
+        - load_mode: One of LOAD_MODES
+        """
+        if load_mode not in LOAD_MODES:
+            raise ValueError(f"load_mode must be one of {LOAD_MODES}")
+
+        self.root = root
+        self.keep_versions = keep_versions
+        self.load_mode = load_mode
+        self.versions_dir = os.path.join(root, 'versions')
+        self.current_path = os.path.join(root, 'CURRENT')
+
+    @classmethod
+    def from_env(cls, model_path):
+        """Create the registry of a model directory, configured from MODEL_REGISTRY_KEEP and MODEL_LOAD_MODE"""
+        return cls(
+            os.path.join(model_path, cls.DIR_NAME),
+            keep_versions=int(os.environ.get('MODEL_REGISTRY_KEEP', 20)),
+            load_mode=os.environ.get('MODEL_LOAD_MODE', 'mmap')
+        )
+
+    def current_version(self):
+        """Return the active version, or None if nothing was published yet"""
+        try:
+            with open(self.current_path, 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def version_path(self, version):
+        return os.path.join(self.versions_dir, version)
+
+    def manifest(self, version):
+        """Read the manifest of a version"""
+        with open(os.path.join(self.version_path(version), 'manifest.json'), 'r') as f:
+            return json.load(f)
+
+    def list_versions(self):
+        """Manifests of all complete versions, oldest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+
+        manifests = []
+        for version in sorted(os.listdir(self.versions_dir)):
+            if version.startswith('.'):
+                continue
+            try:
+                manifests.append(self.manifest(version))
+            except (OSError, ValueError):
+                continue
+        return manifests
+
+    def publish(self, models, metadata=None, activate=True):
+        """
+        Store a new version of the models
+
+        Parameters:
+        - models: Dict of artifact name to fitted model, see MODEL_ARTIFACTS
+        - metadata: Training metadata stored in the manifest
+        - activate: Point CURRENT at the new version
+
+        Returns the new version
+        """
+        # Timestamp first so versions sort chronologically; the pid keeps concurrent workers apart
+        version = f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.getpid()}"
+        staging_path = os.path.join(self.versions_dir, f".staging-{version}")
+        os.makedirs(staging_path)
+
+        try:
+            artifacts = {}
+            for name, model in models.items():
+                filename = f"{name}.joblib"
+                path = os.path.join(staging_path, filename)
+                joblib.dump(model, path)
+                artifacts[name] = {
+                    'file': filename,
+                    'sha256': file_checksum(path),
+                    'bytes': os.path.getsize(path)
+                }
+
+                shared = self._shared_forest(model)
+                if shared is not None:
+                    shared_dir = f"{name}.forest"
+                    shared.save(os.path.join(staging_path, shared_dir))
+                    artifacts[name]['shared'] = {
+                        'dir': shared_dir,
+                        'files': {
+                            os.path.basename(shared_path): file_checksum(shared_path)
+                            for shared_path in SharedForestPredictor.files(os.path.join(staging_path, shared_dir))
+                        }
+                    }
+
+            manifest = {
+                'version': version,
+                'created_at': datetime.now().isoformat(),
+                'parent': self.current_version(),
+                'artifacts': artifacts,
+                'metadata': metadata or {}
+            }
+            with open(os.path.join(staging_path, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f, indent=2, default=str)
+
+            # The version directory only appears once it is complete
+            os.rename(staging_path, self.version_path(version))
+        except Exception:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(version, verify=False)
+        self.prune()
+        return version
+
+    @staticmethod
+    def _shared_forest(model):
+        """Flat-array form of a random forest predictor, or None for other models"""
+        if isinstance(model, SharedForestPredictor):
+            return model
+        if hasattr(model, 'estimators_') and all(hasattr(tree, 'tree_') for tree in model.estimators_):
+            return SharedForestPredictor.from_forest(model)
+        return None
+
+    def verify(self, version):
+        """Raise ValueError if an artifact of a version is missing or does not match its checksum"""
+        manifest = self.manifest(version)
+        for name, artifact in manifest['artifacts'].items():
+            checksums = {artifact['file']: artifact['sha256']}
+            if 'shared' in artifact:
+                shared_dir = artifact['shared']['dir']
+                checksums.update({
+                    os.path.join(shared_dir, filename): checksum
+                    for filename, checksum in artifact['shared']['files'].items()
+                })
+
+            for filename, checksum in checksums.items():
+                path = os.path.join(self.version_path(version), filename)
+                if not os.path.exists(path) or file_checksum(path) != checksum:
+                    raise ValueError(f"Checksum mismatch for {name} in model version {version}")
+        return manifest
+
+    def activate(self, version, verify=True):
+        """Point CURRENT at a version; used to roll forward and back"""
+        if verify:
+            self.verify(version)
+
+        tmp_path = f"{self.current_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.current_path)
+
+    def load(self, version):
+        """
+        Load and verify the models of a version
+
+        Returns (models, manifest) where models maps artifact names to models.
+        """
+        manifest = self.verify(version)
+        models = {}
+        for name, artifact in manifest['artifacts'].items():
+            if self.load_mode == 'mmap' and 'shared' in artifact:
+                # The pickled forest is not unpickled at all: its trees would be private copies
+                models[name] = SharedForestPredictor.load(
+                    os.path.join(self.version_path(version), artifact['shared']['dir'])
+                )
+            else:
+                models[name] = joblib.load(
+                    os.path.join(self.version_path(version), artifact['file']),
+                    mmap_mode='r' if self.load_mode == 'mmap' else None
+                )
+        return models, manifest
+
+    def prune(self):
+        """Delete the oldest versions beyond keep_versions, never the current one"""
+        if not self.keep_versions or not os.path.isdir(self.versions_dir):
+            return
+
+        current = self.current_version()
+        versions = sorted(v for v in os.listdir(self.versions_dir) if not v.startswith('.'))
+        for version in versions[:-self.keep_versions]:
+            if version != current:
+                shutil.rmtree(self.version_path(version), ignore_errors=True)
+
+
+class ModelReloader:
+    """Daemon thread that loads a newly activated version and hands it to a callback"""
+
+    def __init__(self, registry, loaded_version, apply, interval=10.0):
+        """
+        Parameters:
+        - registry: ModelRegistry to watch
+        - loaded_version: Function returning the version currently served
+        - apply: Function called with (version, models, manifest) to swap the models in
+        - interval: Seconds between checks of the CURRENT pointer
+        """
+        self.registry = registry
+        self.loaded_version = loaded_version
+        self.apply = apply
+        self.interval = interval
+        self.failed_version = None
+        self.reloads = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='model-reloader', daemon=True)
+            self._thread.start()
+
+    def close(self, timeout=5.0):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """
+        Load the current version if it differs from the served one
+
+        Returns True if new models were applied.
+        """
+        version = self.registry.current_version()
+        if not version or version == self.loaded_version() or version == self.failed_version:
+            return False
+
+        try:
+            models, manifest = self.registry.load(version)
+            self.apply(version, models, manifest)
+        except Exception as e:
+            # Not retried until CURRENT moves to another version
+            self.failed_version = version
+            print(f"Error reloading model version {version}: {str(e)}")
+            return False
+
+        self.reloads += 1
+        print(f"Reloaded model version {version}")
+        return True
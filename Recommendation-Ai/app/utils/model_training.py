@@ -0,0 +1,103 @@
+"""
+Offline training of the recommendation models
+
+Streams the job post and portfolio corpus from MongoDB so that models are fitted
+once on the full data set, outside the request path.
+"""
+import time
+from datetime import datetime
+import sklearn
+from app.utils.portfolio_analyzer import PortfolioAnalyzer
+
+# Fields needed to build the embedding text of each document
+JOB_TEXT_PROJECTION = {'title': 1, 'description': 1, 'requirements': 1}
+PORTFOLIO_TEXT_PROJECTION = {
+    'skills': 1,
+    'experience.position': 1,
+    'experience.description': 1,
+    'projects.title': 1,
+    'projects.description': 1,
+    'projects.technologies': 1,
+    'education.degree': 1,
+    'education.fieldOfStudy': 1
+}
+
+# Fields needed to assemble the success predictor training data
+APPLICATION_PROJECTION = {'userId': 1, 'jobId': 1, 'status': 1}
+PORTFOLIO_FEATURE_PROJECTION = {'userId': 1, 'skills': 1, 'experience': 1, 'education': 1}
+JOB_FEATURE_PROJECTION = {'requirements': 1}
+
+
+def iter_corpus_texts(db, counts, batch_size=1000):
+    """
+    Yield the embedding text of every job post and portfolio
+    
+    Parameters:
+    - db: Database connection
+    - counts: Dict updated with the number of documents read per collection
+    - batch_size: Number of documents fetched per Mongo round trip
+    """
+    sources = [
+        ('jobposts', JOB_TEXT_PROJECTION, PortfolioAnalyzer.job_text),
+        ('portfolios', PORTFOLIO_TEXT_PROJECTION, PortfolioAnalyzer.portfolio_text)
+    ]
+    for collection, projection, to_text in sources:
+        counts.setdefault(collection, 0)
+        for document in getattr(db, collection).find({}, projection).batch_size(batch_size):
+            try:
+                text = to_text(document)
+            except Exception as e:
+                print(f"Skipping {collection} document {document.get('_id')}: {str(e)}")
+                continue
+            counts[collection] += 1
+            yield text
+
+
+def train_vectorizer(db, analyzer, batch_size=1000):
+    """
+    Fit the skill vectorizer once on the full corpus and save it with a version stamp
+    
+    Returns the version stamp
+    """
+    started = time.time()
+    counts = {}
+    
+    vectorizer = PortfolioAnalyzer.create_vectorizer()
+    vectorizer.fit(iter_corpus_texts(db, counts, batch_size))
+    
+    trained_at = datetime.now()
+    stamp = {
+        'version': trained_at.strftime('%Y%m%d%H%M%S'),
+        'trained_at': trained_at.isoformat(),
+        'documents': counts,
+        'vocabulary_size': len(vectorizer.vocabulary_),
+        'sklearn_version': sklearn.__version__,
+        'training_seconds': round(time.time() - started, 2)
+    }
+    
+    analyzer.skill_vectorizer = vectorizer
+    analyzer.save_vectorizer(stamp)
+    return stamp
+
+
+def train_predictor(db, analyzer, chunk_size=10000):
+    """
+    Retrain the success predictor on the full application history
+    
+    Applications are streamed from a cursor; portfolios and jobs are read once
+    with projections and joined in memory.
+    
+    Returns True if a model was trained and saved
+    """
+    expected_rows = db.applications.count_documents({})
+    applications = db.applications.find({}, APPLICATION_PROJECTION).batch_size(chunk_size)
+    portfolios = db.portfolios.find({}, PORTFOLIO_FEATURE_PROJECTION).batch_size(chunk_size)
+    job_postings = db.jobposts.find({}, JOB_FEATURE_PROJECTION).batch_size(chunk_size)
+    
+    return analyzer.train_on_application_results(
+        applications,
+        portfolios,
+        job_postings,
+        chunk_size=chunk_size,
+        expected_rows=expected_rows
+    )
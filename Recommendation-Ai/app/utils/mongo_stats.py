@@ -0,0 +1,49 @@
+"""
+Mongo command statistics
+
+A pymongo CommandListener that counts round trips and BSON bytes sent and
+received. pymongo calls listeners on the thread that runs the command, so
+counts are collected per request by wrapping the request in track_mongo().
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import bson
+from pymongo import monitoring
+
+# Counters of the request being tracked in the current context, if any
+_current_stats = ContextVar('mongo_command_stats', default=None)
+
+
+class MongoCommandStats(monitoring.CommandListener):
+    """Adds every command to the counters of the current track_mongo() block"""
+
+    def started(self, event):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats['round_trips'] += 1
+            stats['bytes_sent'] += len(bson.encode(event.command))
+
+    def succeeded(self, event):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats['bytes_received'] += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats['failures'] += 1
+
+
+# Listener passed to MongoClient(event_listeners=...)
+command_stats_listener = MongoCommandStats()
+
+
+@contextmanager
+def track_mongo():
+    """Collect the Mongo commands run inside the block into the yielded dict"""
+    stats = {'round_trips': 0, 'bytes_sent': 0, 'bytes_received': 0, 'failures': 0}
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
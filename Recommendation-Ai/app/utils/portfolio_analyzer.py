@@ -1,12 +1,25 @@
 import re
+import bisect
+import heapq
 from collections import Counter
+from itertools import islice
 import numpy as np
 import joblib
+import sklearn
+import json
 import os
+import time
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 from datetime import datetime
+from app.utils.history_writer import HistoryWriter
+from app.utils.model_registry import ModelRegistry
+from app.utils.portfolio_features import PortfolioFeatureStore, experience_score
+from app.utils.skill_vocabulary import (
+    SkillVocabulary, default_vocabulary, set_default_vocabulary, overlap_counts, popcount
+)
 
 class PortfolioAnalyzer:
     """Utility class for analyzing and comparing portfolios with ML capabilities"""
@@ -14,34 +27,129 @@ class PortfolioAnalyzer:
     # Model path for persistence
     MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'models')
     
+    # Directory of the recommendation history segments
+    HISTORY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'training_history')
+    
     def __init__(self):
-        """Initialize with ML models"""
-        # Create models directory if it doesn't exist
-        if not os.path.exists(self.MODEL_PATH):
-            os.makedirs(self.MODEL_PATH)
-            
-        # Initialize models
-        self.skill_vectorizer = self._load_or_create_vectorizer()
-        self.success_predictor = self._load_or_create_predictor()
-        self.recommendation_history = []
+        """
+        Initialize with ML models
+        
+        Persisted models are loaded as they are. The success predictor is only
+        bootstrapped on synthetic data when no valid artifact exists, and that
+        bootstrap model is kept in memory: nothing is written to disk here.
+        """
+        started = time.time()
+        
+        # Initialize models from the active registry version, or from the legacy flat files
+        self.registry = ModelRegistry.from_env(self.MODEL_PATH)
+        self.model_version = None
+        if not self._load_registry_version():
+            self.skill_vectorizer = self._load_or_create_vectorizer()
+            self.vectorizer_stamp = self._load_vectorizer_stamp()
+            self.vectorizer_version = self.vectorizer_stamp.get('version')
+            self.success_predictor = self._load_predictor()
+            self.predictor_source = 'persisted'
+        if self.success_predictor is None:
+            self.success_predictor = self._bootstrap_predictor()
+            self.predictor_source = 'bootstrap'
+        self.last_training_stats = None
+        
+        # Canonical skill ids of the skill matchers, when a vocabulary was saved
+        vocabulary_path = SkillVocabulary.default_path(self.MODEL_PATH)
+        if os.path.exists(vocabulary_path):
+            try:
+                set_default_vocabulary(SkillVocabulary.load(vocabulary_path))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error loading skill vocabulary: {str(e)}")
+        
+        # Writes recorded recommendations in the background; starts on first use
+        self.history_writer = HistoryWriter.from_env(self.HISTORY_PATH)
+        
+        # Features and TF-IDF rows derived once per portfolio version
+        self.portfolio_features = PortfolioFeatureStore.from_env()
+        
+        # Precomputed job embeddings and background trainer, attached by the recommendation service
+        self.job_index = None
+        self.trainer = None
+        
+        print(f"PortfolioAnalyzer started in {time.time() - started:.3f}s "
+              f"(model version: {self.model_version}, predictor: {self.predictor_source}, "
+              f"vectorizer version: {self.vectorizer_version})")
+    
+    def _load_registry_version(self):
+        """Load the models of the active registry version; returns False if there is none"""
+        version = self.registry.current_version()
+        if not version:
+            return False
         
-        # Train models on initialization if possible
         try:
-            self._initial_model_training()
+            models, manifest = self.registry.load(version)
+            self.apply_models(version, models, manifest)
+            return True
         except Exception as e:
-            print(f"Initial model training failed: {str(e)}")
+            print(f"Error loading model version {version}: {str(e)}")
+            return False
+    
+    def apply_models(self, version, models, manifest):
+        """
+        Swap in the models of a registry version
+        
+        Each model is replaced by a single attribute assignment, so requests in
+        flight keep using the objects they already read.
+        """
+        predictor = models.get('success_predictor')
+        if predictor is not None and not self.is_valid_predictor(predictor):
+            raise ValueError(f"Model version {version} has an invalid success predictor")
+        
+        metadata = manifest.get('metadata', {})
+        if 'skill_vectorizer' in models:
+            self.skill_vectorizer = models['skill_vectorizer']
+            self.vectorizer_stamp = metadata.get('vectorizer', {})
+            self.vectorizer_version = self.vectorizer_stamp.get('version')
+        if predictor is not None:
+            self.success_predictor = predictor
+            self.predictor_source = metadata.get('predictor', {}).get('source', 'persisted')
+        self.model_version = version
+    
+    def publish_models(self, reason):
+        """
+        Publish the live models as a new registry version and activate it
+        
+        Parameters:
+        - reason: Why the version was published, stored in the manifest
+        
+        Returns the new version
+        """
+        metadata = {
+            'reason': reason,
+            'vectorizer': self.vectorizer_stamp,
+            'predictor': {
+                'source': self.predictor_source,
+                'training': self.last_training_stats
+            },
+            'sklearn_version': sklearn.__version__
+        }
+        version = self.registry.publish({
+            'skill_vectorizer': self.skill_vectorizer,
+            'success_predictor': self.success_predictor
+        }, metadata)
+        
+        # This process already serves the version, so the reloader does not load it again
+        self.model_version = version
+        print(f"Published model version {version} ({reason})")
+        return version
     
-    def _initial_model_training(self):
-        """Train models on synthetic data for initial usage"""
-        # Create synthetic data for initial training
-        X = np.random.rand(100, 3) * 100  # skill_match, exp_score, edu_score
+    def _bootstrap_predictor(self):
+        """Train a predictor on synthetic data for initial usage, in memory only"""
+        # Create synthetic data for initial training; seeded so every worker gets the same model
+        rng = np.random.RandomState(42)
+        X = rng.rand(100, 3) * 100  # skill_match, exp_score, edu_score
         y = (X[:, 0] * 0.5 + X[:, 1] * 0.3 + X[:, 2] * 0.2) > 50  # Success threshold
         
         # Train success predictor
-        self.success_predictor.fit(X, y)
-        
-        # Save models
-        self.save_models()
+        predictor = self.create_predictor()
+        predictor.fit(X, y)
+        return predictor
     
     def _load_or_create_vectorizer(self):
         """Load existing vectorizer or create a new one"""
@@ -53,78 +161,164 @@ class PortfolioAnalyzer:
                 pass
         
         # Create a new vectorizer if loading fails
+        return self.create_vectorizer()
+    
+    @staticmethod
+    def create_vectorizer():
+        """Create an unfitted skill vectorizer"""
         return TfidfVectorizer(stop_words='english', max_features=1000)
     
-    def _load_or_create_predictor(self):
-        """Load existing success predictor or create a new one"""
-        predictor_path = os.path.join(self.MODEL_PATH, 'success_predictor.joblib')
-        if os.path.exists(predictor_path):
+    def _load_vectorizer_stamp(self):
+        """Load the version stamp written when the vectorizer was trained"""
+        stamp_path = os.path.join(self.MODEL_PATH, 'skill_vectorizer.json')
+        if os.path.exists(stamp_path):
             try:
-                return joblib.load(predictor_path)
-            except:
-                pass
+                with open(stamp_path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"Error reading vectorizer stamp: {str(e)}")
+        return {}
+    
+    def _load_predictor(self):
+        """Load the persisted success predictor, or return None if there is no valid one"""
+        predictor_path = os.path.join(self.MODEL_PATH, 'success_predictor.joblib')
+        if not os.path.exists(predictor_path):
+            return None
+        
+        try:
+            predictor = joblib.load(predictor_path)
+        except Exception as e:
+            print(f"Error loading success predictor: {str(e)}")
+            return None
         
-        # Create a new predictor if loading fails
+        if not self.is_valid_predictor(predictor):
+            print(f"Ignoring invalid success predictor at {predictor_path}")
+            return None
+        return predictor
+    
+    @staticmethod
+    def is_valid_predictor(predictor):
+        """Check that a predictor is fitted on the three scoring features"""
+        return (
+            hasattr(predictor, 'predict_proba')
+            and getattr(predictor, 'n_features_in_', None) == 3
+            and len(getattr(predictor, 'classes_', [])) == 2
+        )
+    
+    @staticmethod
+    def create_predictor():
+        """Create an unfitted success predictor"""
         return RandomForestClassifier(n_estimators=100, random_state=42)
     
     def save_models(self):
-        """Save models to disk"""
-        vectorizer_path = os.path.join(self.MODEL_PATH, 'skill_vectorizer.joblib')
-        predictor_path = os.path.join(self.MODEL_PATH, 'success_predictor.joblib')
+        """Save models to disk as a new registry version"""
+        return self.publish_models('save_models')
+    
+    def save_predictor(self):
+        """Save a retrained success predictor as a new registry version"""
+        return self.publish_models('predictor retrained')
+    
+    def save_vectorizer(self, stamp):
+        """
+        Save the skill vectorizer together with its version stamp
         
-        joblib.dump(self.skill_vectorizer, vectorizer_path)
-        joblib.dump(self.success_predictor, predictor_path)
+        Parameters:
+        - stamp: Training metadata, must contain a 'version' key
+        """
+        self.vectorizer_stamp = stamp
+        self.vectorizer_version = stamp.get('version')
+        return self.publish_models('vectorizer trained')
     
-    def train_on_application_results(self, applications, portfolios, job_postings):
+    def train_on_application_results(self, applications, portfolios, job_postings, chunk_size=10000, expected_rows=None):
         """
         Train model based on successful and unsuccessful job applications
         
+        Portfolios and jobs are indexed once, then applications are streamed in
+        chunks and joined against those indexes, so any iterable (including a
+        Mongo cursor) can be passed for the applications.
+        
         Parameters:
-        - applications: List of job applications with status information
-        - portfolios: List of user portfolios
-        - job_postings: List of job posting data
-        """
-        # Prepare training data
-        X = []  # Features
-        y = []  # Target (success/failure)
-        
-        for app in applications:
-            # Find portfolio for this application
-            portfolio = next((p for p in portfolios if str(p.get('userId')) == str(app.get('userId'))), None)
-            # Find job posting
-            job = next((j for j in job_postings if str(j.get('_id')) == str(app.get('jobId'))), None)
+        - applications: Iterable of job applications with status information
+        - portfolios: Iterable of user portfolios
+        - job_postings: Iterable of job posting data
+        - chunk_size: Number of applications processed per chunk
+        - expected_rows: Number of applications, used to preallocate the feature matrix
+        """
+        started = time.time()
+        
+        # Index portfolios by user and jobs by id (first document wins, like a linear scan)
+        portfolios_by_user = {}
+        for portfolio in portfolios:
+            portfolios_by_user.setdefault(str(portfolio.get('userId')), portfolio)
+        jobs_by_id = {}
+        for job in job_postings:
+            jobs_by_id.setdefault(str(job.get('_id')), job)
+        
+        # Preallocate the training data, growing it only if the estimate is too small
+        if expected_rows is None:
+            expected_rows = len(applications) if hasattr(applications, '__len__') else chunk_size
+        X = np.empty((max(expected_rows, 1), 3), dtype=np.float64)  # Features
+        y = np.empty(max(expected_rows, 1), dtype=np.int8)  # Target (success/failure)
+        
+        # Per-portfolio and per-job inputs are computed once and reused across applications
+        portfolio_inputs = {}
+        job_features = {}
+        
+        rows = 0
+        processed = 0
+        applications = iter(applications)
+        while True:
+            chunk = list(islice(applications, chunk_size))
+            if not chunk:
+                break
             
-            if portfolio and job:
-                # Extract features
-                skill_match = self.calculate_skill_match_percentage(
-                    portfolio.get('skills', []),
-                    job.get('requirements', [])
-                )
+            for app in chunk:
+                user_id = str(app.get('userId'))
+                job_id = str(app.get('jobId'))
+                portfolio = portfolios_by_user.get(user_id)
+                job = jobs_by_id.get(job_id)
                 
-                exp_score = self.calculate_experience_score(
-                    portfolio.get('experience', []),
-                    job
-                )
+                if not (portfolio and job):
+                    continue
                 
-                edu_score = self.calculate_education_score(
-                    portfolio.get('education', []),
-                    job
-                )
+                if user_id not in portfolio_inputs:
+                    portfolio_inputs[user_id] = self._portfolio_feature_inputs(portfolio)
+                if job_id not in job_features:
+                    job_features[job_id] = self.precompute_job_features(job)
+                
+                if rows == len(X):
+                    X = np.resize(X, (len(X) * 2, 3))
+                    y = np.resize(y, len(y) * 2)
                 
                 # Create feature vector
-                X.append([skill_match, exp_score, edu_score])
+                X[rows] = self._feature_row(portfolio_inputs[user_id], job_features[job_id])
                 
                 # Set target (1 for successful, 0 for unsuccessful)
-                is_successful = app.get('status') == 'Accepted'
-                y.append(1 if is_successful else 0)
+                y[rows] = 1 if app.get('status') == 'Accepted' else 0
+                rows += 1
+            
+            processed += len(chunk)
+            elapsed = time.time() - started
+            print(f"Processed {processed} applications, {rows} training rows "
+                  f"({processed / elapsed if elapsed > 0 else 0:.0f} rows/s)")
+        
+        elapsed = time.time() - started
+        self.last_training_stats = {
+            'applications': processed,
+            'rows': rows,
+            'seconds': round(elapsed, 2),
+            'rows_per_second': round(processed / elapsed) if elapsed > 0 else None
+        }
+        print(f"Training data assembled: {rows} rows from {processed} applications in {elapsed:.2f}s "
+              f"({self.last_training_stats['rows_per_second']} rows/s)")
         
         # Train model if we have data
-        if X and y and len(X) == len(y) and len(X) > 5:
-            X = np.array(X)
-            y = np.array(y)
-            
-            # Train random forest
-            self.success_predictor.fit(X, y)
+        if rows > 5:
+            # Train a new random forest and swap it in once it is fitted
+            predictor = self.create_predictor()
+            predictor.fit(X[:rows], y[:rows])
+            self.success_predictor = predictor
+            self.predictor_source = 'trained'
             
             # Save models
             self.save_models()
@@ -151,69 +345,13 @@ class PortfolioAnalyzer:
             'timestamp': datetime.now().isoformat()
         }
         
-        # Add to in-memory history
-        self.recommendation_history.append(record)
+        # Queue for the background writer of the training_history segments
+        if not self.history_writer.submit(record):
+            print("Recommendation history queue is full, record dropped")
         
-        # Save to disk in the training_history folder
-        try:
-            import os
-            import json
-            
-            # Ensure training_history directory exists
-            # Using the base directory (2 levels up from current file)
-            current_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-            history_dir = os.path.join(current_dir, 'training_history')
-            os.makedirs(history_dir, exist_ok=True)
-            
-            # Create a unique filename with timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"recommendation_{timestamp}_{user_id[-6:]}.json"
-            filepath = os.path.join(history_dir, filename)
-            
-            # Write recommendation data to JSON file
-            with open(filepath, 'w') as f:
-                json.dump(record, f, indent=2, default=str)
-                
-            print(f"Training record saved to {filepath}")
-        except Exception as e:
-            print(f"Error saving training history: {str(e)}")
-        
-        # If we have accumulated enough history, retrain the model
-        if len(self.recommendation_history) >= 10:
-            # Logic to retrain based on history would go here
-            self._retrain_from_history()
-    
-    def _retrain_from_history(self):
-        """Retrain models using recorded recommendation history"""
-        # Only retrain if we have application results
-        results = [rec for rec in self.recommendation_history if rec.get('application_result')]
-        
-        if len(results) >= 5:
-            X = []
-            y = []
-            
-            for rec in results:
-                if 'portfolio_score' in rec['recommendation'] and 'application_result' in rec:
-                    # Simple feature extraction from historical data
-                    score = rec['recommendation']['portfolio_score']
-                    skills = rec['recommendation'].get('skill_match', 70)
-                    exp = rec['recommendation'].get('exp_score', 50)
-                    
-                    X.append([score, skills, exp])
-                    y.append(1 if rec['application_result'] == 'Accepted' else 0)
-            
-            if X and y and len(X) == len(y):
-                X = np.array(X)
-                y = np.array(y)
-                
-                # Update models
-                self.success_predictor.fit(X, y)
-                
-                # Save updated models
-                self.save_models()
-                
-                # Reset history after retraining
-                self.recommendation_history = []
+        # Labeled records are retrained on by the background trainer, off the request path
+        if self.trainer is not None:
+            self.trainer.add(record)
     
     def predict_application_success(self, portfolio, job_data):
         """
@@ -256,23 +394,52 @@ class PortfolioAnalyzer:
             # Fall back to weighted average if prediction fails
             return round(skill_match * 0.5 + exp_score * 0.3 + edu_score * 0.2, 2)
     
-    def generate_job_embedding(self, job_data):
-        """Generate vector embedding for a job posting"""
-        text = " ".join([
+    @staticmethod
+    def job_text(job_data):
+        """Build the text used to embed a job posting"""
+        return " ".join([
             job_data.get('title', ''),
             job_data.get('description', ''),
             " ".join(job_data.get('requirements', []))
         ])
+    
+    def generate_job_embedding(self, job_data):
+        """Generate vector embedding for a job posting"""
+        # The vectorizer is fitted offline on the whole corpus (python train_models.py vectorizer)
+        return self.skill_vectorizer.transform([self.job_text(job_data)])
+    
+    def generate_job_embeddings(self, jobs):
+        """
+        Generate vector embeddings for many job postings at once
         
-        try:
-            return self.skill_vectorizer.transform([text])
-        except Exception as e:
-            # If vectorizer is not fit yet, fit it and try again
-            self.skill_vectorizer.fit([text])
-            return self.skill_vectorizer.transform([text])
+        Returns a tuple (jobs, matrix) where matrix is a sparse matrix with one
+        row per job. Jobs whose text cannot be built are skipped, exactly like
+        the per-job loop does.
+        """
+        embedded_jobs = []
+        texts = []
+        for job in jobs:
+            try:
+                texts.append(self.job_text(job))
+                embedded_jobs.append(job)
+            except Exception as e:
+                print(f"Error scoring job: {str(e)}")
+        
+        if not texts:
+            return [], None
+        
+        # One transform call for the whole batch
+        return embedded_jobs, self.skill_vectorizer.transform(texts)
     
     def generate_portfolio_embedding(self, portfolio):
         """Generate vector embedding for a user portfolio"""
+        # The vectorizer is fitted offline on the whole corpus (python train_models.py vectorizer);
+        # the row is cached until the portfolio or the vectorizer changes
+        return self.portfolio_features.embedding(portfolio, self.skill_vectorizer, self.portfolio_text)
+    
+    @staticmethod
+    def portfolio_text(portfolio):
+        """Build the text used to embed a user portfolio"""
         # Concatenate all relevant text from the portfolio
         text_parts = []
         
@@ -303,26 +470,23 @@ class PortfolioAnalyzer:
             if edu.get('fieldOfStudy'):
                 text_parts.append(edu.get('fieldOfStudy', ''))
         
-        combined_text = " ".join(text_parts)
-        
-        try:
-            return self.skill_vectorizer.transform([combined_text])
-        except Exception as e:
-            # If vectorizer is not fit yet, fit it and try again
-            self.skill_vectorizer.fit([combined_text])
-            return self.skill_vectorizer.transform([combined_text])
+        return " ".join(text_parts)
     
-    def find_best_matching_jobs(self, portfolio, all_jobs, limit=5):
+    def find_best_matching_jobs(self, portfolio, all_jobs=None, limit=5, batched=True):
         """
         Find the best matching jobs for a user's portfolio using ML
         
         Parameters:
         - portfolio: User portfolio
-        - all_jobs: List of all available jobs
+        - all_jobs: List of all available jobs, or None to score against the job index
         - limit: Maximum number of jobs to return
+        - batched: Score all jobs with matrix operations instead of one job at a time
         
         Returns list of jobs with match scores
         """
+        if all_jobs is None and self.job_index is not None:
+            return self._find_best_matching_indexed_jobs(portfolio, limit)
+        
         if not all_jobs:
             return []
         
@@ -330,51 +494,229 @@ class PortfolioAnalyzer:
         try:
             portfolio_embedding = self.generate_portfolio_embedding(portfolio)
             
-            # Calculate similarity scores for all jobs
-            job_scores = []
-            for job in all_jobs:
-                try:
-                    job_embedding = self.generate_job_embedding(job)
-                    similarity = cosine_similarity(portfolio_embedding, job_embedding)[0][0]
-                    
-                    # Predict success probability
-                    success_prob = self.predict_application_success(portfolio, job)
-                    
-                    # Combined score (70% similarity, 30% success probability)
-                    combined_score = similarity * 0.7 + (success_prob/100) * 0.3
-                    
-                    job_scores.append((job, combined_score))
-                except Exception as e:
-                    print(f"Error scoring job: {str(e)}")
-                    continue
-            
-            # Sort by score (descending)
-            job_scores.sort(key=lambda x: x[1], reverse=True)
+            # Calculate similarity scores for all jobs and keep the top matches
+            if batched:
+                jobs, scores = self._score_jobs_batched(portfolio, portfolio_embedding, all_jobs)
+                top_matches = [(jobs[i], scores[i]) for i in self.top_k_indices(scores, limit)]
+            else:
+                # Bounded heap over the streamed scores
+                top_matches = heapq.nlargest(
+                    limit, self._score_jobs_iteratively(portfolio, portfolio_embedding, all_jobs), key=lambda x: x[1]
+                )
             
-            # Return top matches
-            return [(job, round(score * 100, 2)) for job, score in job_scores[:limit]]
+            return [(job, round(score * 100, 2)) for job, score in top_matches]
         except Exception as e:
             print(f"Error finding matching jobs: {str(e)}")
             # Fallback to simple skill matching if ML fails
             return self._fallback_job_matching(portfolio, all_jobs, limit)
     
-    def _fallback_job_matching(self, portfolio, all_jobs, limit=5):
-        """Simple fallback matching when ML approach fails"""
-        user_skills = portfolio.get('skills', [])
+    def _find_best_matching_indexed_jobs(self, portfolio, limit=5):
+        """
+        Rank the jobs held in the job index for a portfolio
+        
+        Only the candidates of the skill index (jobs sharing skills with the
+        portfolio) are embedded against and run through the success predictor;
+        the index falls back to every job when there are too few candidates.
+        """
+        skill_ids = default_vocabulary().skill_ids(portfolio.get('skills', []))
+        matrix, rows, jobs, features, _ = self.job_index.candidate_snapshot(skill_ids, limit)
+        if len(rows) == 0:
+            return []
+        
+        try:
+            portfolio_embedding = self.generate_portfolio_embedding(portfolio)
+            
+            # Index rows are stored normalized, so one product gives the cosine similarities
+            similarities = (matrix[rows] @ normalize(portfolio_embedding).T).toarray().ravel()
+            
+            # Predict success probability from the precomputed job features
+            success_probs = self._predict_success_from_job_features(portfolio, [features[row] for row in rows])
+            
+            # Combined score (70% similarity, 30% success probability)
+            combined_scores = similarities * 0.7 + (success_probs / 100) * 0.3
+            
+            # Return top matches; only the selected jobs are looked up
+            return [
+                (jobs[rows[i]], round(combined_scores[i] * 100, 2))
+                for i in self.top_k_indices(combined_scores, limit)
+            ]
+        except Exception as e:
+            print(f"Error finding matching jobs: {str(e)}")
+            # Fallback to simple skill matching if ML fails
+            return self._fallback_job_matching(portfolio, [jobs[row] for row in rows], limit)
+    
+    @staticmethod
+    def top_k_indices(scores, limit):
+        """
+        Positions of the limit highest scores, best first
         
-        job_matches = []
+        Selects with a partition instead of sorting every score; equal scores
+        keep their input order, as with a stable sort of the whole list.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        limit = min(limit, len(scores))
+        if limit <= 0:
+            return np.empty(0, dtype=np.int64)
+        
+        # Everything above the k-th best score, then the earliest jobs tied with it
+        kth_score = -np.partition(-scores, limit - 1)[limit - 1]
+        above = np.flatnonzero(scores > kth_score)
+        tied = np.flatnonzero(scores == kth_score)[:limit - len(above)]
+        selected = np.concatenate([above, tied])
+        return selected[np.lexsort((selected, -scores[selected]))]
+    
+    def _score_jobs_iteratively(self, portfolio, portfolio_embedding, all_jobs):
+        """Score jobs one at a time, yielding (job, score) (reference implementation of the batched path)"""
         for job in all_jobs:
-            match_percentage = self.calculate_skill_match_percentage(
-                user_skills,
-                job.get('requirements', [])
+            try:
+                job_embedding = self.generate_job_embedding(job)
+                similarity = cosine_similarity(portfolio_embedding, job_embedding)[0][0]
+                
+                # Predict success probability
+                success_prob = self.predict_application_success(portfolio, job)
+                
+                # Combined score (70% similarity, 30% success probability)
+                combined_score = similarity * 0.7 + (success_prob/100) * 0.3
+                
+                yield job, combined_score
+            except Exception as e:
+                print(f"Error scoring job: {str(e)}")
+                continue
+    
+    def _score_jobs_batched(self, portfolio, portfolio_embedding, all_jobs):
+        """
+        Score all jobs with one transform, one sparse product and one predict_proba call
+        
+        Produces the same scores as _score_jobs_iteratively. Returns (jobs, scores)
+        with scores as a NumPy array.
+        """
+        jobs, job_matrix = self.generate_job_embeddings(all_jobs)
+        if not jobs:
+            return [], np.empty(0)
+        
+        # Cosine similarity of every job row against the portfolio vector
+        similarities = (normalize(job_matrix) @ normalize(portfolio_embedding).T).toarray().ravel()
+        
+        # Predict success probability for every job at once
+        success_probs = self._predict_success_from_job_features(
+            portfolio,
+            [self.precompute_job_features(job) for job in jobs]
+        )
+        
+        # Combined score (70% similarity, 30% success probability)
+        combined_scores = similarities * 0.7 + (success_probs / 100) * 0.3
+        
+        return jobs, combined_scores
+    
+    def predict_application_success_batch(self, portfolio, jobs):
+        """
+        Predict likelihood of success for one portfolio against many jobs
+        
+        Returns a NumPy array of probabilities (0-100), one per job, matching
+        predict_application_success for each job.
+        """
+        return self._predict_success_from_job_features(
+            portfolio,
+            [self.precompute_job_features(job) for job in jobs]
+        )
+    
+    @staticmethod
+    def precompute_job_features(job_data, add_skills=False):
+        """
+        Precompute the job-side inputs of the success predictor features
+        
+        These only depend on the job posting, so the job index stores them once
+        per job instead of recomputing them for every portfolio. Only the job
+        index adds the requirements to the skill vocabulary (add_skills); other
+        callers keep the requirements it does not know by name.
+        """
+        requirements = job_data.get('requirements', [])
+        vocabulary = default_vocabulary()
+        return {
+            'has_requirements': bool(requirements),
+            'requirement_bits': vocabulary.skills_bitset(requirements, add=add_skills),
+            'unknown_requirements': vocabulary.unknown_names(requirements),
+            'education_keywords': PortfolioAnalyzer.extract_education_keywords(job_data)
+        }
+    
+    def _portfolio_feature_inputs(self, portfolio):
+        """Precompute the portfolio-side inputs of the success predictor features"""
+        features = self.portfolio_features.get(portfolio)
+        
+        # Experience does not depend on the job, so compute it once
+        exp_score = experience_score(features)
+        if exp_score is None:
+            exp_score = self.calculate_experience_score(portfolio.get('experience', []), None)
+        
+        return {
+            'skill_bits': features['skill_bits'],
+            'unknown_skills': features['unknown_skills'],
+            'exp_score': exp_score,
+            'education': portfolio.get('education', [])
+        }
+    
+    def _feature_row(self, portfolio_inputs, job):
+        """Build the [skill_match, exp_score, edu_score] feature vector of one portfolio/job pair"""
+        return [
+            self._skill_match_from_bits(
+                portfolio_inputs['skill_bits'], job['requirement_bits'],
+                portfolio_inputs['unknown_skills'], job.get('unknown_requirements')
             )
-            job_matches.append((job, match_percentage))
+            if job['has_requirements'] else 100,
+            portfolio_inputs['exp_score'],
+            self._education_score_from_keywords(portfolio_inputs['education'], job['education_keywords'])
+        ]
+    
+    def _predict_success_from_job_features(self, portfolio, job_features):
+        """Predict success probabilities (0-100) for a portfolio against precomputed job features"""
+        portfolio_inputs = self._portfolio_feature_inputs(portfolio)
+        features = np.empty((len(job_features), 3), dtype=np.float64)
+        
+        # Skill matches of all jobs at once: popcounts over the stacked requirement bitsets
+        if job_features:
+            required_bits = default_vocabulary().bitset_matrix([job['requirement_bits'] for job in job_features])
+            required = popcount(required_bits)
+            matched = overlap_counts(portfolio_inputs['skill_bits'], required_bits)
+            # Requirements outside the vocabulary (jobs not in the index) are compared by name
+            for row, job in enumerate(job_features):
+                unknown = job.get('unknown_requirements')
+                if unknown:
+                    required[row] += len(unknown)
+                    matched[row] += sum(name in portfolio_inputs['unknown_skills'] for name in unknown)
+            has_requirements = np.array([job['has_requirements'] for job in job_features], dtype=bool)
+            features[:, 0] = np.where(
+                has_requirements & (required > 0),
+                np.round(matched / np.maximum(required, 1) * 100, 2),
+                100
+            )
+        features[:, 1] = portfolio_inputs['exp_score']
+        features[:, 2] = [
+            self._education_score_from_keywords(portfolio_inputs['education'], job['education_keywords'])
+            for job in job_features
+        ]
         
-        # Sort by match percentage (descending)
-        job_matches.sort(key=lambda x: x[1], reverse=True)
+        try:
+            rf_proba = self.success_predictor.predict_proba(features)[:, 1] * 100
+            return np.round(rf_proba, 2)
+        except Exception as e:
+            print(f"Prediction error: {str(e)}")
+            # Fall back to weighted average if prediction fails
+            return np.array([
+                round(skill_match * 0.5 + exp * 0.3 + edu_score * 0.2, 2)
+                for skill_match, exp, edu_score in features
+            ])
+    
+    def _fallback_job_matching(self, portfolio, all_jobs, limit=5):
+        """Simple fallback matching when ML approach fails"""
+        user_skills = portfolio.get('skills', [])
+        
+        job_matches = (
+            (job, self.calculate_skill_match_percentage(user_skills, job.get('requirements', [])))
+            for job in all_jobs
+        )
         
-        # Return top matches
-        return job_matches[:limit]
+        # Return top matches by match percentage, keeping only limit of them on a heap
+        return heapq.nlargest(limit, job_matches, key=lambda x: x[1])
     
     def generate_detailed_report(self, user_data, job_data, portfolio, ranking_data, strengths, weaknesses, recommended_jobs):
         """
@@ -490,14 +832,33 @@ class PortfolioAnalyzer:
         if not required_skills:
             return 100
             
-        user_skills_lower = [s.lower() for s in user_skills if s]
-        required_skills_lower = [s.lower() for s in required_skills if s]
+        vocabulary = default_vocabulary()
+        return PortfolioAnalyzer._skill_match_from_bits(
+            vocabulary.skills_bitset(user_skills),
+            vocabulary.skills_bitset(required_skills),
+            vocabulary.unknown_names(user_skills),
+            vocabulary.unknown_names(required_skills)
+        )
+    
+    @staticmethod
+    def _skill_match_from_bits(user_bits, required_bits, user_unknown=None, required_unknown=None):
+        """
+        Percentage of the canonical skills in required_bits that are also in user_bits
+        
+        Skills outside the vocabulary (user_unknown, required_unknown) are compared by canonical name.
+        """
+        required_unknown = required_unknown or ()
+        required = int(popcount(required_bits)) + len(required_unknown)
+        if required == 0:
+            return 100
         
         # Count matching skills
-        matches = sum(1 for skill in required_skills_lower if any(us in skill or skill in us for us in user_skills_lower))
+        matches = int(overlap_counts(user_bits, required_bits[None, :])[0])
+        if required_unknown:
+            matches += sum(name in (user_unknown or ()) for name in required_unknown)
         
         # Calculate match percentage
-        match_percentage = (matches / len(required_skills_lower)) * 100
+        match_percentage = (matches / required) * 100
         return round(match_percentage, 2)
     
     @staticmethod
@@ -553,14 +914,25 @@ class PortfolioAnalyzer:
         if not education:
             return 0
             
+        keywords = PortfolioAnalyzer.extract_education_keywords(job_requirements)
+        return PortfolioAnalyzer._education_score_from_keywords(education, keywords)
+    
+    @staticmethod
+    def extract_education_keywords(job_data):
+        """Extract the requirement keywords matched against degrees and fields of study"""
+        if job_data and job_data.get('requirements'):
+            return PortfolioAnalyzer.extract_skills_from_text(' '.join(job_data['requirements']))
+        return []
+    
+    @staticmethod
+    def _education_score_from_keywords(education, keywords):
+        """Education relevance score against precomputed job keywords"""
+        if not education:
+            return 0
+            
         # Default base score for having any education
         score = 30
         
-        # Check for relevant fields
-        keywords = []
-        if job_requirements and job_requirements.get('requirements'):
-            keywords = PortfolioAnalyzer.extract_skills_from_text(' '.join(job_requirements['requirements']))
-        
         relevant_degrees = 0
         for edu in education:
             degree = edu.get('degree', '').lower()
@@ -581,23 +953,17 @@ class PortfolioAnalyzer:
         Compare a user's portfolio with other applicants
         Returns ranking and comparative metrics
         """
-        scores = []
-        
         # Calculate user's score
         user_score = PortfolioAnalyzer.calculate_portfolio_score(user_portfolio, job_data)
         
-        # Calculate scores for all other portfolios
-        for portfolio in other_portfolios:
-            score = PortfolioAnalyzer.calculate_portfolio_score(portfolio, job_data)
-            scores.append(score)
-        
-        # Sort scores in descending order
-        scores.sort(reverse=True)
+        # Other applicants' scores, negated so that ascending order puts the best first
+        scores = sorted(-PortfolioAnalyzer.calculate_portfolio_score(portfolio, job_data)
+                        for portfolio in other_portfolios)
         
-        # Find user's rank
+        # Rank is 1 + the number of applicants with a higher score, found by binary search
         if scores:
-            user_rank = scores.index(user_score) + 1 if user_score in scores else len(scores) + 1
-            percentile = ((len(scores) - user_rank + 1) / len(scores)) * 100 if scores else 100
+            user_rank = bisect.bisect_left(scores, -user_score) + 1
+            percentile = ((len(scores) - user_rank + 1) / len(scores)) * 100
         else:
             user_rank = 1
             percentile = 100
@@ -612,8 +978,8 @@ class PortfolioAnalyzer:
     @staticmethod
     def calculate_portfolio_score(portfolio, job_data):
         """Calculate an overall score for a portfolio based on job requirements"""
-        # Extract skills
-        user_skills = portfolio.get('skills', [])
+        # Extract skills (copied, the portfolio itself is left untouched)
+        user_skills = list(portfolio.get('skills', []))
         
         # Add skills from projects
         for project in portfolio.get('projects', []):
@@ -645,35 +1011,41 @@ class PortfolioAnalyzer:
     @staticmethod
     def identify_strengths_weaknesses(portfolio, job_data):
         """Identify strengths and weaknesses in a user's portfolio compared to job requirements"""
+        vocabulary = default_vocabulary()
+        
         # Extract user skills from various parts of the portfolio
-        user_skills = set(s.lower() for s in portfolio.get('skills', []) if s)
+        user_skills = list(portfolio.get('skills', []))
         
         # Add skills from projects
         for project in portfolio.get('projects', []):
             if project.get('technologies'):
-                user_skills.update(t.lower() for t in project.get('technologies', []) if t)
+                user_skills.extend(project.get('technologies', []))
         
         # Add skills from certificates
         for cert in portfolio.get('certificates', []):
             if cert.get('skills'):
-                user_skills.update(s.lower() for s in cert.get('skills', []) if s)
+                user_skills.extend(cert.get('skills', []))
+        
+        user_skill_ids = set(vocabulary.skill_ids(user_skills))
         
         # Extract required skills from job
-        required_skills = set(s.lower() for s in job_data.get('requirements', []) if s)
-        # Add keywords from job title and description
-        required_skills.update(PortfolioAnalyzer.extract_skills_from_text(job_data.get('title', '')))
-        required_skills.update(PortfolioAnalyzer.extract_skills_from_text(job_data.get('description', '')))
-        
-        # Find matching skills (strengths)
-        strengths = []
-        for user_skill in user_skills:
-            for req_skill in required_skills:
-                if user_skill in req_skill or req_skill in user_skill:
-                    strengths.append(req_skill)
-                    break
-        
-        # Find missing skills (weaknesses)
-        weaknesses = list(required_skills - set(strengths))
+        required_skill_ids = vocabulary.skill_ids(job_data.get('requirements', []))
+        # Add known skills mentioned in the job title and description
+        for text in (job_data.get('title', ''), job_data.get('description', '')):
+            for word in PortfolioAnalyzer.extract_skills_from_text(text):
+                skill_id = vocabulary.id_of(word)
+                if skill_id is not None and skill_id not in required_skill_ids:
+                    required_skill_ids.append(skill_id)
+        
+        # Requirements outside the vocabulary are compared by canonical name
+        user_unknown = set(vocabulary.unknown_names(user_skills))
+        required_unknown = vocabulary.unknown_names(job_data.get('requirements', []))
+        
+        # Find matching skills (strengths) and missing skills (weaknesses)
+        strengths = vocabulary.names([skill_id for skill_id in required_skill_ids if skill_id in user_skill_ids])
+        weaknesses = vocabulary.names([skill_id for skill_id in required_skill_ids if skill_id not in user_skill_ids])
+        strengths.extend(name for name in required_unknown if name in user_unknown)
+        weaknesses.extend(name for name in required_unknown if name not in user_unknown)
         
         return {
             'strengths': strengths,
@@ -0,0 +1,254 @@
+"""
+Portfolio feature store
+
+Derived portfolio features (experience years, highest education level,
+canonical skill bitset, language levels and the TF-IDF row) are computed once
+per portfolio version instead of on every scoring call. The version is a
+hash of the fields the features are derived from, so an edited portfolio is
+recomputed on its next use, and every route reading those fields shares the
+entry whatever else it projects. Entries live in an in-process LRU and, optionally, in a Mongo
+side collection shared by all workers.
+"""
+import os
+import threading
+import weakref
+from datetime import datetime
+from collections import OrderedDict
+from app.utils.result_cache import document_version
+from app.utils.skill_vocabulary import default_vocabulary
+from app.services.sub_scores import language_levels, highest_education_level
+
+# Portfolio fields the features are derived from; every projection of portfolios
+# that are scored must read them all
+PORTFOLIO_FEATURE_FIELDS = ('skills', 'experience', 'education', 'languages', 'projects')
+
+
+def _derived(function, value):
+    """function(value), or None when the field is malformed; callers then compute it from the document"""
+    try:
+        return function(value)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def experience_terms(experiences):
+    """
+    Years of each dated experience entry, for experience_score
+
+    Current positions are kept as {'currentSince': startDate}, since their
+    length grows with the current date.
+    """
+    terms = []
+    for exp in experiences or []:
+        start_date = exp.get('startDate')
+        if exp.get('currentlyWorking'):
+            if start_date:
+                terms.append({'currentSince': start_date})
+        elif start_date and exp.get('endDate'):
+            terms.append((exp['endDate'] - start_date).days / 365.25)  # Account for leap years
+    return terms
+
+
+def experience_score(features):
+    """PortfolioAnalyzer.calculate_experience_score from the stored experience terms, or None"""
+    if not features['has_experience']:
+        return 0
+    if features['experience_terms'] is None:
+        return None
+
+    total_years = 0
+    now = None
+    for term in features['experience_terms']:
+        if isinstance(term, dict):
+            now = now or datetime.now()
+            term = (now - term['currentSince']).days / 365.25
+        total_years += term
+
+    return round(min(total_years * 10, 100), 2)
+
+
+class PortfolioFeatureStore:
+    """LRU of derived portfolio features, keyed on portfolio id and version"""
+
+    def __init__(self, max_entries=10000, collection=None):
+        """
+        Parameters:
+        - max_entries: Number of portfolios kept in memory, least recently used are dropped
+        - collection: Optional Mongo collection persisting the features between workers
+        """
+        self.max_entries = max_entries
+        self.collection = collection
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.uncached = 0
+
+    @classmethod
+    def from_env(cls):
+        """Create a store sized from PORTFOLIO_FEATURE_CACHE_SIZE"""
+        return cls(max_entries=int(os.environ.get('PORTFOLIO_FEATURE_CACHE_SIZE', 10000)))
+
+    def attach(self, db):
+        """Persist features in the collection named by PORTFOLIO_FEATURES_COLLECTION, if set"""
+        name = os.environ.get('PORTFOLIO_FEATURES_COLLECTION')
+        if name and db is not None:
+            self.collection = db[name]
+
+    @staticmethod
+    def _key(portfolio):
+        """(key, version) of a portfolio, or (None, None) if it cannot be cached"""
+        portfolio_id = portfolio.get('_id', portfolio.get('userId'))
+        version = document_version({field: portfolio.get(field) for field in PORTFOLIO_FEATURE_FIELDS})
+        if portfolio_id is None or version is None:
+            return None, None
+        return str(portfolio_id), version
+
+    def get(self, portfolio):
+        """
+        Derived features of a portfolio
+
+        Returns a dict with 'skill_ids', 'skill_bits', 'unknown_skills' (names
+        outside the skill vocabulary), 'has_experience', 'experience_years',
+        'experience_terms', 'education_level' and 'languages'.
+        Fields that cannot be derived from a malformed document are None.
+        Callers must not modify it.
+        """
+        vocabulary = default_vocabulary()
+        key, version = self._key(portfolio)
+        if key is None:
+            self.uncached += 1
+            return self._compute(portfolio, vocabulary)
+
+        # Read before computing: skills indexed meanwhile are then picked up on the next use
+        vocabulary_size = len(vocabulary)
+        with self._lock:
+            entry = self._entries.get(key)
+            # Skill ids are only valid for the vocabulary that assigned them, and skills
+            # it did not know may have been added since by indexed job posts
+            if entry is not None and entry['version'] == version and entry['vocabulary']() is vocabulary and \
+                    (not entry['unknown_skills'] or entry['vocabulary_size'] == vocabulary_size):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        entry = self._load(key, version, vocabulary)
+        if entry is not None:
+            # Persisted features only keep the known skills
+            entry['unknown_skills'] = frozenset(vocabulary.unknown_names(portfolio.get('skills', [])))
+        else:
+            entry = self._compute(portfolio, vocabulary)
+        entry['version'] = version
+        entry['vocabulary'] = weakref.ref(vocabulary)
+        entry['vocabulary_size'] = vocabulary_size
+        if self.collection is not None and not entry.get('persisted'):
+            self._persist(key, entry)
+
+        user_id = portfolio.get('userId')
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if user_id is not None:
+                self._keys_by_user[str(user_id)] = key
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def embedding(self, portfolio, vectorizer, text):
+        """
+        TF-IDF row of a portfolio, transformed once per portfolio version and vectorizer
+
+        Parameters:
+        - vectorizer: Fitted vectorizer currently in use
+        - text: Function building the portfolio text, used on a miss
+        """
+        entry = self.get(portfolio)
+        cached = entry.get('tfidf')
+        if cached is not None and cached[0]() is vectorizer:
+            return cached[1]
+
+        row = vectorizer.transform([text(portfolio)])
+        # Replaced as one tuple, so concurrent readers never see a row of another vectorizer
+        entry['tfidf'] = (weakref.ref(vectorizer), row)
+        return row
+
+    def invalidate_user(self, user_id):
+        """Drop the features of a user's portfolio; the version check makes this optional"""
+        with self._lock:
+            key = self._keys_by_user.pop(str(user_id), None)
+            return self._entries.pop(key, None) is not None if key else False
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'loaded_from_mongo': self.loads,
+                'uncached': self.uncached
+            }
+
+    @staticmethod
+    def _compute(portfolio, vocabulary):
+        skill_ids = vocabulary.skill_ids(portfolio.get('skills', []))
+        experiences = portfolio.get('experience') or []
+        return {
+            'skill_ids': skill_ids,
+            'skill_bits': vocabulary.bitset(skill_ids),
+            'unknown_skills': frozenset(vocabulary.unknown_names(portfolio.get('skills', []))),
+            'has_experience': bool(experiences),
+            'experience_years': _derived(lambda entries: sum(exp.get('years', 0) for exp in entries), experiences),
+            'experience_terms': _derived(experience_terms, experiences),
+            'education_level': _derived(highest_education_level, portfolio.get('education')),
+            'languages': _derived(language_levels, portfolio.get('languages'))
+        }
+
+    def _load(self, key, version, vocabulary):
+        """Features persisted by any worker for this portfolio version, or None"""
+        if self.collection is None:
+            return None
+        try:
+            document = self.collection.find_one({'_id': key, 'version': version})
+        except Exception as e:
+            print(f"Error loading portfolio features: {str(e)}")
+            return None
+        if not document:
+            return None
+
+        # Skills are stored by canonical name: ids are assigned per process
+        skill_ids = vocabulary.skill_ids(document['skills'])
+        self.loads += 1
+        return {
+            'skill_ids': skill_ids,
+            'skill_bits': vocabulary.bitset(skill_ids),
+            'has_experience': document['has_experience'],
+            'experience_years': document['experience_years'],
+            'experience_terms': document['experience_terms'],
+            'education_level': document['education_level'],
+            'languages': document['languages'],
+            'persisted': True
+        }
+
+    def _persist(self, key, entry):
+        document = {
+            'version': entry['version'],
+            'skills': default_vocabulary().names(entry['skill_ids']),
+            'has_experience': entry['has_experience'],
+            'experience_years': entry['experience_years'],
+            'experience_terms': entry['experience_terms'],
+            'education_level': entry['education_level'],
+            'languages': entry['languages'],
+            'updatedAt': datetime.now()
+        }
+        try:
+            self.collection.replace_one({'_id': key}, document, upsert=True)
+            entry['persisted'] = True
+        except Exception as e:
+            print(f"Error saving portfolio features: {str(e)}")
@@ -0,0 +1,39 @@
+"""
+Process memory reporting
+
+Reads the resident set size of the current worker, split into private
+(anonymous) memory and file-backed pages such as memory-mapped models, which
+are shared by all workers mapping the same files. Outside Linux only the
+peak RSS is reported, and on Windows no RSS figure at all.
+"""
+import os
+import sys
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Fields of /proc/self/status reported, in kB
+STATUS_FIELDS = {
+    'VmRSS': 'rss_bytes',
+    'RssAnon': 'rss_anon_bytes',
+    'RssFile': 'rss_file_bytes',
+    'RssShmem': 'rss_shmem_bytes'
+}
+
+
+def process_memory():
+    """Return the memory usage of this process in bytes"""
+    usage = {'pid': os.getpid()}
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in STATUS_FIELDS:
+                    usage[STATUS_FIELDS[name]] = int(value.split()[0]) * 1024
+    except OSError:
+        # Not on Linux: only the peak RSS is available (kB on Linux, bytes on macOS)
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            usage['max_rss_bytes'] = peak if sys.platform == 'darwin' else peak * 1024
+    return usage
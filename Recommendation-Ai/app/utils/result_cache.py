@@ -0,0 +1,163 @@
+"""
+Recommendation result cache
+
+LRU cache with a time to live and a memory cap for generated recommendations.
+Keys carry a hash of the user, portfolio and job documents as read, so an
+edited document never serves an old result; the user and job indexes allow
+explicit invalidation when a portfolio or job post changes.
+"""
+import copy
+import json
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+
+
+def document_version(document):
+    """
+    Version of a Mongo document: a hash of the fields that were read
+
+    updatedAt and __v alone are not a change signal: the back-end sets
+    updatedAt at most once, when a document is created, and mongoose only
+    bumps __v on array changes.
+    """
+    if not document:
+        return None
+    encoded = json.dumps(document, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache of JSON-serializable results, capped in bytes"""
+
+    def __init__(self, ttl=600.0, max_bytes=64 * 1024 * 1024):
+        """
+        Parameters:
+        - ttl: Seconds a result is served from the cache
+        - max_bytes: Approximate memory cap, measured on the JSON size of the results
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._keys_by_job = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(user_id, job_id, user=None, portfolio=None, job=None):
+        """Cache key of a user/job pair at the current document versions"""
+        return (
+            str(user_id),
+            str(job_id),
+            document_version(user),
+            document_version(portfolio),
+            document_version(job)
+        )
+
+    @staticmethod
+    def make_keys(user_id, jobs, user=None, portfolio=None):
+        """Cache keys of one user and many jobs (job id string to job), hashing the user and portfolio once"""
+        user_version = document_version(user)
+        portfolio_version = document_version(portfolio)
+        return {
+            job_id: (str(user_id), str(job_id), user_version, portfolio_version, document_version(job))
+            for job_id, job in jobs.items()
+        }
+
+    def get(self, key):
+        """Return a copy of the cached result, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, size, value = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        # Callers may modify the result they get back
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        """Cache a copy of a result; results larger than the cap are not cached"""
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return False
+
+        value = copy.deepcopy(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.time() + self.ttl, size, value)
+            self._bytes += size
+            self._keys_by_user.setdefault(key[0], set()).add(key)
+            self._keys_by_job.setdefault(key[1], set()).add(key)
+
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def invalidate_user(self, user_id):
+        """Drop the results of a user, e.g. after their profile or portfolio changed"""
+        with self._lock:
+            return self._invalidate(self._keys_by_user.get(str(user_id), set()))
+
+    def invalidate_job(self, job_id):
+        """Drop the results for a job post after it was edited or closed"""
+        with self._lock:
+            return self._invalidate(self._keys_by_job.get(str(job_id), set()))
+
+    def clear(self):
+        with self._lock:
+            return self._invalidate(set(self._entries))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+    def _invalidate(self, keys):
+        keys = list(keys)
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        for index, owner in ((self._keys_by_user, key[0]), (self._keys_by_job, key[1])):
+            keys = index.get(owner)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[owner]
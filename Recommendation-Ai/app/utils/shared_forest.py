@@ -0,0 +1,120 @@
+"""
+Shared random forest
+
+Flattens a fitted RandomForestClassifier into a handful of plain NumPy arrays
+(one concatenated node table for all trees) saved as .npy files. Loading them
+with mmap_mode='r' lets every worker process on a host share one read-only
+copy through the page cache, whereas unpickling the forest gives each worker
+its own copy of every tree.
+"""
+import os
+import numpy as np
+
+# Arrays making up a saved forest
+FOREST_ARRAYS = ('roots', 'feature', 'threshold', 'children', 'value', 'classes')
+
+# Marks a leaf in sklearn's children arrays
+LEAF = -1
+
+
+class SharedForestPredictor:
+    """Read-only predict/predict_proba over a flattened random forest"""
+
+    def __init__(self, roots, feature, threshold, children, value, classes, n_features_in):
+        """
+        Parameters:
+        - roots: Node number of the root of every tree
+        - feature, threshold: Split of every node (feature is LEAF for leaves)
+        - children: Absolute node numbers of the (right, left) children of every node
+        - value: Class probabilities of every node
+        - classes: Class labels, in the column order of value
+        - n_features_in: Number of features the forest was fitted on
+        """
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.classes_ = classes
+        self.n_features_in_ = n_features_in
+
+    @classmethod
+    def from_forest(cls, forest):
+        """Flatten a fitted RandomForestClassifier"""
+        roots, feature, threshold, children, value = [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == LEAF
+
+            roots.append(offset)
+            feature.append(np.where(is_leaf, LEAF, tree.feature).astype(np.int32))
+            threshold.append(tree.threshold.astype(np.float64))
+            # Right child first, so that the outcome of the split test indexes the next node
+            children.append(np.stack([
+                np.where(is_leaf, LEAF, tree.children_right + offset),
+                np.where(is_leaf, LEAF, tree.children_left + offset)
+            ], axis=1).astype(np.int32))
+
+            # Trees store class counts (or fractions); predict_proba normalizes them per node
+            counts = tree.value[:, 0, :].astype(np.float64)
+            totals = counts.sum(axis=1, keepdims=True)
+            totals[totals == 0] = 1.0
+            value.append(counts / totals)
+            offset += tree.node_count
+
+        return cls(
+            np.array(roots, dtype=np.int32),
+            np.concatenate(feature),
+            np.concatenate(threshold),
+            np.concatenate(children),
+            np.concatenate(value),
+            np.asarray(forest.classes_),
+            forest.n_features_in_
+        )
+
+    def save(self, path):
+        """Save the arrays as .npy files in a directory"""
+        os.makedirs(path, exist_ok=True)
+        for name in FOREST_ARRAYS:
+            array = self.classes_ if name == 'classes' else getattr(self, name)
+            np.save(os.path.join(path, f"{name}.npy"), array)
+
+        # n_features_in_ is stored as a one-element array to keep the format .npy only
+        np.save(os.path.join(path, 'n_features_in.npy'), np.array([self.n_features_in_]))
+
+    @staticmethod
+    def files(path):
+        """Paths of the files written by save"""
+        return [os.path.join(path, f"{name}.npy") for name in FOREST_ARRAYS + ('n_features_in',)]
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Load a saved forest, memory-mapping the node arrays"""
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in FOREST_ARRAYS}
+        n_features_in = int(np.load(os.path.join(path, 'n_features_in.npy'))[0])
+        # Class labels are tiny and compared by value, keep them as a regular array
+        arrays['classes'] = np.array(arrays['classes'])
+        return cls(n_features_in=n_features_in, **arrays)
+
+    def predict_proba(self, X):
+        """Average of the leaf class probabilities of all trees, like RandomForestClassifier"""
+        # sklearn evaluates splits on float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n_trees = len(self.roots)
+        flat_X = X.ravel()
+
+        # One position per (row, tree); only positions not yet on a leaf are advanced
+        nodes = np.tile(self.roots, len(X))
+        row_offsets = np.repeat(np.arange(len(X)) * X.shape[1], n_trees)
+        active = np.flatnonzero(self.feature[nodes] != LEAF)
+        while len(active):
+            current = nodes[active]
+            goes_left = flat_X[row_offsets[active] + self.feature[current]] <= self.threshold[current]
+            nodes[active] = self.children[current, goes_left.view(np.int8)]
+            active = active[self.feature[nodes[active]] != LEAF]
+
+        return self.value[nodes].reshape(len(X), n_trees, -1).mean(axis=1)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
@@ -0,0 +1,320 @@
+"""
+Canonical skill vocabulary
+
+Maps skill names to canonical skills with integer ids, so portfolios and job
+posts can carry their skills as packed bitsets and matching becomes a popcount
+of AND-ed bitsets. Names are normalized once (case, spacing, aliases such as
+"reactjs" or "k8s"), and longer requirement phrases are split into the known
+skills they mention, on word boundaries, so "java" no longer matches
+"javascript" the way substring tests did.
+
+Ids are assigned once: the vocabulary is built from jobposts.requirements,
+portfolio skills and project technologies, saved next to the models, and only
+ever appended to, so ids stay stable across restarts. At runtime only indexed
+job posts add skills, in index order, so every worker assigns the same ids and
+skills typed by users never grow the vocabulary; lookups report the names they
+do not know (unknown_names), so callers can still compare those by name.
+"""
+import os
+import re
+import json
+import threading
+import numpy as np
+
+# Alternative spellings of common skills, by canonical name
+SKILL_ALIASES = {
+    'javascript': ['js', 'ecmascript', 'es6'],
+    'typescript': ['ts'],
+    'node.js': ['node', 'nodejs', 'node js'],
+    'react': ['reactjs', 'react.js', 'react js'],
+    'vue.js': ['vue', 'vuejs', 'vue js'],
+    'angular': ['angularjs', 'angular.js'],
+    'express': ['express.js', 'expressjs'],
+    'python': ['python3', 'py'],
+    'go': ['golang'],
+    'c#': ['csharp', 'c sharp'],
+    'c++': ['cpp'],
+    '.net': ['dotnet', 'dot net'],
+    'postgresql': ['postgres', 'psql'],
+    'mongodb': ['mongo'],
+    'mysql': ['my sql'],
+    'kubernetes': ['k8s'],
+    'aws': ['amazon web services'],
+    'google cloud': ['gcp', 'google cloud platform'],
+    'azure': ['microsoft azure'],
+    'ci/cd': ['cicd', 'ci cd', 'continuous integration'],
+    'machine learning': ['ml'],
+    'restful api': ['rest', 'rest api', 'restful', 'restful apis', 'rest apis'],
+    'tailwindcss': ['tailwind', 'tailwind css'],
+    'websockets': ['websocket', 'web sockets'],
+    'html': ['html5'],
+    'css': ['css3'],
+    'sass': ['scss'],
+}
+
+# Longest phrase, in words, looked up when splitting a requirement into skills
+MAX_SKILL_WORDS = 3
+
+# Characters that are part of skill names ("c++", "c#", "node.js", "ci/cd")
+_TOKEN_PATTERN = re.compile(r"[a-z0-9+#./-]+")
+
+# Number of set bits of every byte value; numpy 1.24 has no bitwise_count
+POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def skill_text(skill):
+    """Name of a skill given as a string or as a {'name': ...} document"""
+    if isinstance(skill, dict):
+        skill = skill.get('name')
+    return skill if isinstance(skill, str) else ''
+
+
+def normalize_skill(skill):
+    """Lowercase a skill name, collapse spaces and trim surrounding punctuation"""
+    text = ' '.join(skill_text(skill).lower().split())
+    return text.strip(' ,;:()[]"\'!?*')
+
+
+def popcount(bitsets):
+    """Number of set bits along the last axis of uint64 bitsets"""
+    bitsets = np.ascontiguousarray(bitsets, dtype=np.uint64)
+    return POPCOUNT_TABLE[bitsets.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def overlap_counts(bitset, bitsets):
+    """
+    Skills shared between one bitset and each row of a bitset matrix
+
+    Bitsets of different widths are compared over the shorter one; the missing
+    words are zero.
+    """
+    width = min(len(bitset), bitsets.shape[-1])
+    return popcount(bitsets[..., :width] & bitset[:width])
+
+
+class SkillVocabulary:
+    """Canonical skills with stable integer ids and alias resolution"""
+
+    # File name of the vocabulary, inside PortfolioAnalyzer.MODEL_PATH
+    FILE_NAME = 'skill_vocabulary.json'
+
+    def __init__(self, skills=None, aliases=None):
+        """
+        Parameters:
+        - skills: Canonical skill names, in id order
+        - aliases: Dict of canonical name to alternative spellings (default: SKILL_ALIASES)
+        """
+        self._ids = {}
+        self.skills = []
+        self._aliases = {}
+        # Split of each phrase looked up, with the vocabulary size it was computed for
+        self._terms = {}
+        self._lock = threading.Lock()
+
+        for canonical, spellings in (SKILL_ALIASES if aliases is None else aliases).items():
+            self.add_alias(canonical, spellings)
+        for skill in skills or []:
+            self._add(normalize_skill(skill))
+
+    def __len__(self):
+        return len(self.skills)
+
+    @property
+    def words(self):
+        """Width, in uint64 words, of the bitsets of the current vocabulary"""
+        return max(1, (len(self.skills) + 63) // 64)
+
+    def add_alias(self, canonical, spellings):
+        canonical = normalize_skill(canonical)
+        for spelling in spellings:
+            self._aliases[normalize_skill(spelling)] = canonical
+
+    def canonical(self, skill):
+        """Canonical name of a skill name, resolving aliases"""
+        name = normalize_skill(skill)
+        return self._aliases.get(name, name)
+
+    def _add(self, canonical):
+        """Id of a canonical skill, assigning the next id to a new one"""
+        skill_id = self._ids.get(canonical)
+        if skill_id is None and canonical:
+            with self._lock:
+                skill_id = self._ids.get(canonical)
+                if skill_id is None:
+                    skill_id = len(self.skills)
+                    self.skills.append(canonical)
+                    self._ids[canonical] = skill_id
+                    # Phrases split before may mention the new skill
+                    self._terms = {}
+        return skill_id
+
+    def id_of(self, skill):
+        """Id of a known skill name or alias, or None"""
+        return self._ids.get(self.canonical(skill))
+
+    def ids_of(self, skill, add=False):
+        """
+        Ids of the skills named by one skill name or requirement phrase
+
+        A known name or alias is one skill. Otherwise the phrase is split into
+        the known skills it mentions, longest first; a phrase mentioning none is
+        added as a new skill when add is True, and has no ids otherwise.
+        """
+        name = normalize_skill(skill)
+        if not name:
+            return []
+
+        # Read before splitting: a skill added meanwhile makes the entry stale
+        size = len(self.skills)
+        cached = self._terms.get(name)
+        if cached is not None and cached[0] == size:
+            terms = cached[1]
+        else:
+            terms = self._split(name)
+            if len(self._terms) < 100000:
+                self._terms[name] = (size, terms)
+        if terms:
+            return terms
+
+        canonical = self._aliases.get(name, name)
+        skill_id = self._add(canonical) if add else self._ids.get(canonical)
+        return [skill_id] if skill_id is not None else []
+
+    def _split(self, name):
+        """Ids of the known skills mentioned in a name, empty if the name is not known"""
+        canonical = self._aliases.get(name, name)
+        if canonical in self._ids:
+            return [self._ids[canonical]]
+
+        # Trailing punctuation is not part of a skill, a leading dot is (".net")
+        tokens = [token.rstrip('.,/-') for token in _TOKEN_PATTERN.findall(name)]
+        if len(tokens) < 2:
+            return []
+
+        found = []
+        start = 0
+        while start < len(tokens):
+            for length in range(min(MAX_SKILL_WORDS, len(tokens) - start), 0, -1):
+                phrase = ' '.join(tokens[start:start + length])
+                skill_id = self._ids.get(self._aliases.get(phrase, phrase))
+                if skill_id is not None:
+                    if skill_id not in found:
+                        found.append(skill_id)
+                    start += length
+                    break
+            else:
+                start += 1
+        return found
+
+    def skill_ids(self, skills, add=False):
+        """Distinct ids of a list of skill names, in order of appearance"""
+        ids = {}
+        for skill in skills or []:
+            for skill_id in self.ids_of(skill, add=add):
+                ids[skill_id] = None
+        return list(ids)
+
+    def bitset(self, skill_ids, words=None):
+        """Packed uint64 bitset of skill ids"""
+        skill_ids = np.asarray(list(skill_ids), dtype=np.int64)
+        words = max(words or 0, self.words, int(skill_ids.max()) // 64 + 1 if len(skill_ids) else 0)
+        bits = np.zeros(words, dtype=np.uint64)
+        np.bitwise_or.at(bits, skill_ids // 64, np.left_shift(np.uint64(1), (skill_ids % 64).astype(np.uint64)))
+        return bits
+
+    def unknown_names(self, skills):
+        """Distinct canonical names of the skill names that map to no known skill"""
+        names = {}
+        for skill in skills or []:
+            if not self.ids_of(skill):
+                name = self.canonical(skill)
+                if name:
+                    names[name] = None
+        return list(names)
+
+    def skills_bitset(self, skills, add=False):
+        """Packed bitset of a list of skill names"""
+        return self.bitset(self.skill_ids(skills, add=add))
+
+    def bitset_matrix(self, bitsets):
+        """Stack bitsets of possibly different widths into one zero-padded matrix"""
+        words = max([len(bits) for bits in bitsets] + [self.words])
+        matrix = np.zeros((len(bitsets), words), dtype=np.uint64)
+        for row, bits in enumerate(bitsets):
+            matrix[row, :len(bits)] = bits
+        return matrix
+
+    def names(self, skill_ids):
+        return [self.skills[skill_id] for skill_id in skill_ids]
+
+    @staticmethod
+    def default_path(model_path):
+        return os.path.join(model_path, SkillVocabulary.FILE_NAME)
+
+    @classmethod
+    def build(cls, db, base=None):
+        """
+        Assign ids to every skill found in the database
+
+        Single-skill names are added before phrases, so phrases resolve to the
+        skills they mention. Ids of an existing vocabulary are kept.
+        """
+        vocabulary = base or cls()
+        names = []
+        for job in db.jobposts.find({}, {'requirements': 1}):
+            names.extend(job.get('requirements') or [])
+        for portfolio in db.portfolios.find({}, {'skills': 1, 'projects': 1}):
+            names.extend(portfolio.get('skills') or [])
+            for project in portfolio.get('projects') or []:
+                names.extend(project.get('technologies') or [])
+
+        names = [normalize_skill(name) for name in names]
+        for name in sorted(set(names), key=lambda name: (len(_TOKEN_PATTERN.findall(name)), name)):
+            vocabulary.ids_of(name, add=True)
+        return vocabulary
+
+    def save(self, path):
+        """Write the vocabulary as JSON, replacing the file atomically"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'skills': self.skills}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls(json.load(f)['skills'])
+
+    @classmethod
+    def load_or_build(cls, db, path):
+        """Load the saved vocabulary, or build it from the database and save it"""
+        if os.path.exists(path):
+            try:
+                return cls.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Error loading skill vocabulary: {str(e)}")
+
+        vocabulary = cls.build(db) if db is not None else cls()
+        if len(vocabulary) == 0:
+            # Nothing to pin yet: ids are assigned as skills are seen
+            return vocabulary
+        try:
+            vocabulary.save(path)
+        except OSError as e:
+            print(f"Error saving skill vocabulary: {str(e)}")
+        return vocabulary
+
+
+# Vocabulary shared by the static matching helpers of the process
+_default_vocabulary = SkillVocabulary()
+
+
+def default_vocabulary():
+    return _default_vocabulary
+
+
+def set_default_vocabulary(vocabulary):
+    """Serve a loaded vocabulary from default_vocabulary(); ids already handed out stay valid only if it extends the old one"""
+    global _default_vocabulary
+    _default_vocabulary = vocabulary
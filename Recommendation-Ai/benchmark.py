@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+"""
+TuniHire AI Recommendation Benchmarks
+
+Measures API latency in-process through the Flask test client, so results do
+not depend on a web server. Uses the database from MONGO_URI; when MongoDB is
+not reachable the mock database is seeded with synthetic data.
+
+Usage:
+    python benchmark.py recommendation [--requests N] [--modes M1,M2] [--simulated-latency-ms MS]
+    python benchmark.py batch [--jobs N] [--repeat N] [--simulated-latency-ms MS]
+    python benchmark.py subscores [--size N]
+    python benchmark.py skills [--portfolios N] [--jobs N]
+    python benchmark.py candidates [--catalogs N1,N2] [--portfolios N]
+
+Commands:
+    recommendation   p50/p99 latency and Mongo round trips of /api/recommendation
+                     for each data loading mode (aggregate, concurrent, sequential)
+    batch            One /api/recommendations/batch request against the same number
+                     of /api/recommendation requests for one user
+    subscores        Per-pair sub-score methods against the vectorized engine, for
+                     one portfolio x N jobs and N portfolios x one job
+    skills           Substring skill matching against canonical skill bitsets:
+                     throughput and the matches that changed
+    candidates       Better-matches ranking with skill-index candidate generation
+                     against a full scan, for growing job catalogs
+"""
+
+import sys
+import time
+import random
+import argparse
+from dotenv import load_dotenv
+
+# Load environment variables from .env file for local dev
+load_dotenv()
+
+import numpy as np
+from bson import ObjectId
+from sklearn.feature_extraction.text import TfidfVectorizer
+from app import flask_app
+from app.routes import db, recommendation_service
+from app.utils.db_connection import MockDatabase, MockCollection
+from app.utils.mongo_stats import track_mongo
+from app.services.recommendation_data import RecommendationDataLoader, LOAD_MODES
+from app.services.sub_scores import (
+    PortfolioEncoding, JobSetEncoding, EDUCATION_LEVELS, PROFICIENCY_LEVELS,
+    score_portfolio_against_jobs, score_portfolios_against_job
+)
+from app.utils.skill_vocabulary import SkillVocabulary, SKILL_ALIASES, overlap_counts, popcount
+from app.utils.job_index import JobEmbeddingIndex, CandidatePolicy
+from test_data_generator import TECH_SKILLS, SOFT_SKILLS, JOB_TITLES, COMPANIES
+
+
+def seed_mock_database(count):
+    """Fill the mock database with synthetic users, portfolios, companies and jobs"""
+    rng = random.Random(42)
+    company_ids = []
+    for name in COMPANIES:
+        company_id = ObjectId()
+        db.companies.insert_one({'_id': company_id, 'name': name})
+        company_ids.append(company_id)
+
+    for _ in range(count):
+        user_id = ObjectId()
+        db.users.insert_one({'_id': user_id, 'firstName': 'Test', 'lastName': 'User',
+                             'subscription': rng.choice(['Free', 'Golden', 'Platinum', 'Master'])})
+        db.portfolios.insert_one({'_id': ObjectId(), 'userId': user_id,
+                                  'skills': rng.sample(TECH_SKILLS, 8), 'experience': [], 'education': []})
+        db.jobposts.insert_one({'_id': ObjectId(), 'title': rng.choice(JOB_TITLES),
+                                'requirements': rng.sample(TECH_SKILLS, 6), 'companyId': rng.choice(company_ids)})
+
+
+def simulate_latency(latency_ms):
+    """Delay every mock collection query, standing in for the network round trip"""
+    delay = latency_ms / 1000.0
+    for name in ('find_one', 'find', 'count_documents'):
+        method = getattr(MockCollection, name)
+
+        def delayed(self, *args, _method=method, **kwargs):
+            time.sleep(delay)
+            return _method(self, *args, **kwargs)
+
+        setattr(MockCollection, name, delayed)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def run_recommendation_benchmark(args):
+    """Time /api/recommendation with every requested data loading mode"""
+    if isinstance(db, MockDatabase):
+        if db.users.count_documents() == 0:
+            seed_mock_database(args.users)
+        if args.simulated_latency_ms:
+            simulate_latency(args.simulated_latency_ms)
+
+    user_ids = [user['_id'] for user in db.users.find({}, {'_id': 1}).limit(args.users)]
+    job_ids = [job['_id'] for job in db.jobposts.find({}, {'_id': 1}).limit(args.users)]
+    if not user_ids or not job_ids:
+        print("No users or job posts to benchmark with")
+        return 1
+
+    rng = random.Random(0)
+    pairs = [(rng.choice(user_ids), rng.choice(job_ids)) for _ in range(args.requests)]
+    client = flask_app.test_client()
+
+    print(f"{'mode':<22} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8} {'round trips':>12}")
+    for mode in args.modes.split(','):
+        loader = RecommendationDataLoader(db, recommendation_service.company_cache, mode=mode)
+        recommendation_service.data_loader = loader
+        recommendation_service.result_cache.clear()
+
+        # Warm up caches and connections before measuring
+        client.get(f"/api/recommendation?user_id={pairs[0][0]}&job_id={pairs[0][1]}")
+
+        latencies = []
+        round_trips = 0
+        for user_id, job_id in pairs:
+            with track_mongo() as stats:
+                started = time.perf_counter()
+                client.get(f"/api/recommendation?user_id={user_id}&job_id={job_id}")
+                latencies.append(time.perf_counter() - started)
+            round_trips += stats['round_trips']
+
+        label = mode if loader.mode == mode else f"{mode}->{loader.mode}"
+        print(f"{label:<22} {percentile_ms(latencies, 50):>8.2f} {percentile_ms(latencies, 99):>8.2f} "
+              f"{np.mean(latencies) * 1000:>8.2f} {round_trips / len(pairs):>12.1f}")
+    return 0
+
+
+def run_batch_benchmark(args):
+    """Time one batch request against one request per job for the same user"""
+    if isinstance(db, MockDatabase):
+        if db.users.count_documents() < args.jobs:
+            seed_mock_database(args.jobs)
+        if args.simulated_latency_ms:
+            simulate_latency(args.simulated_latency_ms)
+
+    user = db.users.find_one({}, {'_id': 1})
+    job_ids = [str(job['_id']) for job in db.jobposts.find({}, {'_id': 1}).limit(args.jobs)]
+    if not user or not job_ids:
+        print("No users or job posts to benchmark with")
+        return 1
+
+    user_id = str(user['_id'])
+    client = flask_app.test_client()
+
+    def single_requests():
+        return [
+            client.get(f"/api/recommendation?user_id={user_id}&job_id={job_id}").get_json()['data']
+            for job_id in job_ids
+        ]
+
+    def batch_request():
+        response = client.post("/api/recommendations/batch", json={'user_id': user_id, 'job_ids': job_ids})
+        return response.get_json()['data']
+
+    print(f"{len(job_ids)} jobs, {args.repeat} runs (result cache cleared before each run)")
+    print(f"{'endpoint':<22} {'p50 ms':>8} {'mean ms':>8} {'round trips':>12}")
+    results = {}
+    for label, run in (('single', single_requests), ('batch', batch_request)):
+        latencies = []
+        round_trips = 0
+        for _ in range(args.repeat):
+            recommendation_service.result_cache.clear()
+            with track_mongo() as stats:
+                started = time.perf_counter()
+                results[label] = run()
+                latencies.append(time.perf_counter() - started)
+            round_trips += stats['round_trips']
+        print(f"{label:<22} {percentile_ms(latencies, 50):>8.2f} {np.mean(latencies) * 1000:>8.2f} "
+              f"{round_trips / args.repeat:>12.1f}")
+
+    score_fields = ('match_percentage', 'skills_match_percentage', 'experience_match', 'education_match', 'language_match')
+    mismatches = sum(
+        1 for single, batch in zip(results['single'], results['batch'])
+        if any(single.get(field) != batch.get(field) for field in score_fields)
+    )
+    print(f"Score mismatches between single and batch results: {mismatches}")
+    return 0
+
+
+def synthetic_scoring_documents(count, rng):
+    """Portfolios and job posts with every field the sub-scores read"""
+    languages = ['English', 'French', 'Arabic', 'German']
+    portfolios = [{
+        'skills': rng.sample(TECH_SKILLS, rng.randint(3, 12)),
+        'experience': [{'years': rng.randint(0, 6)} for _ in range(rng.randint(0, 3))],
+        'education': [{'degree': f"{rng.choice(list(EDUCATION_LEVELS))} in Computer Science"}],
+        'languages': [{'name': name, 'level': rng.choice(list(PROFICIENCY_LEVELS))}
+                      for name in rng.sample(languages, rng.randint(1, 3))]
+    } for _ in range(count)]
+    jobs = [{
+        'requirements': rng.sample(TECH_SKILLS, rng.randint(3, 8)),
+        'yearsOfExperienceRequired': rng.randint(0, 8),
+        'requiredEducationLevel': rng.choice(list(EDUCATION_LEVELS)),
+        'requiredLanguages': [{'name': name, 'level': rng.choice(list(PROFICIENCY_LEVELS))}
+                              for name in rng.sample(languages, rng.randint(1, 2))]
+    } for _ in range(count)]
+    return portfolios, jobs
+
+
+def run_subscores_benchmark(args):
+    """Time the per-pair sub-score methods against the vectorized engine"""
+    service = recommendation_service
+    portfolios, jobs = synthetic_scoring_documents(args.size, random.Random(7))
+
+    def per_pair(pairs):
+        return {
+            'skills': [service._calculate_skills_match(p, j) for p, j in pairs],
+            'experience': [service._calculate_experience_match(p, j) for p, j in pairs],
+            'education': [service._calculate_education_match(p, j) for p, j in pairs],
+            'language': [service._calculate_language_match(p, j) for p, j in pairs]
+        }
+
+    cases = (
+        ('1 portfolio x N jobs', [(portfolios[0], job) for job in jobs],
+         lambda: score_portfolio_against_jobs(portfolios[0], jobs),
+         lambda encoded: score_portfolio_against_jobs(portfolios[0], encoded), lambda: JobSetEncoding(jobs)),
+        ('N portfolios x 1 job', [(portfolio, jobs[0]) for portfolio in portfolios],
+         lambda: score_portfolios_against_job(portfolios, jobs[0]),
+         lambda encoded: score_portfolios_against_job(encoded, jobs[0]), lambda: PortfolioEncoding(portfolios)),
+    )
+
+    print(f"N = {args.size}")
+    print(f"{'case':<22} {'per-pair ms':>12} {'engine ms':>10} {'pre-encoded ms':>15} {'mismatches':>11}")
+    for label, pairs, engine, engine_encoded, encode in cases:
+        started = time.perf_counter()
+        expected = per_pair(pairs)
+        per_pair_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        scores = engine()
+        engine_ms = (time.perf_counter() - started) * 1000
+
+        encoded = encode()
+        started = time.perf_counter()
+        engine_encoded(encoded)
+        encoded_ms = (time.perf_counter() - started) * 1000
+
+        mismatches = sum(int(np.sum(np.asarray(expected[name]) != scores[name])) for name in expected)
+        print(f"{label:<22} {per_pair_ms:>12.2f} {engine_ms:>10.2f} {encoded_ms:>15.2f} {mismatches:>11}")
+    return 0
+
+
+def substring_skill_match(user_skills, required_skills):
+    """Skill match percentage as computed before the canonical vocabulary"""
+    user_skills_lower = [s.lower() for s in user_skills if s]
+    required_skills_lower = [s.lower() for s in required_skills if s]
+    matches = sum(1 for skill in required_skills_lower if any(us in skill or skill in us for us in user_skills_lower))
+    return round((matches / len(required_skills_lower)) * 100, 2)
+
+
+def run_skills_benchmark(args):
+    """Compare substring matching with canonical skill bitsets"""
+    rng = random.Random(11)
+    spellings = {skill: [skill] for skill in TECH_SKILLS + SOFT_SKILLS}
+    for skill in TECH_SKILLS:
+        spellings[skill] += SKILL_ALIASES.get(skill.lower(), [])[:2]
+    names = list(spellings)
+
+    def skill_list(count):
+        return [rng.choice(spellings[name]) for name in rng.sample(names, count)]
+
+    portfolios = [skill_list(rng.randint(5, 15)) for _ in range(args.portfolios)]
+    jobs = [skill_list(rng.randint(5, 12)) for _ in range(args.jobs)]
+    pairs = args.portfolios * args.jobs
+
+    started = time.perf_counter()
+    substring_scores = np.array([[substring_skill_match(p, j) for j in jobs] for p in portfolios])
+    substring_seconds = time.perf_counter() - started
+
+    vocabulary = SkillVocabulary(TECH_SKILLS + SOFT_SKILLS)
+    started = time.perf_counter()
+    portfolio_bits = vocabulary.bitset_matrix([vocabulary.skills_bitset(p) for p in portfolios])
+    job_bits = vocabulary.bitset_matrix([vocabulary.skills_bitset(j) for j in jobs])
+    encode_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    required = popcount(job_bits)
+    bitset_scores = np.round(
+        np.stack([overlap_counts(bits, job_bits) for bits in portfolio_bits]) / required * 100, 2
+    )
+    match_seconds = time.perf_counter() - started
+
+    print(f"{args.portfolios} portfolios x {args.jobs} jobs = {pairs} pairs, {len(vocabulary)} canonical skills")
+    print(f"{'matcher':<28} {'seconds':>9} {'pairs/s':>12}")
+    print(f"{'substring':<28} {substring_seconds:>9.3f} {pairs / substring_seconds:>12.0f}")
+    print(f"{'bitset (encode once)':<28} {encode_seconds:>9.3f}")
+    print(f"{'bitset popcount':<28} {match_seconds:>9.3f} {pairs / match_seconds:>12.0f}")
+
+    # Skill/requirement spellings that the two matchers disagree on
+    distinct = sorted({skill for skill_list in portfolios + jobs for skill in skill_list})
+    false_matches, alias_matches = [], []
+    for user_skill in distinct:
+        for requirement in distinct:
+            substring = user_skill.lower() in requirement.lower() or requirement.lower() in user_skill.lower()
+            canonical = bool(set(vocabulary.ids_of(user_skill)) & set(vocabulary.ids_of(requirement)))
+            if substring and not canonical:
+                false_matches.append((user_skill, requirement))
+            elif canonical and not substring:
+                alias_matches.append((user_skill, requirement))
+
+    changed = int(np.sum(substring_scores != bitset_scores))
+    print(f"Pairs whose skill match changed: {changed} ({changed / pairs:.1%}), "
+          f"mean change {np.mean(bitset_scores - substring_scores):+.2f} points")
+    print(f"Substring matches dropped ({len(false_matches)}): "
+          + ", ".join(f"{a} ~ {b}" for a, b in false_matches[:8]))
+    print(f"Alias matches gained ({len(alias_matches)}): "
+          + ", ".join(f"{a} = {b}" for a, b in alias_matches[:8]))
+    return 0
+
+
+def run_candidates_benchmark(args):
+    """Compare candidate generation with a full scan of the job index as the catalog grows"""
+    analyzer = recommendation_service.analyzer
+    rng = random.Random(17)
+    # Niche skills make most jobs irrelevant to a given portfolio, as in a real catalog
+    niche_skills = [f"toolkit{number}" for number in range(args.niche_skills)]
+
+    def skills(common, niche):
+        return rng.sample(TECH_SKILLS, common) + rng.sample(niche_skills, niche)
+
+    portfolios = [{
+        'skills': skills(rng.randint(2, 4), rng.randint(3, 8)),
+        'experience': [{'position': rng.choice(JOB_TITLES), 'years': rng.randint(0, 6)}],
+        'education': [{'degree': 'bachelor', 'fieldOfStudy': 'Computer Science'}]
+    } for _ in range(args.portfolios)]
+
+    print(f"{'jobs':>7} {'full scan p50':>14} {'candidates p50':>15} {'candidates':>11} {'full scans':>11} {'top-5 recall':>13}")
+    for catalog in [int(size) for size in args.catalogs.split(",")]:
+        jobs = [{
+            '_id': ObjectId(),
+            'title': rng.choice(JOB_TITLES),
+            'description': f"{rng.choice(JOB_TITLES)} at {rng.choice(COMPANIES)}",
+            'requirements': skills(rng.randint(1, 3), rng.randint(2, 5))
+        } for _ in range(catalog)]
+
+        # A vectorizer fitted on the synthetic catalog, so similarities reflect the skills
+        saved_vectorizer, saved_index = analyzer.skill_vectorizer, analyzer.job_index
+        analyzer.skill_vectorizer = TfidfVectorizer(token_pattern=r"[^\s]+").fit(
+            [analyzer.job_text(job) for job in jobs] + [analyzer.portfolio_text(p) for p in portfolios]
+        )
+        trimmed_jobs, matrix, features = JobEmbeddingIndex._embed(analyzer, jobs)
+        index = JobEmbeddingIndex(analyzer, matrix, trimmed_jobs, features, fingerprint=None)
+
+        analyzer.job_index = index
+        try:
+            timings, results = {}, {}
+            candidates_policy = CandidatePolicy.from_env()
+            candidates_policy.enabled = True
+            for name, policy in (('full', CandidatePolicy(enabled=False)), ('candidates', candidates_policy)):
+                index.candidate_policy = policy
+                index.candidate_stats = {'requests': 0, 'full_scans': 0, 'candidates': 0}
+                samples, results[name] = [], []
+                for portfolio in portfolios:
+                    started = time.perf_counter()
+                    matches = analyzer.find_best_matching_jobs(portfolio)
+                    samples.append(time.perf_counter() - started)
+                    results[name].append({str(job['_id']) for job, _ in matches})
+                timings[name] = samples
+            stats = index.stats()
+        finally:
+            analyzer.skill_vectorizer, analyzer.job_index = saved_vectorizer, saved_index
+
+        recall = np.mean([
+            len(full & found) / len(full) if full else 1.0
+            for full, found in zip(results['full'], results['candidates'])
+        ])
+        print(f"{catalog:>7} {percentile_ms(timings['full'], 50):>12.2f}ms "
+              f"{percentile_ms(timings['candidates'], 50):>13.2f}ms {stats['mean_candidates']:>11.0f} "
+              f"{stats['full_scans']:>11} {recall:>13.1%}")
+    return 0
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the TuniHire AI recommendation API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    recommendation_parser = subparsers.add_parser("recommendation", help="Latency of /api/recommendation per data loading mode")
+    recommendation_parser.add_argument("--requests", type=int, default=200, help="Requests per mode (default: 200)")
+    recommendation_parser.add_argument("--users", type=int, default=100, help="Users and jobs sampled, or seeded into the mock database (default: 100)")
+    recommendation_parser.add_argument("--modes", default=",".join(reversed(LOAD_MODES)), help="Comma-separated data loading modes")
+    recommendation_parser.add_argument("--simulated-latency-ms", type=float, default=0.0, help="Per-query delay added to the mock database (default: 0)")
+    recommendation_parser.set_defaults(handler=run_recommendation_benchmark)
+
+    batch_parser = subparsers.add_parser("batch", help="One batch request against one request per job")
+    batch_parser.add_argument("--jobs", type=int, default=100, help="Job posts per batch (default: 100)")
+    batch_parser.add_argument("--repeat", type=int, default=5, help="Runs per endpoint (default: 5)")
+    batch_parser.add_argument("--simulated-latency-ms", type=float, default=0.0, help="Per-query delay added to the mock database (default: 0)")
+    batch_parser.set_defaults(handler=run_batch_benchmark)
+
+    subscores_parser = subparsers.add_parser("subscores", help="Per-pair sub-score methods against the vectorized engine")
+    subscores_parser.add_argument("--size", type=int, default=5000, help="Number of jobs or portfolios scored (default: 5000)")
+    subscores_parser.set_defaults(handler=run_subscores_benchmark)
+
+    skills_parser = subparsers.add_parser("skills", help="Substring skill matching against canonical skill bitsets")
+    skills_parser.add_argument("--portfolios", type=int, default=500, help="Portfolios matched (default: 500)")
+    skills_parser.add_argument("--jobs", type=int, default=500, help="Job posts matched (default: 500)")
+    skills_parser.set_defaults(handler=run_skills_benchmark)
+
+    candidates_parser = subparsers.add_parser("candidates", help="Skill-index candidate generation against a full scan")
+    candidates_parser.add_argument("--catalogs", default="1000,5000,20000", help="Comma-separated job catalog sizes (default: 1000,5000,20000)")
+    candidates_parser.add_argument("--portfolios", type=int, default=50, help="Portfolios ranked per catalog (default: 50)")
+    candidates_parser.add_argument("--niche-skills", type=int, default=2000, help="Distinct uncommon skills in the catalog (default: 2000)")
+    candidates_parser.set_defaults(handler=run_candidates_benchmark)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
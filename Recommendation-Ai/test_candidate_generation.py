@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Test script for better-matches candidate generation
+
+Builds a job index over a synthetic catalog (common and niche skills, job
+titles shared with portfolio experience) and compares the top matches of
+find_best_matching_jobs with and without skill-index candidates:
+
+- the default policy scans every job, so its matches are the full scan's
+- with candidates enabled, the matches are the full scan's ranking restricted
+  to the candidate jobs; the share of the full scan's top matches they keep
+  is printed
+
+Usage:
+    python test_candidate_generation.py [--jobs N] [--portfolios N]
+"""
+
+import os
+import sys
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bson import ObjectId
+from sklearn.feature_extraction.text import TfidfVectorizer
+from app.routes import recommendation_service
+from app.utils.job_index import JobEmbeddingIndex, CandidatePolicy
+from app.utils.skill_vocabulary import default_vocabulary
+from test_data_generator import TECH_SKILLS, JOB_TITLES, COMPANIES
+
+# Top matches compared per portfolio
+LIMITS = (5, 20)
+
+
+def make_corpus(job_count, portfolio_count, seed=17):
+    """Portfolios and job posts drawing on common and niche skills"""
+    rng = random.Random(seed)
+    niche_skills = [f"toolkit{number}" for number in range(500)]
+
+    def skills(common, niche):
+        return rng.sample(TECH_SKILLS, common) + rng.sample(niche_skills, niche)
+
+    portfolios = [{
+        'skills': skills(rng.randint(2, 4), rng.randint(3, 8)),
+        'experience': [{'position': rng.choice(JOB_TITLES), 'years': rng.randint(0, 6)}],
+        'education': [{'degree': 'bachelor', 'fieldOfStudy': 'Computer Science'}]
+    } for _ in range(portfolio_count)]
+    jobs = [{
+        '_id': ObjectId(),
+        'title': rng.choice(JOB_TITLES),
+        'description': f"{rng.choice(JOB_TITLES)} at {rng.choice(COMPANIES)}",
+        'requirements': skills(rng.randint(1, 3), rng.randint(2, 5))
+    } for _ in range(job_count)]
+    return portfolios, jobs
+
+
+def build_index(analyzer, portfolios, jobs):
+    """Job index over the catalog, with a vectorizer fitted on it"""
+    analyzer.skill_vectorizer = TfidfVectorizer(token_pattern=r"[^\s]+").fit(
+        [analyzer.job_text(job) for job in jobs] + [analyzer.portfolio_text(p) for p in portfolios]
+    )
+    trimmed_jobs, matrix, features = JobEmbeddingIndex._embed(analyzer, jobs)
+    return JobEmbeddingIndex(analyzer, matrix, trimmed_jobs, features, fingerprint=None)
+
+
+def ranked(analyzer, portfolio, limit):
+    return [(str(job['_id']), score) for job, score in analyzer.find_best_matching_jobs(portfolio, limit=limit)]
+
+
+def test_default_policy_scans_every_job(analyzer, index, portfolios):
+    """Without CANDIDATE_GENERATION the matches are those of a full scan"""
+    policy = CandidatePolicy.from_env()
+    assert not policy.enabled, "candidate generation must be opt-in"
+
+    results = {}
+    for name, candidate_policy in (('default', policy), ('full', CandidatePolicy(enabled=False))):
+        index.candidate_policy = candidate_policy
+        results[name] = [ranked(analyzer, portfolio, limit) for portfolio in portfolios for limit in LIMITS]
+    assert results['default'] == results['full'], "default matches differ from the full scan"
+
+
+def test_candidates_rank_like_full_scan(analyzer, index, portfolios):
+    """Candidate matches are the full scan's ranking restricted to the candidates"""
+    enabled = CandidatePolicy(enabled=True)
+    kept, expected = 0, 0
+    for portfolio in portfolios:
+        index.candidate_policy = enabled
+        _, rows, jobs, _, _ = index.candidate_snapshot(default_vocabulary().skill_ids(portfolio['skills']))
+        candidates = {str(jobs[row]['_id']) for row in rows}
+
+        index.candidate_policy = CandidatePolicy(enabled=False)
+        full_ranking = ranked(analyzer, portfolio, len(index))
+
+        index.candidate_policy = enabled
+        for limit in LIMITS:
+            found = ranked(analyzer, portfolio, limit)
+            assert found == [match for match in full_ranking if match[0] in candidates][:limit], \
+                "candidate matches are not the full ranking of the candidates"
+
+            top = {job_id for job_id, _ in full_ranking[:limit]}
+            kept += len(top & {job_id for job_id, _ in found})
+            expected += len(top)
+
+    print(f"   candidates kept {kept / expected:.1%} of the full scan's top matches ({kept}/{expected})")
+
+
+def main():
+    """Main entry point for the test script"""
+    parser = argparse.ArgumentParser(description="Compare candidate generation with a full scan")
+    parser.add_argument("--jobs", type=int, default=2000, help="Job posts in the catalog (default: 2000)")
+    parser.add_argument("--portfolios", type=int, default=30, help="Portfolios ranked (default: 30)")
+    args = parser.parse_args()
+
+    analyzer = recommendation_service.analyzer
+    portfolios, jobs = make_corpus(args.jobs, args.portfolios)
+    saved_vectorizer, saved_index = analyzer.skill_vectorizer, analyzer.job_index
+    analyzer.job_index = index = build_index(analyzer, portfolios, jobs)
+    tests = [
+        test_default_policy_scans_every_job,
+        test_candidates_rank_like_full_scan
+    ]
+
+    failures = 0
+    try:
+        for test in tests:
+            try:
+                test(analyzer, index, portfolios)
+                print(f"✅ {test.__name__}")
+            except Exception as e:
+                failures += 1
+                print(f"❌ {test.__name__}: {type(e).__name__}: {str(e)}")
+    finally:
+        analyzer.skill_vectorizer, analyzer.job_index = saved_vectorizer, saved_index
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
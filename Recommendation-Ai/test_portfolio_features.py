@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Test script for the portfolio feature store
+
+Checks that the features of a portfolio are shared by every route that scores
+it: /api/better-matches reads portfolios with PORTFOLIO_MATCH_PROJECTION and
+/api/recommendation with RECOMMENDATION_PORTFOLIO_PROJECTION, and alternating
+the two must hit the same entry. An edit to a feature field is still a miss.
+
+Usage:
+    python test_portfolio_features.py
+"""
+
+import os
+import sys
+from datetime import datetime
+from bson import ObjectId
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.recommendation_data import PORTFOLIO_MATCH_PROJECTION, RECOMMENDATION_PORTFOLIO_PROJECTION
+from app.utils.portfolio_features import PortfolioFeatureStore, PORTFOLIO_FEATURE_FIELDS
+
+
+def stored_portfolio():
+    """Portfolio document as the back-end stores it"""
+    return {
+        '_id': ObjectId(),
+        'userId': ObjectId(),
+        'skills': ['Python', 'Docker'],
+        'experience': [{'position': 'Developer', 'years': 3}],
+        'education': [{'degree': 'Bachelor', 'fieldOfStudy': 'Computer Science'}],
+        'languages': [{'name': 'French', 'level': 'Fluent'}],
+        'projects': [{'title': 'API', 'technologies': ['Flask']}],
+        'certificates': [{'name': 'AWS'}],
+        'phone': '000',
+        'updatedAt': datetime(2026, 1, 1),
+        '__v': 0
+    }
+
+
+def projected(document, projection):
+    """The document as find_one returns it with a projection"""
+    return {field: value for field, value in document.items() if field == '_id' or projection.get(field)}
+
+
+def test_projections_read_feature_fields():
+    """Both portfolio projections read every field the features come from"""
+    for projection in (PORTFOLIO_MATCH_PROJECTION, RECOMMENDATION_PORTFOLIO_PROJECTION):
+        missing = [field for field in PORTFOLIO_FEATURE_FIELDS if not projection.get(field)]
+        assert not missing, f"projection does not read {missing}"
+
+
+def test_routes_share_entries():
+    """Alternating the better-matches and recommendation shapes of a portfolio hits one entry"""
+    store = PortfolioFeatureStore()
+    document = stored_portfolio()
+    for _ in range(5):
+        match_features = store.get(projected(document, PORTFOLIO_MATCH_PROJECTION))
+        recommendation_features = store.get(projected(document, RECOMMENDATION_PORTFOLIO_PROJECTION))
+        assert match_features is recommendation_features
+
+    stats = store.stats()
+    assert stats['misses'] == 1 and stats['hits'] == 9, stats
+    assert recommendation_features['languages'], "language levels missing from the shared entry"
+
+
+def test_edit_is_a_miss():
+    """A change to a feature field is recomputed, a change to another field is not"""
+    store = PortfolioFeatureStore()
+    document = stored_portfolio()
+    store.get(projected(document, RECOMMENDATION_PORTFOLIO_PROJECTION))
+
+    document['certificates'].append({'name': 'GCP'})
+    document['updatedAt'] = datetime(2026, 2, 1)
+    store.get(projected(document, RECOMMENDATION_PORTFOLIO_PROJECTION))
+    assert store.stats()['misses'] == 1
+
+    document['skills'].append('Kubernetes')
+    store.get(projected(document, PORTFOLIO_MATCH_PROJECTION))
+    assert store.stats()['misses'] == 2
+
+
+def main():
+    """Main entry point for the test script"""
+    tests = [
+        test_projections_read_feature_fields,
+        test_routes_share_entries,
+        test_edit_is_a_miss
+    ]
+
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"❌ {test.__name__}: {type(e).__name__}: {str(e)}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+Test script for the recommendation data loader
+
+Checks that the 'aggregate', 'concurrent' and 'sequential' load modes return
+identical bundles for single recommendations and for batches, and that the
+concurrent mode counts its queries in the caller's track_mongo() block.
+
+The modes are compared on the MongoDB server at MONGO_URI when one is
+reachable. Otherwise they run on mongomock (pip install mongomock), which
+cannot run the $lookup pipelines of the aggregate mode: only 'concurrent' and
+'sequential' are compared and the aggregate mode is reported as skipped. With
+neither a server nor mongomock, the tests are skipped.
+
+Usage:
+    python test_recommendation_data.py
+"""
+
+import os
+import sys
+import uuid
+from types import SimpleNamespace
+from bson import ObjectId
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.recommendation_data import RecommendationDataLoader
+from app.utils.company_cache import CompanyCache
+from app.utils.mongo_stats import track_mongo, command_stats_listener
+
+
+def connect():
+    """
+    Return (database, drop, modes) for the MongoDB server at MONGO_URI, or for
+    mongomock when no server is reachable, or None when mongomock is not
+    installed either
+    """
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    mongo_uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=2000, event_listeners=[command_stats_listener])
+    try:
+        client.admin.command('ping')
+        name = f"test_recommendation_data_{uuid.uuid4().hex[:8]}"
+        return client[name], lambda: client.drop_database(name), ('aggregate', 'concurrent', 'sequential')
+    except PyMongoError:
+        client.close()
+
+    try:
+        import mongomock
+    except ImportError:
+        print(f"No MongoDB server at {mongo_uri} and mongomock is not installed: tests skipped")
+        return None
+    print(f"No MongoDB server at {mongo_uri}: using mongomock, aggregate mode skipped")
+    return mongomock.MongoClient().db, lambda: None, ('concurrent', 'sequential')
+
+
+def seed(db):
+    """Insert users, portfolios, companies and job posts covering the missing-document cases"""
+    companies = [{'_id': ObjectId(), 'name': f"Company {i}", 'industry': 'Software'} for i in range(3)]
+    db.companies.insert_many(companies)
+
+    jobs = []
+    for i in range(12):
+        job = {
+            '_id': ObjectId(),
+            'title': f"Job {i}",
+            'description': 'Build and run web services',
+            'requirements': ['Python', 'MongoDB', 'Docker'][:1 + i % 3],
+            'yearsOfExperienceRequired': i % 5,
+            'requiredEducationLevel': 'Bachelor',
+            'salaryRange': f"{1000 + i}-{2000 + i} TND",
+            'applications': [ObjectId()]
+        }
+        if i % 4 == 1:
+            job['companyId'] = ObjectId()  # Company that does not exist
+        elif i % 4 != 3:
+            job['companyId'] = companies[i % 3]['_id']
+        jobs.append(job)
+    db.jobposts.insert_many(jobs)
+
+    users = [
+        {'_id': ObjectId(), 'firstName': 'Amel', 'lastName': 'B', 'subscription': 'Golden', 'password': 'x'},
+        {'_id': ObjectId(), 'firstName': 'Sami', 'lastName': 'K', 'subscription': 'Free'}
+    ]
+    db.users.insert_many(users)
+    # Only the first user has a portfolio
+    db.portfolios.insert_one({
+        '_id': ObjectId(),
+        'userId': users[0]['_id'],
+        'skills': ['Python', 'Docker'],
+        'experience': [{'title': 'Developer'}],
+        'education': [],
+        'languages': [{'name': 'French', 'level': 'Fluent'}],
+        'projects': [],
+        'certificates': [],
+        'phone': '000'
+    })
+
+    return [user['_id'] for user in users] + [ObjectId()], [job['_id'] for job in jobs] + [ObjectId()]
+
+
+def loader_for(db, mode):
+    loader = RecommendationDataLoader(db, CompanyCache(db), mode=mode)
+    assert loader.mode == mode, f"{mode} mode fell back to {loader.mode}"
+    return loader
+
+
+def test_load_modes_match(db, modes, user_ids, job_ids):
+    """load() returns the same bundle in every mode"""
+    loaders = {mode: loader_for(db, mode) for mode in modes}
+    for user_id in user_ids:
+        for job_id in job_ids:
+            bundles = {mode: loader.load(user_id, job_id) for mode, loader in loaders.items()}
+            reference = bundles['sequential']
+            for mode, bundle in bundles.items():
+                assert bundle == reference, f"{mode} bundle differs for user {user_id}, job {job_id}"
+
+
+def test_load_batch_modes_match(db, modes, user_ids, job_ids):
+    """load_batch() returns the same user, portfolio, jobs and companies in every mode"""
+    loaders = {mode: loader_for(db, mode) for mode in modes}
+    for user_id in user_ids:
+        for batch in (job_ids, job_ids[:3], []):
+            bundles = {mode: loader.load_batch(user_id, batch) for mode, loader in loaders.items()}
+            reference = bundles['sequential']
+            for mode, bundle in bundles.items():
+                assert bundle == reference, f"{mode} batch differs for user {user_id}, {len(batch)} jobs"
+
+
+def test_concurrent_mode_tracks_queries(db, modes, user_ids, job_ids):
+    """Queries run on the executor threads are counted in the caller's track_mongo() block"""
+    # mongomock does not call command listeners: report each query as pymongo would
+    if 'aggregate' not in modes:
+        for name in ('users', 'jobposts', 'portfolios', 'companies'):
+            setattr(db, name, ListenedCollection(db[name]))
+
+    counts = {}
+    for mode in ('concurrent', 'sequential'):
+        loader = loader_for(db, mode)
+        with track_mongo() as single:
+            loader.load(user_ids[0], job_ids[0])
+        with track_mongo() as batch:
+            loader.load_batch(user_ids[0], job_ids)
+        counts[mode] = (single['round_trips'], batch['round_trips'])
+
+    assert counts['concurrent'][0] > 0, "no query counted in concurrent mode"
+    assert counts['concurrent'] == counts['sequential'], counts
+
+
+class ListenedCollection:
+    """Collection wrapper calling the command listener on the thread that runs each query"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find_one(self, *args, **kwargs):
+        command_stats_listener.started(SimpleNamespace(command={'find': self._collection.name}))
+        return self._collection.find_one(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        command_stats_listener.started(SimpleNamespace(command={'find': self._collection.name}))
+        return self._collection.find(*args, **kwargs)
+
+
+def main():
+    """Main entry point for the test script"""
+    connection = connect()
+    if connection is None:
+        return 0
+    db, drop, modes = connection
+    tests = [
+        test_load_modes_match,
+        test_load_batch_modes_match,
+        test_concurrent_mode_tracks_queries
+    ]
+
+    failures = 0
+    try:
+        user_ids, job_ids = seed(db)
+        for test in tests:
+            try:
+                test(db, modes, user_ids, job_ids)
+                print(f"✅ {test.__name__}")
+            except Exception as e:
+                failures += 1
+                print(f"❌ {test.__name__}: {type(e).__name__}: {str(e)}")
+    finally:
+        drop()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Test script for the canonical skill vocabulary
+
+Checks alias resolution, phrase splitting on word boundaries, and that phrases
+looked up before a skill is added are split again once it is known, so skill
+matching does not depend on the lookups a worker happened to make before.
+
+Usage:
+    python test_skill_vocabulary.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.skill_vocabulary import SkillVocabulary
+
+
+def test_aliases_and_word_boundaries():
+    """Aliases resolve to their skill and phrases only match whole words"""
+    vocabulary = SkillVocabulary(['javascript', 'java', 'react'])
+    assert vocabulary.ids_of('ReactJS') == vocabulary.ids_of('react')
+    assert vocabulary.ids_of('js') == vocabulary.ids_of('javascript')
+    assert vocabulary.ids_of('javascript and react') == [vocabulary.id_of('javascript'), vocabulary.id_of('react')]
+    assert vocabulary.ids_of('java developer') == [vocabulary.id_of('java')]
+
+
+def test_lookups_do_not_add_by_default():
+    """Only add=True gives unknown names an id"""
+    vocabulary = SkillVocabulary(['python'])
+    assert vocabulary.ids_of('docker') == []
+    assert len(vocabulary) == 1
+    assert vocabulary.unknown_names(['docker', 'python']) == ['docker']
+    assert vocabulary.ids_of('docker', add=True) == [1]
+
+
+def test_phrase_split_after_skill_added():
+    """A phrase looked up before one of its skills was added mentions it afterwards"""
+    vocabulary = SkillVocabulary(['python'])
+    assert vocabulary.ids_of('python and docker') == [0]
+    vocabulary.ids_of('docker', add=True)
+    assert vocabulary.ids_of('python and docker') == [0, 1]
+
+
+def test_unknown_phrase_split_after_skill_added():
+    """A phrase first found to mention no skill is split, not added whole, once its skills are known"""
+    vocabulary = SkillVocabulary(['python'])
+    assert vocabulary.ids_of('docker and kubernetes') == []
+    vocabulary.skill_ids(['docker', 'kubernetes'], add=True)
+    assert vocabulary.ids_of('docker and kubernetes', add=True) == [1, 2]
+    assert 'docker and kubernetes' not in vocabulary.skills
+    assert len(vocabulary) == 3
+
+
+def main():
+    """Main entry point for the test script"""
+    tests = [
+        test_aliases_and_word_boundaries,
+        test_lookups_do_not_add_by_default,
+        test_phrase_split_after_skill_added,
+        test_unknown_phrase_split_after_skill_added
+    ]
+
+    failures = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"❌ {test.__name__}: {type(e).__name__}: {str(e)}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
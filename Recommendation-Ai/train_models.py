@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+TuniHire AI Model Training
+
+Offline training commands for the recommendation models. They read the whole
+corpus from MongoDB, so run them outside the API process (deploy hook, cron).
+
+Usage:
+    python train_models.py vectorizer [--batch-size N] [--skip-index]
+    python train_models.py predictor [--chunk-size N]
+    python train_models.py versions
+    python train_models.py activate VERSION
+    python train_models.py skills
+
+Commands:
+    vectorizer   Fit the TF-IDF skill vectorizer on all job posts and portfolios,
+                 publish it as a new model version and rebuild the job index with it
+    predictor    Retrain the success predictor on the full application history
+                 and publish it as a new model version
+    versions     List the model versions in the registry
+    activate     Make a model version current (roll forward or back); running
+                 API workers reload it in the background
+    skills       Add the skills of all job posts and portfolios to the canonical
+                 skill vocabulary; existing skill ids are kept
+"""
+
+import sys
+import argparse
+from dotenv import load_dotenv
+
+# Load environment variables from .env file for local dev
+load_dotenv()
+
+from app.utils.db_connection import get_db_connection
+from app.utils.portfolio_analyzer import PortfolioAnalyzer
+from app.utils.job_index import JobEmbeddingIndex
+from app.utils.model_registry import ModelRegistry
+from app.utils.model_training import train_vectorizer, train_predictor
+from app.utils.skill_vocabulary import SkillVocabulary
+
+
+def run_vectorizer_training(args):
+    """Fit the skill vectorizer on the full corpus"""
+    db = get_db_connection()
+    analyzer = PortfolioAnalyzer()
+    
+    try:
+        stamp = train_vectorizer(db, analyzer, batch_size=args.batch_size)
+    except ValueError as e:
+        # Raised by scikit-learn when the corpus is empty
+        print(f"Vectorizer training failed: {str(e)}")
+        return 1
+    
+    print(f"Trained skill vectorizer version {stamp['version']} (model version {analyzer.model_version})")
+    print(f"  Documents: {stamp['documents']}")
+    print(f"  Vocabulary size: {stamp['vocabulary_size']}")
+    print(f"  Training time: {stamp['training_seconds']}s")
+    
+    # The job index must be rebuilt with the new vocabulary
+    if not args.skip_index:
+        job_index = JobEmbeddingIndex.build(db, analyzer)
+        path = JobEmbeddingIndex.default_path(analyzer)
+        # Same lock as the API workers refreshing or rebuilding the index
+        with JobEmbeddingIndex.locked(path):
+            job_index.save(path)
+    
+    return 0
+
+
+def run_predictor_training(args):
+    """Retrain the success predictor on all recorded applications"""
+    db = get_db_connection()
+    analyzer = PortfolioAnalyzer()
+    
+    if not train_predictor(db, analyzer, chunk_size=args.chunk_size):
+        print("Not enough matched applications to train the success predictor")
+        return 1
+    
+    stats = analyzer.last_training_stats
+    print(f"Trained success predictor on {stats['rows']} rows "
+          f"({stats['applications']} applications, {stats['rows_per_second']} rows/s)")
+    print(f"Published model version {analyzer.model_version}")
+    return 0
+
+
+def run_list_versions(args):
+    """List the published model versions"""
+    registry = ModelRegistry.from_env(PortfolioAnalyzer.MODEL_PATH)
+    current = registry.current_version()
+    
+    manifests = registry.list_versions()
+    if not manifests:
+        print("No model versions published yet")
+        return 0
+    
+    for manifest in manifests:
+        marker = '*' if manifest['version'] == current else ' '
+        metadata = manifest.get('metadata', {})
+        print(f"{marker} {manifest['version']}  {manifest['created_at']}  "
+              f"vectorizer {metadata.get('vectorizer', {}).get('version')}  "
+              f"predictor {metadata.get('predictor', {}).get('source')}  "
+              f"({metadata.get('reason')})")
+    return 0
+
+
+def run_activate_version(args):
+    """Point the registry at another model version"""
+    registry = ModelRegistry.from_env(PortfolioAnalyzer.MODEL_PATH)
+    try:
+        registry.activate(args.version)
+    except (OSError, ValueError) as e:
+        print(f"Cannot activate model version {args.version}: {str(e)}")
+        return 1
+    
+    print(f"Activated model version {args.version}")
+    return 0
+
+
+def run_skill_vocabulary_build(args):
+    """Extend the saved skill vocabulary with the skills found in the database"""
+    db = get_db_connection()
+    path = SkillVocabulary.default_path(PortfolioAnalyzer.MODEL_PATH)
+    
+    vocabulary = SkillVocabulary.load_or_build(None, path)
+    known = len(vocabulary)
+    SkillVocabulary.build(db, base=vocabulary).save(path)
+    
+    print(f"Skill vocabulary: {len(vocabulary)} skills ({len(vocabulary) - known} new) in {path}")
+    print("Restart the API workers to use the new skill ids")
+    return 0
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(description="Train TuniHire AI recommendation models")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    vectorizer_parser = subparsers.add_parser("vectorizer", help="Fit the TF-IDF skill vectorizer on the full corpus")
+    vectorizer_parser.add_argument("--batch-size", type=int, default=1000, help="Documents fetched per Mongo round trip (default: 1000)")
+    vectorizer_parser.add_argument("--skip-index", action="store_true", help="Do not rebuild the job index")
+    vectorizer_parser.set_defaults(handler=run_vectorizer_training)
+    
+    predictor_parser = subparsers.add_parser("predictor", help="Retrain the success predictor on the application history")
+    predictor_parser.add_argument("--chunk-size", type=int, default=10000, help="Applications processed per chunk (default: 10000)")
+    predictor_parser.set_defaults(handler=run_predictor_training)
+    
+    versions_parser = subparsers.add_parser("versions", help="List the model versions in the registry")
+    versions_parser.set_defaults(handler=run_list_versions)
+    
+    activate_parser = subparsers.add_parser("activate", help="Make a model version current")
+    activate_parser.add_argument("version", help="Version to activate, as listed by the versions command")
+    activate_parser.set_defaults(handler=run_activate_version)
+    
+    skills_parser = subparsers.add_parser("skills", help="Extend the canonical skill vocabulary from the database")
+    skills_parser.set_defaults(handler=run_skill_vocabulary_build)
+    
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())